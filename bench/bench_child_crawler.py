@@ -0,0 +1,43 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from child_crawler import AsyncChildCrawler
+from stub_server import start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure AsyncChildCrawler against the local stub server.")
+    parser.add_argument('--pages', type=int, default=400)
+    parser.add_argument('--rate', type=float, default=100.0)
+    parser.add_argument('--burst', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.5, help="server response time in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with 429")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    server, base_url = start_server(latency=args.latency, error_rate=args.error_rate)
+    crawler = AsyncChildCrawler(rate=args.rate, burst=args.burst, concurrency=args.concurrency, backoff=0.05)
+    urls = [f"{base_url}/child/{i}" for i in range(args.pages)]
+
+    start = time.perf_counter()
+    pages = crawler.run(urls)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    ok = sum(isinstance(page, str) for page in pages.values())
+    # With enough concurrency the run is bound by the rate limit: burst pages
+    # go out at once, the rest at `rate` per second.
+    floor = max(args.pages - args.burst, 0) / args.rate
+    print(f"{ok}/{args.pages} pages in {elapsed:.2f}s "
+          f"({crawler.stats['requests'] / elapsed:.1f} req/s, limit {args.rate}/s, "
+          f"rate-limited floor {floor:.2f}s + {args.latency}s latency), {crawler.stats['retries']} retries")
+
+
+if __name__ == "__main__":
+    main()
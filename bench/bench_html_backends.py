@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_backends import BACKENDS, extract_products, get_backend
+from state_store import content_hash
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+REFERENCE = 'html.parser'
+
+PRODUCT_TEMPLATE = ('<div class="product-list-item" data-track-click=\'{{"products":[{{"id":"{id}","brand":"B"}}]}}\'>'
+                    '<a class="{title_class}" href="/p{id}"><h3>Product {id}</h3></a>{price}</div>')
+# Markup the backends used to extract differently. The first two must come out identical;
+# the last is repaired differently by each parser, so only its state hash has to match.
+EDGE_CASES = {
+    "comment": PRODUCT_TEMPLATE.format(id=1, title_class='product-title', price=(
+        '<div class="kor-product-sale-price"><!-- c --><span class="kor-product-sale-price-value">1,25</span></div>')),
+    "class_case": PRODUCT_TEMPLATE.format(id=2, title_class='Product-Title', price=(
+        '<div class="kor-product-sale-price">1,25</div>')),
+}
+REPAIRED_CASES = {
+    "unclosed_p": PRODUCT_TEMPLATE.format(id=3, title_class='product-title', price=(
+        '<div class="kor-product-sale-price"><p>1<p>2</div>')),
+}
+
+
+def available_backends():
+    backends = []
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+            backends.append(name)
+        except ImportError:
+            print(f"{name}: not installed, skipped")
+    return backends
+
+
+def check_equivalence(pages, backends):
+    mismatches = []
+    for label, html in pages:
+        expected = extract_products(html, REFERENCE)
+        for backend in backends:
+            actual = extract_products(html, backend)
+            if actual != expected:
+                mismatches.append((label, backend, expected, actual))
+    return mismatches
+
+
+def check_state_hashes(pages, backends):
+    """Products must hash the same in the state store whichever backend extracted them."""
+    mismatches = []
+    for label, html in pages:
+        expected = [content_hash(product.to_dict()) for product in extract_products(html, REFERENCE)]
+        for backend in backends:
+            if [content_hash(product.to_dict()) for product in extract_products(html, backend)] != expected:
+                mismatches.append((label, backend))
+    return mismatches
+
+
+def time_backend(backend, html, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        extract_products(html, backend)
+    return (time.perf_counter() - start) / rounds
+
+
+def main(rounds=20):
+    pages = []
+    for name in ('offers_page', 'child_page'):
+        with open(os.path.join(FIXTURES, f"{name}.html"), encoding='utf-8') as f:
+            pages.append((name, f.read()))
+    offers_page = pages[0][1]
+    pages.extend(EDGE_CASES.items())
+
+    backends = available_backends()
+    mismatches = check_equivalence(pages, backends)
+    for label, backend, expected, actual in mismatches:
+        print(f"MISMATCH {backend} on {label}:")
+        for exp, act in zip(expected, actual):
+            for key in exp.FIELDS:
+                if getattr(exp, key) != getattr(act, key):
+                    print(f"  {exp.id} {key}: {REFERENCE}={getattr(exp, key)!r} {backend}={getattr(act, key)!r}")
+        if len(expected) != len(actual):
+            print(f"  {len(expected)} products from {REFERENCE}, {len(actual)} from {backend}")
+    print(f"{len(backends)} backends checked against {REFERENCE}, {len(mismatches)} mismatches")
+    hash_mismatches = check_state_hashes(pages + list(REPAIRED_CASES.items()), backends)
+    for label, backend in hash_mismatches:
+        print(f"STATE HASH MISMATCH {backend} on {label}")
+    print(f"State hashes checked on {len(pages) + len(REPAIRED_CASES)} pages, {len(hash_mismatches)} mismatches")
+
+    products = len(extract_products(offers_page, REFERENCE))
+    reference_time = time_backend(REFERENCE, offers_page, rounds)
+    for backend in backends:
+        elapsed = reference_time if backend == REFERENCE else time_backend(backend, offers_page, rounds)
+        print(f"{backend}: {elapsed * 1e3:.2f} ms/page, {elapsed / products * 1e6:.0f} us/product "
+              f"({reference_time / elapsed:.1f}x vs {REFERENCE})")
+    return 1 if mismatches or hash_mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
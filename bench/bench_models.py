@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_backends import extract_products
+from models import Product, RawProduct, to_json
+from scraper import CONFIG, DataNormalizer
+from writers import get_encoder
+
+# Memory and serialization cost of the normalized catalog as Product records
+# versus the plain dicts used before, for a catalog where every parent carries
+# the products of its child page.
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+TIMEFRAME_INFO = {"start_date": "2026-10-12", "end_date": "2026-10-18"}
+
+
+def load_raw(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return [product.to_dict() for product in extract_products(f.read(), 'html.parser')]
+
+
+def build_catalog(parents, children, copies, as_dicts):
+    """Builds ``copies`` copies of the parents, each with its own normalized copy of the children."""
+    normalizer = DataNormalizer(CONFIG['base_url'])
+    catalog = []
+    for copy in range(copies):
+        # Fresh strings per copy, like records decoded from separate pages.
+        raw_parents = [RawProduct.from_dict(json.loads(json.dumps(dict(raw, id=f"{raw['id']}-{copy}")))) for raw in parents]
+        for parent in normalizer.process(raw_parents, TIMEFRAME_INFO):
+            raw_children = [RawProduct.from_dict(json.loads(json.dumps(raw))) for raw in children]
+            parent.child_products = normalizer.process(raw_children, TIMEFRAME_INFO)
+            catalog.append(parent.to_dict() if as_dicts else parent)
+    return catalog
+
+
+def measure_memory(parents, children, copies, as_dicts):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    catalog = build_catalog(parents, children, copies, as_dicts)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return catalog, size
+
+
+def time_encode(catalog, rounds):
+    encode = get_encoder('auto')
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for record in catalog:
+            encode(record)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Product records with plain dicts.")
+    parser.add_argument('--copies', type=int, default=20, help="copies of the offers fixture in the catalog")
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    parents = load_raw('offers_page.html')
+    children = load_raw('child_page.html')
+    dicts, dict_bytes = measure_memory(parents, children, args.copies, as_dicts=True)
+    products, product_bytes = measure_memory(parents, children, args.copies, as_dicts=False)
+    records = sum(1 + len(record['child_products']) for record in dicts)
+
+    if [product.to_dict() for product in products] != dicts:
+        print("MISMATCH: Product.to_dict() differs from the dict records")
+        return 1
+    encoded = [json.loads(get_encoder('auto')(product)) for product in products]
+    if encoded != json.loads(json.dumps(dicts, default=to_json)):
+        print("MISMATCH: encoded Product records differ from the encoded dicts")
+        return 1
+
+    print(f"{records} records ({len(dicts)} parents with {len(children)} children each)")
+    print(f"dicts:    {dict_bytes / 1e6:7.2f} MB, {dict_bytes / records:6.0f} B/record")
+    print(f"Product:  {product_bytes / 1e6:7.2f} MB, {product_bytes / records:6.0f} B/record "
+          f"({1 - product_bytes / dict_bytes:.0%} less)")
+    dict_time = time_encode(dicts, args.rounds)
+    product_time = time_encode(products, args.rounds)
+    print(f"encode dicts:   {dict_time / len(dicts) * 1e6:6.1f} us/parent")
+    print(f"encode Product: {product_time / len(products) * 1e6:6.1f} us/parent")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_parser import parse_price, parse_price_soup, _parse_price_fast, _NeedsSoup
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'price_fragments.json')
+
+
+def check_equivalence(fragments):
+    mismatches = []
+    for fragment in fragments:
+        fast, soup = parse_price(fragment), parse_price_soup(fragment)
+        if fast != soup:
+            mismatches.append((fragment, fast, soup))
+    return mismatches
+
+
+def handled_without_soup(fragment):
+    try:
+        _parse_price_fast(fragment)
+        return True
+    except _NeedsSoup:
+        return False
+
+
+def time_parser(parser, fragments, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for fragment in fragments:
+            parser(fragment)
+    return (time.perf_counter() - start) / (rounds * len(fragments))
+
+
+def main(rounds=200):
+    with open(FIXTURE, encoding='utf-8') as f:
+        fragments = json.load(f)
+
+    mismatches = check_equivalence(fragments)
+    for fragment, fast, soup in mismatches:
+        print(f"MISMATCH {fragment!r}: fast={fast!r} soup={soup!r}")
+    print(f"{len(fragments) - len(mismatches)}/{len(fragments)} fragments equivalent")
+
+    fast_path = [fragment for fragment in fragments if handled_without_soup(fragment)]
+    print(f"{len(fast_path)}/{len(fragments)} fragments parsed without BeautifulSoup")
+
+    # A product has a price_now and a price_was fragment.
+    for label, sample in (("known markup", fast_path), ("all fixtures", fragments)):
+        soup_time = time_parser(parse_price_soup, sample, rounds)
+        fast_time = time_parser(parse_price, sample, rounds)
+        print(f"{label}: soup {soup_time * 2e6:.1f} us/product, "
+              f"fast {fast_time * 2e6:.1f} us/product ({soup_time / fast_time:.1f}x faster)")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
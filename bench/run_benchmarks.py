@@ -0,0 +1,565 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+import capture
+from bs4 import BeautifulSoup
+from capture import CaptureStore
+from child_crawler import AsyncChildCrawler
+from html_backends import BACKENDS, extract_products, get_backend
+from models import RawProduct, to_json
+from offers_store import OfferStore
+from pipeline import ParsePipeline, parse_child_html
+from replay import replay_run
+from functools import partial
+from scraper import (CONFIG, DataNormalizer, HoogvlietHttpScraper, build_http_client, discover_shards,
+                     crawl_children, extract_product_info_from_soup, offers_files, process_timeframe, read_ndjson, save_raw,
+                     scrape_and_process_worker, scrape_run, scrape_shard, shards_cover_range)
+from scraper import main as scraper_main
+from sharding import ShardScheduler
+from state_store import ProductStateStore
+from stub_server import OFFERS_PATH, PROMOTION_PATH, PROMOTION_RANGES, start_server, timeframe_url
+from writers import NdjsonWriter, finalize_pretty_json, get_encoder
+
+# Runs the micro and end-to-end benchmarks offline against the recorded
+# fixtures and the stub server, and stores the results as JSON in
+# bench/results so runs from different commits can be compared.
+
+FIXTURES = os.path.join(BENCH_DIR, 'fixtures')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+TIMEFRAME_INFO = {"start_date": "2026-10-12", "end_date": "2026-10-18"}
+
+
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def measure(fn: Callable[[], object], items: int, rounds: int, unit: str = 'item') -> Dict:
+    """Median time of ``rounds`` calls, in microseconds per item (lower is better)."""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {"value": median / items * 1e6, "unit": f"us/{unit}", "items": items, "rounds": rounds,
+            "min_us": min(timings) / items * 1e6}
+
+
+def raw_catalog(copies: int) -> List[RawProduct]:
+    """The offers fixture repeated with fresh ids, so texts and prices repeat like in a real catalog."""
+    products = extract_products(load_fixture('offers_page.html'), 'html.parser')
+    catalog = []
+    for copy in range(copies):
+        for product in products:
+            catalog.append(RawProduct.from_dict(dict(product.to_dict(), id=f"{product.id}-{copy}")))
+    return catalog
+
+
+def bench_extraction(args) -> Dict[str, Dict]:
+    html = load_fixture('offers_page.html')
+    elements = BeautifulSoup(html, 'html.parser').select('.product-list-item')
+    results = {
+        "extract.soup_per_product": measure(
+            lambda: [extract_product_info_from_soup(elem) for elem in elements], len(elements), args.rounds, 'product'),
+    }
+    for backend in BACKENDS:
+        try:
+            get_backend(backend)
+        except ImportError:
+            continue
+        results[f"extract.page.{backend}"] = measure(
+            lambda: extract_products(html, backend), len(elements), args.rounds, 'product')
+    return results
+
+
+def normalize_prices(normalizer: DataNormalizer, fragments: List[str]) -> List[Optional[str]]:
+    return [normalizer._normalize_price(fragment) for fragment in fragments]
+
+
+def bench_normalizer(args) -> Dict[str, Dict]:
+    catalog = raw_catalog(args.catalog_copies)
+    fragments = json.loads(load_fixture('price_fragments.json'))
+    warm = DataNormalizer(CONFIG['base_url'])
+    normalize_prices(warm, fragments)
+    return {
+        "normalize.process": measure(
+            lambda: DataNormalizer(CONFIG['base_url']).process(catalog, TIMEFRAME_INFO), len(catalog), args.rounds, 'product'),
+        "normalize.price_cold": measure(
+            lambda: normalize_prices(DataNormalizer(CONFIG['base_url']), fragments), len(fragments), args.rounds, 'fragment'),
+        "normalize.price_warm": measure(
+            lambda: normalize_prices(warm, fragments), len(fragments), args.rounds, 'fragment'),
+    }
+
+
+def bench_output(args) -> Dict[str, Dict]:
+    records = DataNormalizer(CONFIG['base_url']).process(raw_catalog(args.catalog_copies), TIMEFRAME_INFO)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        def dump_json():
+            with open(os.path.join(tmp, 'offers.json'), 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=2, default=to_json)
+
+        def write_ndjson(backend, compression):
+            with NdjsonWriter(os.path.join(tmp, 'offers.ndjson'), compression=compression, backend=backend) as writer:
+                writer.write_many(records)
+            return writer.path
+
+        results["output.json_dump"] = measure(dump_json, len(records), args.rounds, 'record')
+        backends = ['json']
+        try:
+            get_encoder('orjson')
+            backends.append('orjson')
+        except ImportError:
+            pass
+        for backend in backends:
+            for compression in (None, 'gzip'):
+                name = f"output.ndjson.{backend}" + (f".{compression}" if compression else '')
+                results[name] = measure(lambda: write_ndjson(backend, compression), len(records), args.rounds, 'record')
+        ndjson_path = write_ndjson('auto', None)
+        results["output.pretty_from_ndjson"] = measure(
+            lambda: finalize_pretty_json(ndjson_path, os.path.join(tmp, 'pretty.json')), len(records), args.rounds, 'record')
+    return results
+
+
+def bench_http_engine(args) -> Dict[str, Dict]:
+    """Both timeframes through scrape_and_process_worker with the http engine."""
+    server, base_url = start_server(latency=args.latency, products_per_range=args.products_per_range)
+    saved = dict(CONFIG)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            CONFIG.update(engine='http', promotion_page_url=base_url + PROMOTION_PATH, output_dir=tmp)
+            for number, promotion_range in enumerate(PROMOTION_RANGES):
+                key = f"range{number}"
+                info = dict(TIMEFRAME_INFO, url=timeframe_url(base_url, promotion_range))
+                timings = []
+                for _ in range(args.e2e_rounds):
+                    start = time.perf_counter()
+                    count, ndjson_path = scrape_and_process_worker(key, info)
+                    finalize_pretty_json(ndjson_path, os.path.join(tmp, f"{key}.json"))
+                    timings.append(time.perf_counter() - start)
+                results[f"e2e.http_engine.{key}"] = {
+                    "value": statistics.median(timings) / count * 1e6, "unit": "us/product", "items": count,
+                    "rounds": args.e2e_rounds, "seconds": statistics.median(timings),
+                }
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved)
+        server.shutdown()
+    return results
+
+
+def bench_sharding(args) -> Dict[str, Dict]:
+    """Plan, scrape and write both timeframes, split per category, with 1 and --shard-workers workers."""
+    server, base_url = start_server(latency=args.latency, products_per_range=args.products_per_range)
+    saved = dict(CONFIG)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp, build_http_client(64) as client:
+            CONFIG.update(engine='http', promotion_page_url=base_url + PROMOTION_PATH, output_dir=tmp,
+                          discovery='http', discovery_cache=None)
+            shards = discover_shards(timeframe_url(base_url, next(iter(PROMOTION_RANGES))), client=client)
+            for workers in sorted({1, args.shard_workers}):
+                timings = []
+                for _ in range(args.e2e_rounds):
+                    count = 0
+                    start = time.perf_counter()
+                    for timeframe, raw_data, _ in ShardScheduler(workers).run(shards, partial(scrape_shard, client=client)):
+                        shards_cover_range(timeframe, len(raw_data), client)
+                        count += process_timeframe(timeframe.key, timeframe.info, raw_data)[0]
+                    timings.append(time.perf_counter() - start)
+                results[f"e2e.sharded.workers{workers}"] = {
+                    "value": statistics.median(timings) / count * 1e6, "unit": "us/product", "items": count,
+                    "rounds": args.e2e_rounds, "seconds": statistics.median(timings), "shards": len(shards),
+                }
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved)
+        server.shutdown()
+    results["check.shard_coverage"] = check_shard_coverage(args)
+    return results
+
+
+def check_shard_coverage(args) -> Dict:
+    """A sharded run against a stub where some products are in no category must still write every product."""
+    server, base_url = start_server(products_per_range=args.products_per_range, uncategorized_every=7)
+    saved = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp, build_http_client(16) as client:
+            CONFIG.update(engine='http', promotion_page_url=base_url + PROMOTION_PATH, base_url=base_url + '/',
+                          initial_url=base_url + OFFERS_PATH + '?CategoryName=aanbiedingen', discovery='http',
+                          discovery_cache=None, incremental=False, output_pretty_json=False, output_dir=tmp,
+                          metrics_report=None, metrics_textfile=None)
+            start = time.perf_counter()
+            run = scrape_run(client=client)
+            seconds = time.perf_counter() - start
+            written = {key: sum(1 for _ in read_ndjson(path, CONFIG['output_compression'])) for key, path in offers_files().items()}
+            expected = {info['key']: len(HoogvlietHttpScraper(client=client).scrape_page(info['url']))
+                        for info in run['timeframes']}
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved)
+        server.shutdown()
+    missing = sum(expected[key] - written.get(key, 0) for key in expected)
+    result = {"value": seconds * 1e3, "unit": "ms/run", "items": sum(written.values()), "missing": missing}
+    if written != expected:
+        result['mismatch'] = f"wrote {written}, the unsharded listings have {expected}"
+    return result
+
+
+def bench_discovery(args) -> Dict[str, Dict]:
+    """Time to the shard plan over HTTP, without and with the on-disk discovery cache."""
+    server, base_url = start_server(latency=args.latency)
+    saved = dict(CONFIG)
+    initial_url = base_url + OFFERS_PATH + '?CategoryName=aanbiedingen'
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, 'discovery_cache.json')
+            CONFIG.update(discovery='http', discovery_cache=None)
+            results = {"discover.http": measure(lambda: discover_shards(initial_url), 1, args.e2e_rounds, 'run')}
+            CONFIG.update(discovery_cache=cache_path)
+            discover_shards(initial_url)
+            results["discover.cached"] = measure(lambda: discover_shards(initial_url), 1, args.rounds, 'run')
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved)
+        server.shutdown()
+    return results
+
+
+def bench_child_pages(args) -> Dict[str, Dict]:
+    """Child pages through the asyncio crawler and the parse pipeline."""
+    server, base_url = start_server(latency=args.latency)
+    urls = [f"{base_url}/child/{i}" for i in range(args.child_pages)]
+    timings = []
+    try:
+        for _ in range(args.e2e_rounds):
+            crawler = AsyncChildCrawler(rate=1000.0, burst=100, concurrency=50)
+            pipeline = ParsePipeline(parse_child_html, workers=os.cpu_count() or 2)
+            start = time.perf_counter()
+            pipeline.run(lambda emit: crawler.run(urls, on_page=emit))
+            timings.append(time.perf_counter() - start)
+    finally:
+        server.shutdown()
+    return {"e2e.child_pages": {
+        "value": statistics.median(timings) / len(urls) * 1e6, "unit": "us/page", "items": len(urls),
+        "rounds": args.e2e_rounds, "seconds": statistics.median(timings),
+    }, "check.child_rescrape": check_child_rescrape(args)}
+
+
+def check_child_rescrape(args) -> Dict:
+    """scrape, child-crawl, scrape, child-crawl: the second scrape keeps the children and the second crawl fetches nothing."""
+    child_hits = []
+    server, base_url = start_server(products_per_range=args.products_per_range, child_hits=child_hits)
+    saved = dict(CONFIG)
+    try:
+        with tempfile.TemporaryDirectory() as tmp, build_http_client(16) as client:
+            CONFIG.update(engine='http', promotion_page_url=base_url + PROMOTION_PATH, base_url=base_url + '/',
+                          initial_url=base_url + OFFERS_PATH + '?CategoryName=aanbiedingen', discovery_cache=None,
+                          incremental=True, state_db=os.path.join(tmp, 'state.sqlite3'), http_cache_path=None,
+                          child_rate=1000.0, child_burst=100, output_pretty_json=False, output_dir=tmp,
+                          metrics_report=None, metrics_textfile=None)
+
+            def children() -> int:
+                return sum(len(record['child_products']) for path in offers_files().values()
+                           for record in read_ndjson(path, CONFIG['output_compression']))
+
+            start = time.perf_counter()
+            rounds = []
+            for _ in range(2):
+                store = ProductStateStore(CONFIG['state_db'])
+                try:
+                    scrape_run(client=client, store=store)
+                finally:
+                    store.close()
+                kept = children()
+                del child_hits[:]
+                crawl_children()
+                rounds.append({"kept": kept, "fetched": len(child_hits), "children": children()})
+            seconds = time.perf_counter() - start
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved)
+        server.shutdown()
+    first, second = rounds
+    result = {"value": seconds * 1e3, "unit": "ms/run", "items": second['children'], "refetched": second['fetched']}
+    if second['kept'] != first['children'] or second['children'] != first['children'] or second['fetched']:
+        result['mismatch'] = (f"the first crawl added {first['children']} children; the rescrape kept {second['kept']}, "
+                              f"the second crawl fetched {second['fetched']} child pages and left {second['children']}")
+    return result
+
+
+def bench_replay(args) -> Dict[str, Dict]:
+    """A captured http-engine run replayed from disk, with one and with all CPUs extracting."""
+    server, base_url = start_server(latency=args.latency, products_per_range=args.products_per_range)
+    saved = dict(CONFIG)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            CONFIG.update(engine='http', promotion_page_url=base_url + PROMOTION_PATH, base_url=base_url + '/',
+                          initial_url=base_url + OFFERS_PATH + '?CategoryName=aanbiedingen', discovery_cache=None,
+                          incremental=False, output_dir=tmp, capture_dir=os.path.join(tmp, 'capture'),
+                          metrics_report=os.path.join(tmp, 'run_report.json'), metrics_textfile=os.path.join(tmp, 'scraper.prom'))
+            start = time.perf_counter()
+            with capture.session(CONFIG['capture_dir'], settings={"base_url": CONFIG['base_url']}):
+                scraper_main()
+            live = time.perf_counter() - start
+            count = sum(entry['count'] for entry in CaptureStore(CONFIG['capture_dir']).load_manifest()['timeframes'].values())
+            results["e2e.http_capture"] = {"value": live / count * 1e6, "unit": "us/product", "items": count,
+                                           "rounds": 1, "seconds": live}
+            CONFIG.update(output_dir=os.path.join(tmp, 'replay'))
+            for workers in sorted({1, os.cpu_count() or 1}):
+                results[f"replay.workers{workers}"] = measure(lambda: replay_run(workers=workers), count, args.e2e_rounds, 'product')
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved)
+        server.shutdown()
+    return results
+
+
+def bench_offers_store(args) -> Dict[str, Dict]:
+    """Loading the offers into the indexed store, and lookups there against scanning the pretty JSON."""
+    normalizer = DataNormalizer(CONFIG['base_url'])
+    records = normalizer.process(raw_catalog(args.catalog_copies), TIMEFRAME_INFO)
+    children = normalizer.process(raw_catalog(1), TIMEFRAME_INFO)
+    # Every fourth offer has a child page with three products, as the offers files have after child-crawl.
+    for number, record in enumerate(records[::4]):
+        record.child_products = children[number % 7:number % 7 + 3]
+    dicts = [record.to_dict() for record in records]
+    product_id = dicts[len(dicts) // 2]['id']
+    brand = next(record['brand'] for record in dicts if record['brand'])
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'current_offers.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(dicts, f, ensure_ascii=False, indent=2)
+
+        def scan(match):
+            with open(json_path, encoding='utf-8') as f:
+                return [record for record in json.load(f) if match(record)]
+
+        store = OfferStore(os.path.join(tmp, 'offers.sqlite3'))
+        try:
+            results["offers_store.load"] = measure(lambda: store.load('current', dicts), len(dicts), args.rounds, 'record')
+            lookups = {
+                "id": (lambda: store.get(product_id), lambda record: record['id'] == product_id),
+                "brand": (lambda: store.by_brand(brand), lambda record: record['brand'] == brand),
+                "discount30": (lambda: store.with_discount(30, limit=20), None),
+            }
+            for name, (query, match) in lookups.items():
+                results[f"offers_store.query.{name}"] = measure(query, 1, args.rounds * 20, 'query')
+                if match:
+                    results[f"offers_store.scan.{name}"] = measure(lambda: scan(match), 1, args.rounds, 'query')
+        finally:
+            store.close()
+    return results
+
+
+# Packages a command must not import: the CLI only loads the engines a command uses.
+HEAVY_PACKAGES = ('selenium', 'httpx', 'bs4', 'requests', 'lxml', 'selectolax')
+STARTUP_FORBIDDEN = {
+    "help": {'selenium', 'httpx', 'bs4', 'requests'},
+    "export": {'selenium', 'httpx', 'bs4', 'requests'},
+    "export_sqlite": {'selenium', 'httpx', 'bs4', 'requests'},
+    "query": {'selenium', 'httpx', 'bs4', 'requests'},
+    "normalize_from_raw": {'selenium', 'httpx', 'requests'},
+    "discover": {'selenium', 'requests'},
+    "scrape_http": {'selenium', 'requests'},
+}
+
+
+def interpreter_modules() -> Set[str]:
+    """Modules a bare interpreter imports at start-up (site, encodings, .pth hooks), left out of the import time."""
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'pass'], capture_output=True, text=True)
+    return {line.rsplit('|', 1)[1].strip() for line in process.stderr.splitlines() if line.startswith('import time:')}
+
+
+def run_cli(argv: List[str], preloaded: Set[str]) -> Dict:
+    """Runs cli.py under -X importtime; returns wall time, import time and the heavy packages it loaded."""
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', os.path.join(ROOT, 'cli.py')] + argv,
+                             cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if process.returncode:
+        raise RuntimeError(f"cli.py {' '.join(argv)} exited with {process.returncode}:\n{process.stderr[-2000:]}")
+    import_us = 0
+    packages = set()
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.strip() in preloaded:
+            continue
+        if not name[1:].startswith(' '):
+            import_us += int(cumulative)
+        packages.add(name.strip().split('.')[0])
+    return {"wall": wall, "imports": import_us / 1e6, "packages": packages}
+
+
+def bench_startup(args) -> Dict[str, Dict]:
+    """Start-up and import time of each CLI command, and a check that it loads no engine it does not use."""
+    server, base_url = start_server(latency=args.latency)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            saved = dict(CONFIG)
+            try:
+                CONFIG.update(output_dir=tmp)
+                save_raw(os.path.join(tmp, 'raw'), 'current', TIMEFRAME_INFO, raw_catalog(1))
+                with NdjsonWriter(os.path.join(tmp, 'current_offers.ndjson')) as writer:
+                    writer.write_many(DataNormalizer(CONFIG['base_url']).process(raw_catalog(1), TIMEFRAME_INFO))
+            finally:
+                CONFIG.clear()
+                CONFIG.update(saved)
+            settings = ['--output-dir', tmp] + [item for key, value in {
+                "state_db": os.path.join(tmp, 'state.sqlite3'), "metrics_report": os.path.join(tmp, 'run_report.json'),
+                "metrics_textfile": os.path.join(tmp, 'scraper.prom'), "promotion_page_url": base_url + PROMOTION_PATH,
+                "offers_db": os.path.join(tmp, 'offers.sqlite3'),
+            }.items() for item in ('--set', f"{key}={json.dumps(value)}")]
+            discovery = ['--initial-url', base_url + OFFERS_PATH + '?CategoryName=aanbiedingen', '--no-discovery-cache']
+            commands = {
+                "help": ['--help'],
+                "export": ['export'] + settings,
+                "export_sqlite": ['export', '--format', 'sqlite'] + settings,
+                "query": ['query', '--min-discount', '30'] + settings,
+                "normalize_from_raw": ['normalize-from-raw', '--no-incremental'] + settings,
+                "discover": ['discover'] + discovery + settings,
+                "scrape_http": ['scrape', '--engine', 'http', '--raw-only'] + discovery + settings,
+            }
+            preloaded = interpreter_modules()
+            for name, argv in commands.items():
+                runs = [run_cli(argv, preloaded) for _ in range(args.e2e_rounds)]
+                packages = sorted(runs[0]['packages'].intersection(HEAVY_PACKAGES))
+                results[f"startup.{name}"] = {
+                    "value": statistics.median(run['wall'] for run in runs) * 1e3, "unit": "ms/run", "items": 1,
+                    "rounds": args.e2e_rounds, "import_ms": round(statistics.median(run['imports'] for run in runs) * 1e3, 1),
+                    "packages": packages, "unexpected_imports": sorted(STARTUP_FORBIDDEN[name].intersection(packages)),
+                }
+    finally:
+        server.shutdown()
+    return results
+
+
+BENCHMARKS = {
+    "extract": bench_extraction,
+    "normalize": bench_normalizer,
+    "output": bench_output,
+    "http_engine": bench_http_engine,
+    "sharding": bench_sharding,
+    "discovery": bench_discovery,
+    "child_pages": bench_child_pages,
+    "replay": bench_replay,
+    "offers_store": bench_offers_store,
+    "startup": bench_startup,
+}
+
+
+def git_info() -> Dict:
+    def git(*command):
+        try:
+            return subprocess.run(('git',) + command, cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"commit": git('rev-parse', '--short', 'HEAD'), "dirty": bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def environment() -> Dict:
+    packages = {}
+    for name in ('bs4', 'lxml', 'selectolax', 'orjson', 'httpx'):
+        try:
+            module = __import__(name)
+            packages[name] = getattr(module, '__version__', 'installed')
+        except ImportError:
+            packages[name] = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(), "packages": packages}
+
+
+def latest_results(exclude: Optional[str] = None) -> Optional[str]:
+    paths = sorted(path for path in glob.glob(os.path.join(RESULTS_DIR, '*.json')) if path != exclude)
+    return paths[-1] if paths else None
+
+
+def compare(current: Dict, baseline_path: str, threshold: float) -> int:
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {os.path.basename(baseline_path)} (commit {baseline['meta'].get('commit')}):")
+    regressions = 0
+    for name, result in current['results'].items():
+        previous = baseline['results'].get(name)
+        if not previous or not previous['value']:
+            print(f"  {name:<34} {result['value']:>10.1f} {result['unit']:<12} (new)")
+            continue
+        change = result['value'] / previous['value'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"  {name:<34} {result['value']:>10.1f} {result['unit']:<12} {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite and store the results as JSON.")
+    parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), help="benchmark groups to run (default: all)")
+    parser.add_argument('--rounds', type=int, default=15, help="rounds per microbenchmark")
+    parser.add_argument('--e2e-rounds', type=int, default=3, help="rounds per end-to-end benchmark")
+    parser.add_argument('--catalog-copies', type=int, default=10, help="copies of the offers fixture in the normalizer catalog")
+    parser.add_argument('--products-per-range', type=int, default=480)
+    parser.add_argument('--child-pages', type=int, default=60)
+    parser.add_argument('--shard-workers', type=int, default=8, help="workers for the sharded end-to-end run")
+    parser.add_argument('--latency', type=float, default=0.02, help="stub server response time in seconds")
+    parser.add_argument('--baseline', help="results file to compare with (default: the previous run in bench/results)")
+    parser.add_argument('--threshold', type=float, default=0.10, help="slowdown reported as a regression")
+    parser.add_argument('--output', help="where to write the results (default: bench/results/<time>_<commit>.json)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f"Running {name} ...", flush=True)
+        results.update(BENCHMARKS[name](args))
+
+    meta = dict(git_info(), **environment())
+    meta['timestamp'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    report = {"meta": meta, "settings": {key: value for key, value in vars(args).items()
+                                         if key not in ('baseline', 'output', 'threshold')}, "results": results}
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    output = args.output or os.path.join(RESULTS_DIR, f"{stamp}_{meta['commit'] or 'nogit'}{'-dirty' if meta['dirty'] else ''}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in results.items():
+        print(f"  {name:<34} {result['value']:>10.1f} {result['unit']}")
+    print(f"Results written to {output}")
+    unexpected = {name: result['unexpected_imports'] for name, result in results.items() if result.get('unexpected_imports')}
+    for name, packages in unexpected.items():
+        print(f"  UNEXPECTED IMPORT: {name} loaded {', '.join(packages)}")
+    mismatches = {name: result['mismatch'] for name, result in results.items() if result.get('mismatch')}
+    for name, mismatch in mismatches.items():
+        print(f"  MISMATCH: {name}: {mismatch}")
+
+    baseline = args.baseline or latest_results(exclude=output)
+    regressions = compare(report, baseline, args.threshold) if baseline else 0
+    return 1 if regressions or unexpected or mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
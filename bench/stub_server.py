@@ -0,0 +1,197 @@
+import http.server
+import json
+import random
+import threading
+import time
+from html import escape
+from typing import List
+from urllib.parse import parse_qs, quote, urlencode, urlsplit
+
+# Local stand-in for hoogvliet.com used by the benchmarks. Product markup
+# follows the selectors extract_product_info_from_soup relies on, and the
+# offers page / promotion endpoint pair behaves like the site: the page ships
+# the first batch of products and loads the rest in pages while scrolling.
+
+SITE_PATH = '/INTERSHOP/web/WFS/org-webshop-Site/nl_NL/-/EUR'
+OFFERS_PATH = SITE_PATH + '/ViewStandardCatalog-Browse'
+PROMOTION_PATH = SITE_PATH + '/ViewStandardCatalog-GetCategoriesForPromotionPage'
+# PromotionRange -> checkbox label, as on the site's week filter.
+PROMOTION_RANGES = {
+    '20261012-20261018': 'Deze week | 12 oktober - 18 oktober',
+    '20261019-20261025': 'Volgende week | 19 oktober - 25 oktober',
+}
+# The offers listing is the root category; the category filters narrow it down.
+ROOT_CATEGORY = 'GzcKGwJ_2oMAAAFksydTSXaT'
+CATEGORIES = {
+    'kDsKGwJ0aXMAAAFk_zuivel': 'Zuivel en eieren',
+    'kDsKGwJ0aXMAAAFk_groente': 'Groente en fruit',
+    'kDsKGwJ0aXMAAAFk_vlees': 'Vlees en vis',
+    'kDsKGwJ0aXMAAAFk_dranken': 'Dranken',
+    'kDsKGwJ0aXMAAAFk_overig': 'Huishouden',
+}
+
+LAZY_LOAD_JS = """
+(() => {
+    const list = document.querySelector('.product-list');
+    let page = 1, loading = false, done = false;
+    window.addEventListener('scroll', () => {
+        if (loading || done || window.innerHeight + window.scrollY < document.body.offsetHeight - 200) return;
+        loading = true;
+        fetch(list.dataset.endpoint + '&PageNumber=' + page)
+            .then(response => response.text())
+            .then(html => {
+                list.insertAdjacentHTML('beforeend', html);
+                done = !html.includes('product-list-item');
+                page++;
+                loading = false;
+            });
+    });
+})();
+"""
+
+
+def product_html(index: int, with_child_link: bool = False) -> str:
+    track = escape(json.dumps({"products": [{"id": str(100000 + index), "brand": f"Merk {index % 25}"}]}))
+    if index % 2:
+        price = (f'<div class="non-strikethrough"><span class="price-euros"><span>{index % 9}</span>.</span>'
+                 f'<span class="price-cents"><sup>99</sup></span></div>'
+                 f'<div class="strikethrough"><span class="kor-product-sale-price-value">{index % 9 + 1},49</span></div>')
+    else:
+        price = (f'<div class="kor-product-sale-price"><span class="kor-product-sale-price-value">'
+                 f'{index % 7},25</span></div>')
+    child_link = (f'<div class="promotion-btn"><a class="btn" href="/child/{index % 40}">Bekijk</a></div>'
+                  if with_child_link else '')
+    return (f'<div class="product-list-item" data-track-click="{track}">'
+            f'<div class="product-image-container"><a href="/product/p{index}">'
+            f'<img class="product-image" src="https://cdn.hoogvliet.com/Images/Product/L/{index}.jpg"></a></div>'
+            f'<a class="product-title" href="/product/p{index}"><h3> Product {index} </h3></a>'
+            f'{price}<span class="promotion-short-title">2 voor 5,00</span>'
+            f'<div class="Short-Description">Omschrijving {index}</div>{child_link}</div>')
+
+
+def product_categories(index: int) -> List[str]:
+    """Every product has one category; every tenth is listed in the next one as well."""
+    uuids = list(CATEGORIES)
+    first = index % len(uuids)
+    return uuids[first:first + 1] + ([uuids[(first + 1) % len(uuids)]] if index % 10 == 0 else [])
+
+
+def timeframe_url(base_url: str, promotion_range: str, category: str = ROOT_CATEGORY) -> str:
+    search_parameter = f"&@QueryTerm=*&ContextCategoryUUID={category}&PromotionRange={promotion_range}"
+    return f"{base_url}{OFFERS_PATH}?CategoryName=aanbiedingen&SearchParameter={quote(search_parameter)}"
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    error_rate = 0.0
+    children_per_page = 6
+    # Products per promotion range; consecutive ranges share half their products.
+    products_per_range = 240
+    page_size = 48
+    # Set to False to serve an offers page without the category filters.
+    categories = True
+    # Every n-th product belongs to no category, so only the unfiltered listing has it (0: none).
+    uncategorized_every = 0
+    # Set to a list to have the path of every child page served appended to it.
+    child_hits = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body: str, status: int = 200, headers=None):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self.send_body('slow down', status=429, headers={'Retry-After': '0'})
+            return
+        parts = urlsplit(self.path)
+        if parts.path.startswith('/child/'):
+            page = int(parts.path.rsplit('/', 1)[-1])
+            if self.child_hits is not None:
+                self.child_hits.append(parts.path)
+            first = 500000 + page * self.children_per_page
+            self.send_body(''.join(product_html(first + i) for i in range(self.children_per_page)))
+            return
+        self.route(parts.path, parse_qs(parts.query))
+
+    def route(self, path, query):
+        if path == PROMOTION_PATH:
+            self.send_products_page(query)
+        elif path == OFFERS_PATH:
+            self.send_offers_page(query)
+        else:
+            self.send_body('not found', status=404)
+
+    def range_products(self, promotion_range: str, category: str = ROOT_CATEGORY) -> List[int]:
+        offset = list(PROMOTION_RANGES).index(promotion_range) * (self.products_per_range // 2)
+        products = range(offset, offset + self.products_per_range)
+        if category not in CATEGORIES:
+            return list(products)
+        return [index for index in products if category in self.product_categories(index)]
+
+    def product_categories(self, index: int) -> List[str]:
+        if self.uncategorized_every and index % self.uncategorized_every == self.uncategorized_every - 1:
+            return []
+        return product_categories(index)
+
+    def products_html(self, promotion_range: str, page_number: int, page_size: int, category: str = ROOT_CATEGORY) -> str:
+        if promotion_range not in PROMOTION_RANGES:
+            return ''
+        products = self.range_products(promotion_range, category)[page_number * page_size:(page_number + 1) * page_size]
+        return ''.join(product_html(index, with_child_link=index % 3 == 0) for index in products)
+
+    def send_products_page(self, query):
+        page_number = int(query.get('PageNumber', ['0'])[0] or 0)
+        page_size = int(query.get('PageSize', [self.page_size])[0] or self.page_size)
+        category = parse_qs(query.get('SearchParameter', [''])[0]).get('ContextCategoryUUID', [ROOT_CATEGORY])[0]
+        self.send_body(self.products_html(query.get('PromotionRange', [''])[0], page_number, page_size, category))
+
+    def send_offers_page(self, query):
+        search_parameter = query.get('SearchParameter', [''])[0]
+        current = parse_qs(search_parameter).get('PromotionRange', [next(iter(PROMOTION_RANGES))])[0]
+        category = parse_qs(search_parameter).get('ContextCategoryUUID', [ROOT_CATEGORY])[0]
+        filters = []
+        for number, (promotion_range, label) in enumerate(PROMOTION_RANGES.items()):
+            location = escape(timeframe_url('', promotion_range))
+            checked = ' checked' if promotion_range == current else ''
+            filters.append(f'<input class="filter-checkbox" type="checkbox" id="range-{number}" '
+                           f'data-document-location="{location}"{checked}><label for="range-{number}">{label}</label>')
+        if self.categories:
+            for number, (uuid, name) in enumerate(CATEGORIES.items()):
+                location = escape(timeframe_url('', current, uuid))
+                count = len(self.range_products(current, uuid))
+                filters.append(f'<input class="filter-checkbox" type="checkbox" id="category-{number}" '
+                               f'data-document-location="{location}"><label for="category-{number}">{name} ({count})</label>')
+        endpoint = escape(PROMOTION_PATH + '?' + urlencode({
+            "PageSize": self.page_size, "LoadMoreProducts": "", "PromotionRange": current,
+            "SearchParameter": search_parameter,
+        }))
+        self.send_body(f'<!DOCTYPE html><html><head><title>Aanbiedingen</title></head><body>'
+                       f'<div class="filters">{"".join(filters)}</div>'
+                       f'<div class="product-list row" data-endpoint="{endpoint}">'
+                       f'{self.products_html(current, 0, self.page_size, category)}</div>'
+                       f'<script>{LAZY_LOAD_JS}</script></body></html>')
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    # The default backlog of 5 drops connections once many workers fetch at once.
+    request_queue_size = 128
+
+
+def start_server(handler=StubHandler, **settings):
+    handler = type('ConfiguredStubHandler', (handler,), settings)
+    server = StubServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
@@ -0,0 +1,493 @@
+import json
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from fnmatch import fnmatchcase
+from typing import Any, Dict, List, Optional
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+import capture
+from metrics import METRICS
+from models import RawProduct
+from scraper import CONFIG
+from sharding import Filter, read_filters
+
+# The Chrome engine. It lives apart from scraper.py because selenium takes a
+# fifth of a second to import; scraper.py only loads this module once a run
+# actually needs a browser, so http-engine and offline runs never pay for it.
+
+# Tracks in-flight XHR/fetch requests and DOM mutations so the scroller can wait
+# on actual lazy-load progress instead of sleeping a fixed time per scroll.
+INSTALL_LOAD_WATCHER_JS = """
+if (window.__hvLoadState) return;
+const state = window.__hvLoadState = {pending: 0, lastActivity: performance.now()};
+const touch = () => { state.lastActivity = performance.now(); };
+const send = XMLHttpRequest.prototype.send;
+XMLHttpRequest.prototype.send = function () {
+    state.pending++; touch();
+    this.addEventListener('loadend', () => { state.pending--; touch(); });
+    return send.apply(this, arguments);
+};
+if (window.fetch) {
+    const fetch = window.fetch;
+    window.fetch = function () {
+        state.pending++; touch();
+        return fetch.apply(this, arguments).finally(() => { state.pending--; touch(); });
+    };
+}
+new MutationObserver(touch).observe(document.body, {childList: true, subtree: true});
+"""
+
+# Resolves as soon as the product count grows ('loaded'), once the page has been
+# quiet with no pending requests for quietMs ('idle'), or at timeoutMs ('timeout').
+WAIT_FOR_PRODUCTS_JS = """
+const [selector, timeoutMs, quietMs, done] = arguments;
+const state = window.__hvLoadState || {pending: 0, lastActivity: 0};
+const start = performance.now();
+const startCount = document.querySelectorAll(selector).length;
+const check = () => {
+    const now = performance.now();
+    const count = document.querySelectorAll(selector).length;
+    if (count > startCount) return done({reason: 'loaded', elapsed: now - start, count: count});
+    if (now - start >= timeoutMs) return done({reason: 'timeout', elapsed: now - start, count: count});
+    if (now - start >= quietMs && state.pending === 0 && now - state.lastActivity >= quietMs) {
+        return done({reason: 'idle', elapsed: now - start, count: count});
+    }
+    setTimeout(check, 25);
+};
+check();
+"""
+
+# Collects the same fields as HoogvlietScraper.extract_product_info for every
+# product in one execute_script round trip instead of ~10 WebDriver calls each.
+EXTRACT_PRODUCTS_JS = """
+const text = (root, selector, fallback) => {
+    const el = root.querySelector(selector);
+    return el ? el.innerText.trim() : fallback;
+};
+const html = (root, selector) => {
+    const el = root.querySelector(selector);
+    return el ? el.innerHTML : null;
+};
+const prop = (root, selector, name, fallback) => {
+    const el = root.querySelector(selector);
+    if (!el) return fallback;
+    return el.getAttribute(name) === null ? null : el[name];
+};
+return Array.from(document.querySelectorAll('.product-list-item')).map(item => {
+    let id = null, brand = null;
+    try {
+        const trackClick = item.getAttribute('data-track-click');
+        if (trackClick) {
+            const product = (JSON.parse(trackClick).products || [{}])[0];
+            id = product.id === undefined ? null : product.id;
+            brand = product.brand === undefined ? null : product.brand;
+        }
+    } catch (e) {}
+    return {
+        id: id,
+        brand: brand,
+        name: text(item, '.product-title h3', 'N/A'),
+        price_now_raw: html(item, '.non-strikethrough'),
+        price_was_raw: html(item, '.strikethrough'),
+        promotion: text(item, '.promotion-short-title', null),
+        image_url: prop(item, 'img.product-image', 'src', 'N/A'),
+        source_url: prop(item, 'a.product-title, .product-image-container a', 'href', 'N/A'),
+        description: text(item, '.Short-Description', null),
+        child_page_url: prop(item, '.promotion-btn a.btn', 'href', null),
+    };
+});
+"""
+
+
+def lean_blocked_urls(blocked: List[str], allowed: List[str]) -> List[str]:
+    """The blocked patterns no allowed pattern covers as a whole; ``*cdn.hoogvliet.com*`` covers ``*.cdn.hoogvliet.com/*``."""
+    return [pattern for pattern in blocked if not any(fnmatchcase(pattern, allow) for allow in allowed)]
+
+
+def lean_blocks(url: str, blocked: List[str], allowed: List[str]) -> bool:
+    """Allowed patterns win: a URL is blocked when it matches a blocked pattern and no allowed one."""
+    return any(fnmatchcase(url, pattern) for pattern in blocked) and not any(fnmatchcase(url, pattern) for pattern in allowed)
+
+
+class LeanRequestFilter:
+    """Blocks requests in Python when allowed patterns carve exceptions out of blocked ones.
+
+    Chrome's Network.setBlockedURLs has no exceptions, so with allowed
+    patterns every request goes through this WebDriver BiDi handler instead.
+    """
+
+    def __init__(self, blocked: List[str], allowed: List[str]):
+        self.blocked = blocked
+        self.allowed = allowed
+        self.requests_blocked = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        if lean_blocks(request.url, self.blocked, self.allowed):
+            with self._lock:
+                self.requests_blocked += 1
+            # fail() in recent Selenium releases, fail_request() in older ones.
+            (getattr(request, 'fail', None) or request.fail_request)()
+        else:
+            request.continue_request()
+
+    def take_blocked(self) -> int:
+        with self._lock:
+            count, self.requests_blocked = self.requests_blocked, 0
+        return count
+
+
+class HoogvlietScraper:
+    def __init__(self, headless=True, pool: Optional['DriverPool'] = None):
+        self.options = webdriver.ChromeOptions()
+        if headless:
+            self.options.add_argument('--headless')
+        self.options.add_argument('--no-sandbox')
+        self.options.add_argument('--disable-dev-shm-usage')
+        self.options.add_argument('--disable-blink-features=AutomationControlled')
+        self.options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        self.options.add_experimental_option('useAutomationExtension', False)
+        self.lean = CONFIG['browser_profile'] == 'lean'
+        self.lean_blocked = lean_blocked_urls(CONFIG['lean_blocked_patterns'], CONFIG['lean_allowed_patterns'])
+        # Allowed patterns narrower than a blocked one need request interception.
+        self.lean_intercept = self.lean and bool(CONFIG['lean_allowed_patterns']) and bool(self.lean_blocked)
+        if self.lean_intercept:
+            self.options.enable_bidi = True
+        if self.lean and not CONFIG['lean_allowed_patterns']:
+            # Turning images off outright would also block the images an allowed pattern lets through.
+            self.options.add_argument('--blink-settings=imagesEnabled=false')
+            self.options.add_experimental_option("prefs", {
+                "profile.managed_default_content_settings.images": 2,
+            })
+        if self.lean:
+            self.options.add_argument('--mute-audio')
+            self.options.add_argument('--disable-extensions')
+            self.options.add_argument('--disable-background-networking')
+            self.options.add_argument('--disable-component-update')
+            self.options.add_argument('--disable-default-apps')
+            self.options.add_argument('--disable-sync')
+            self.options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        self.driver = None
+        self.pool = pool
+        self.network_stats = {}
+        self.scroll_stats = []
+
+    def start_driver(self):
+        with METRICS.timer('driver_start', profile=CONFIG['browser_profile']):
+            self.driver = webdriver.Chrome(options=self.options)
+            self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+            if self.lean:
+                self.driver.execute_cdp_cmd('Network.enable', {})
+                if self.lean_intercept:
+                    try:
+                        lean_filter = LeanRequestFilter(self.lean_blocked, CONFIG['lean_allowed_patterns'])
+                        self.driver.network.add_request_handler('before_request', lean_filter)
+                        self.driver.lean_filter = lean_filter
+                    except (AttributeError, WebDriverException) as e:
+                        logging.warning(f"Request interception is unavailable ({e}); blocking without the allowed patterns "
+                                        f"that only narrow a blocked one.")
+                        self.lean_intercept = False
+                if not self.lean_intercept:
+                    self.driver.execute_cdp_cmd('Network.setBlockedURLs', {"urls": self.lean_blocked})
+        return self.driver
+
+    def read_network_stats(self) -> Dict[str, int]:
+        # Drains Chrome's performance log; only available with the lean profile.
+        stats = {"bytes_downloaded": 0, "requests_finished": 0, "requests_blocked": 0}
+        if not self.lean:
+            return stats
+        try:
+            entries = self.driver.get_log('performance')
+        except WebDriverException:
+            return stats
+        for entry in entries:
+            message = json.loads(entry['message'])['message']
+            if message['method'] == 'Network.loadingFinished':
+                stats['bytes_downloaded'] += int(message['params'].get('encodedDataLength', 0))
+                stats['requests_finished'] += 1
+            elif message['method'] == 'Network.loadingFailed' and message['params'].get('blockedReason'):
+                stats['requests_blocked'] += 1
+        lean_filter = getattr(self.driver, 'lean_filter', None)
+        if lean_filter:
+            stats['requests_blocked'] += lean_filter.take_blocked()
+        return stats
+
+    def install_load_watcher(self):
+        self.driver.execute_script(INSTALL_LOAD_WATCHER_JS)
+
+    def wait_for_products(self, timeout: float) -> Dict[str, Any]:
+        self.driver.set_script_timeout(timeout + 5)
+        return self.driver.execute_async_script(
+            WAIT_FOR_PRODUCTS_JS, '.product-list-item', int(timeout * 1000), CONFIG['scroll_quiet_ms'])
+
+    def scroll_to_load_products(self, max_scrolls=50, max_wait=None):
+        max_wait = max_wait or CONFIG['scroll_max_wait']
+        min_wait = CONFIG['scroll_min_wait']
+        self.install_load_watcher()
+        self.scroll_stats = []
+        wait_bound = max_wait
+        average_load = None
+        scrolls = 0
+        no_change_count = 0
+        while scrolls < max_scrolls:
+            if no_change_count == 0:
+                try:
+                    product_list_element = self.driver.find_element(By.CSS_SELECTOR, 'div.product-list.row')
+                    self.driver.execute_script("arguments[0].scrollIntoView(false);", product_list_element)
+                except NoSuchElementException:
+                    logging.warning("Could not find product list element to scroll to. Breaking.")
+                    break
+            elif no_change_count == 1:
+                logging.info("No new products after scrolling. Scrolling down 200 pixels.")
+                self.driver.execute_script("window.scrollBy(0, 200);")
+            elif no_change_count == 2:
+                logging.info("No new products after scrolling. Scrolling up 400 pixels.")
+                self.driver.execute_script("window.scrollBy(0, -400);")
+
+            result = self.wait_for_products(wait_bound)
+            waited = result['elapsed'] / 1000
+            METRICS.observe('scroll_wait', waited, reason=result['reason'])
+            self.scroll_stats.append({
+                "scroll": scrolls,
+                "reason": result['reason'],
+                "waited": round(waited, 3),
+                "wait_bound": round(wait_bound, 3),
+                "product_count": result['count'],
+            })
+
+            if result['reason'] == 'loaded':
+                no_change_count = 0
+                # Size the next wait from how long loads actually take, so a slow
+                # page still gets time while a fast one is not waited on for long.
+                average_load = waited if average_load is None else 0.7 * average_load + 0.3 * waited
+                wait_bound = min(max_wait, max(min_wait, 3 * average_load))
+            else:
+                no_change_count += 1
+                if no_change_count >= 3:
+                    logging.info("No new products after nudging. Assuming all products are loaded.")
+                    break
+            scrolls += 1
+
+        loads = [stat['waited'] for stat in self.scroll_stats if stat['reason'] == 'loaded']
+        if loads:
+            logging.info(f"Finished scrolling after {scrolls} attempts. {len(loads)} loads, "
+                         f"avg {sum(loads) / len(loads):.2f}s, max {max(loads):.2f}s, "
+                         f"total wait {sum(stat['waited'] for stat in self.scroll_stats):.2f}s.")
+        else:
+            logging.info(f"Finished scrolling after {scrolls} attempts.")
+
+    def extract_product_info(self, product_element):
+        product_data = {}
+        try:
+            track_click_attr = product_element.get_attribute('data-track-click')
+            if track_click_attr:
+                track_data = json.loads(track_click_attr)
+                product_data['id'] = track_data.get('products', [{}])[0].get('id')
+                product_data['brand'] = track_data.get('products', [{}])[0].get('brand')
+            else:
+                product_data['id'], product_data['brand'] = None, None
+        except Exception:
+            product_data['id'], product_data['brand'] = None, None
+
+        try:
+            name_elem = product_element.find_element(By.CSS_SELECTOR, '.product-title h3')
+            product_data['name'] = name_elem.text.strip()
+        except: product_data['name'] = 'N/A'
+        
+        try:
+            price_now_elem = product_element.find_element(By.CSS_SELECTOR, '.non-strikethrough')
+            product_data['price_now_raw'] = price_now_elem.get_attribute('innerHTML')
+        except: product_data['price_now_raw'] = None
+        
+        try:
+            price_was_elem = product_element.find_element(By.CSS_SELECTOR, '.strikethrough')
+            product_data['price_was_raw'] = price_was_elem.get_attribute('innerHTML')
+        except: product_data['price_was_raw'] = None
+
+        try:
+            promo_elem = product_element.find_element(By.CSS_SELECTOR, '.promotion-short-title')
+            product_data['promotion'] = promo_elem.text.strip()
+        except: product_data['promotion'] = None
+        try:
+            img_elem = product_element.find_element(By.CSS_SELECTOR, 'img.product-image')
+            product_data['image_url'] = img_elem.get_attribute('src')
+        except: product_data['image_url'] = 'N/A'
+        try:
+            link_elem = product_element.find_element(By.CSS_SELECTOR, 'a.product-title, .product-image-container a')
+            product_data['source_url'] = link_elem.get_attribute('href')
+        except: product_data['source_url'] = 'N/A'
+        try:
+            desc_elem = product_element.find_element(By.CSS_SELECTOR, '.Short-Description')
+            product_data['description'] = desc_elem.text.strip()
+        except: product_data['description'] = None
+        
+        product_data['child_page_url'] = None
+        try:
+            parent_link_elem = product_element.find_element(By.CSS_SELECTOR, '.promotion-btn a.btn')
+            product_data['child_page_url'] = parent_link_elem.get_attribute('href')
+        except NoSuchElementException:
+            pass
+            
+        return RawProduct(**product_data)
+
+    def extract_all_products(self) -> List[RawProduct]:
+        with METRICS.timer('extract', engine='browser', mode=CONFIG['extraction']) as timing:
+            if CONFIG['extraction'] == 'script':
+                products = [RawProduct.from_dict(data) for data in self.driver.execute_script(EXTRACT_PRODUCTS_JS) or []]
+            else:
+                product_elements = self.driver.find_elements(By.CSS_SELECTOR, '.product-list-item')
+                products = [self.extract_product_info(element) for element in product_elements]
+            timing.items = len(products)
+        return products
+
+    def scrape_page(self, url: str, max_scrolls: int = 50, raise_errors: bool = False) -> List[RawProduct]:
+        self.driver = self.pool.acquire() if self.pool else self.start_driver()
+        products_on_page = []
+        try:
+            self.read_network_stats()
+            logging.info(f"Loading page: {url}")
+            with METRICS.timer('page_load', engine='browser'):
+                self.driver.get(url)
+                WebDriverWait(self.driver, CONFIG['timeout']).until(EC.presence_of_element_located((By.CSS_SELECTOR, '.product-list-item')))
+            with METRICS.timer('scroll'):
+                self.scroll_to_load_products(max_scrolls=max_scrolls)
+            
+            if capture.active():
+                capture.record_page(url, 0, self.driver.page_source)
+            logging.info("Extracting product information...")
+            for product_info in self.extract_all_products():
+                if product_info.id:
+                    products_on_page.append(product_info)
+
+            logging.info(f"Successfully scraped {len(products_on_page)} raw products from {url}")
+            if self.lean:
+                self.network_stats = self.read_network_stats()
+                METRICS.inc('bytes_downloaded', self.network_stats['bytes_downloaded'], engine='browser')
+                METRICS.inc('requests', self.network_stats['requests_finished'], engine='browser')
+                METRICS.inc('requests_blocked', self.network_stats['requests_blocked'], engine='browser')
+                logging.info(f"Network: {self.network_stats['bytes_downloaded'] / 1e6:.2f} MB downloaded in "
+                             f"{self.network_stats['requests_finished']} requests, "
+                             f"{self.network_stats['requests_blocked']} requests blocked by the lean profile.")
+            return products_on_page
+        except Exception as e:
+            logging.error(f"Error during scraping {url}: {e}", exc_info=True)
+            if raise_errors:
+                raise
+            return []
+        finally:
+            if self.driver and self.pool:
+                self.pool.release(self.driver)
+            elif self.driver:
+                self.driver.quit()
+            self.driver = None
+
+
+class DriverPool:
+    """Bounded pool of warm Chrome drivers, reused across timeframe discovery and page scrapes.
+
+    Drivers are started lazily up to ``size``, health-checked when handed out and
+    reset to a blank, cookie-free session when returned.
+    """
+
+    def __init__(self, size: Optional[int] = None, headless: Optional[bool] = None):
+        self.size = size or CONFIG['concurrency']
+        self.headless = CONFIG['headless'] if headless is None else headless
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _start(self):
+        logging.info("Starting Chrome driver for the pool.")
+        return HoogvlietScraper(headless=self.headless).start_driver()
+
+    def _is_healthy(self, driver) -> bool:
+        try:
+            return driver.execute_script("return 1") == 1
+        except WebDriverException:
+            return False
+
+    def _discard(self, driver):
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self, timeout: Optional[float] = None):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_start = self._created < self.size
+                    if can_start:
+                        self._created += 1
+                if can_start:
+                    try:
+                        return self._start()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                driver = self._idle.get(timeout=timeout)
+            if self._is_healthy(driver):
+                return driver
+            logging.warning("Discarding unresponsive Chrome driver from the pool.")
+            self._discard(driver)
+
+    def release(self, driver):
+        if self._closed:
+            self._discard(driver)
+            return
+        try:
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        except WebDriverException:
+            pass
+        try:
+            driver.delete_all_cookies()
+            driver.get("about:blank")
+        except WebDriverException:
+            logging.warning("Could not reset Chrome driver session. Discarding it.")
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+
+    @contextmanager
+    def driver(self, timeout: Optional[float] = None):
+        driver = self.acquire(timeout)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+
+def read_filters_browser(initial_url: str, pool: Optional[DriverPool] = None) -> List[Filter]:
+    driver = pool.acquire() if pool else HoogvlietScraper(headless=True).start_driver()
+    try:
+        driver.get(initial_url)
+        wait = WebDriverWait(driver, CONFIG['timeout'])
+        wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'input.filter-checkbox[data-document-location]')))
+        return read_filters(driver.page_source, CONFIG['html_backend'])
+    finally:
+        if driver and pool:
+            pool.release(driver)
+        elif driver:
+            driver.quit()
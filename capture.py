@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from html_backends import extract_products
+from models import RawProduct
+
+# Raw capture for offline replay (``--capture``). While a capture session is
+# active, every listing page and child page a run fetches, and the raw
+# products of every timeframe, are kept in a content-addressed store:
+#
+#   objects/ab/cdef...   zlib-compressed body, named by the SHA-256 of its content
+#   runs/<run_id>.json   which object is which page, child page and timeframe
+#
+# Unchanged pages are stored once no matter how many runs captured them.
+# replay.py rebuilds a run's output from a manifest without the network.
+
+_session: Optional['CaptureSession'] = None
+
+
+class CaptureStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.runs_dir = os.path.join(root, 'runs')
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Unique per thread, so two threads storing the same page do not write one .part file.
+            partial_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+            with open(partial_path, 'wb') as f:
+                f.write(zlib.compress(data, 6))
+            os.replace(partial_path, path)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self._object_path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def put_text(self, text: str) -> str:
+        return self.put(text.encode('utf-8'))
+
+    def get_text(self, digest: str) -> str:
+        return self.get(digest).decode('utf-8')
+
+    def put_products(self, products: List[RawProduct]) -> str:
+        return self.put(json.dumps([product.to_dict() for product in products], ensure_ascii=False).encode('utf-8'))
+
+    def get_products(self, digest: str) -> List[RawProduct]:
+        return [RawProduct.from_dict(data) for data in json.loads(self.get(digest))]
+
+    def runs(self) -> List[str]:
+        if not os.path.isdir(self.runs_dir):
+            return []
+        return sorted(name[:-len('.json')] for name in os.listdir(self.runs_dir) if name.endswith('.json'))
+
+    def load_manifest(self, run_id: Optional[str] = None) -> Dict[str, Any]:
+        """The manifest of ``run_id``, or of the latest run."""
+        runs = self.runs()
+        run_id = run_id or (runs[-1] if runs else None)
+        if run_id not in runs:
+            raise FileNotFoundError(f"No capture run {run_id} in {self.runs_dir}" if run_id else f"No capture runs in {self.runs_dir}")
+        with open(os.path.join(self.runs_dir, f"{run_id}.json"), encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_manifest(self, manifest: Dict[str, Any]):
+        os.makedirs(self.runs_dir, exist_ok=True)
+        path = os.path.join(self.runs_dir, f"{manifest['run_id']}.json")
+        with open(path + '.part', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(path + '.part', path)
+
+
+class CaptureSession:
+    def __init__(self, store: CaptureStore, manifest: Dict[str, Any]):
+        self.store = store
+        self.manifest = manifest
+        self._lock = threading.Lock()
+
+    @property
+    def run_id(self) -> str:
+        return self.manifest['run_id']
+
+    def record_page(self, listing_url: str, page_number: int, html: str):
+        digest = self.store.put_text(html)
+        with self._lock:
+            self.manifest['pages'].setdefault(listing_url, {})[str(page_number)] = digest
+
+    def record_child(self, url: str, html: str):
+        digest = self.store.put_text(html)
+        with self._lock:
+            self.manifest['children'][url] = digest
+
+    def record_timeframe(self, key: str, info: Dict, listing_urls: List[str], raw_data: List[RawProduct]):
+        digest = self.store.put_products(raw_data)
+        with self._lock:
+            self.manifest['timeframes'][key] = {"info": info, "listings": listing_urls, "raw": digest, "count": len(raw_data)}
+
+    def save(self):
+        with self._lock:
+            self.store.save_manifest(self.manifest)
+
+
+def active() -> bool:
+    return _session is not None
+
+
+def record_page(listing_url: str, page_number: int, html: str):
+    if _session:
+        _session.record_page(listing_url, page_number, html)
+
+
+def record_child(url: str, html: str):
+    if _session:
+        _session.record_child(url, html)
+
+
+def record_timeframe(key: str, info: Dict, listing_urls: List[str], raw_data: List[RawProduct]):
+    if _session:
+        _session.record_timeframe(key, info, listing_urls, raw_data)
+
+
+def extract_object(root: str, digest: str, backend: str = 'auto') -> List[RawProduct]:
+    """Extracts the products of a stored page; a module-level function so replay can run it in worker processes."""
+    return extract_products(CaptureStore(root).get_text(digest), backend)
+
+
+@contextmanager
+def session(root: str, append: bool = False, settings: Optional[Dict[str, Any]] = None) -> Iterator[CaptureSession]:
+    """Captures into a new run, or with ``append`` into the latest one (child pages belong to the last scrape)."""
+    global _session
+    store = CaptureStore(root)
+    if append and store.runs():
+        manifest = store.load_manifest()
+    else:
+        run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+        existing = set(store.runs())
+        suffix = 1
+        while run_id in existing:
+            suffix += 1
+            run_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{suffix}"
+        manifest = {"run_id": run_id, "started": datetime.now().isoformat(timespec='seconds'), "settings": settings or {},
+                    "timeframes": {}, "pages": {}, "children": {}}
+    _session = CaptureSession(store, manifest)
+    logging.info(f"Capturing raw pages to {root} (run {_session.run_id})")
+    try:
+        yield _session
+    finally:
+        current, _session = _session, None
+        current.save()
+        logging.info(f"Capture run {current.run_id}: {len(manifest['timeframes'])} timeframes, "
+                     f"{sum(len(pages) for pages in manifest['pages'].values())} pages, {len(manifest['children'])} child pages")
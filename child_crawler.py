@@ -0,0 +1,188 @@
+import asyncio
+import concurrent.futures
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+import httpx
+
+from http_cache import ResponseCache
+from metrics import METRICS
+from models import RawProduct
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Global request budget: ``rate`` requests per second with bursts up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncChildCrawler:
+    """Fetches child pages on one event loop.
+
+    The token bucket decides how fast requests leave, the semaphore how many
+    may be in flight at once, so hundreds of pages can wait on the network
+    while the request rate stays at the configured level. 429 and 5xx answers
+    are retried with exponential backoff (or the server's Retry-After).
+    """
+
+    def __init__(self, rate: float, burst: int, concurrency: int, cookies: Optional[List[Dict]] = None,
+                 user_agent: Optional[str] = None, timeout: float = 20, max_retries: int = 4,
+                 backoff: float = 1.0, cache: Optional[ResponseCache] = None):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.cookies = cookies or []
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self.stats = {"requests": 0, "retries": 0, "failed": 0, "cached": 0, "elapsed": 0.0}
+
+    def _client(self) -> httpx.AsyncClient:
+        headers = {"User-Agent": self.user_agent} if self.user_agent else {}
+        client = httpx.AsyncClient(
+            headers=headers, timeout=self.timeout, follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        for cookie in self.cookies:
+            client.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+        return client
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    async def _fetch(self, client: httpx.AsyncClient, bucket: TokenBucket, semaphore: asyncio.Semaphore,
+                     url: str, scope: str) -> str:
+        cached, servable = self.cache.lookup(url, scope) if self.cache else (None, False)
+        if servable:
+            self.stats['cached'] += 1
+            METRICS.inc('child_pages', source='cache')
+            return cached.body
+        headers = cached.conditional_headers() if cached else {}
+
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                await bucket.acquire()
+                self.stats['requests'] += 1
+                start = time.perf_counter()
+                response = await client.get(url, headers=headers)
+                METRICS.observe('child_fetch', time.perf_counter() - start, engine='asyncio', status=response.status_code)
+                METRICS.inc('bytes_downloaded', response.num_bytes_downloaded, engine='asyncio')
+                if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    self.stats['retries'] += 1
+                    await asyncio.sleep(self._retry_delay(response, attempt))
+                    continue
+                if cached and response.status_code == 304:
+                    self.cache.revalidated(url, scope, response.headers)
+                    METRICS.inc('child_pages', source='revalidated')
+                    return cached.body
+                response.raise_for_status()
+                if self.cache:
+                    self.cache.store(url, scope, response.text, response.headers)
+                METRICS.inc('child_pages', source='network')
+                return response.text
+
+    async def crawl(self, urls: Iterable[str], scope: str = '',
+                    on_page: Optional[Callable[[str, str], None]] = None) -> Dict[str, Union[str, Exception, None]]:
+        """Fetches every unique URL and returns url -> body or exception.
+
+        With ``on_page`` each body is handed over as soon as it arrives (in a
+        worker thread, so a blocking consumer applies backpressure without
+        stalling the event loop) and is not kept in the returned dict.
+        """
+        bucket = TokenBucket(self.rate, self.burst)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        unique_urls = list(dict.fromkeys(urls))
+
+        async def fetch_one(client, url):
+            body = await self._fetch(client, bucket, semaphore, url, scope)
+            if on_page is None:
+                return body
+            await asyncio.to_thread(on_page, url, body)
+            return None
+
+        start = time.monotonic()
+        async with self._client() as client:
+            results = await asyncio.gather(*(fetch_one(client, url) for url in unique_urls), return_exceptions=True)
+        self.stats['elapsed'] += time.monotonic() - start
+        pages = {}
+        for url, result in zip(unique_urls, results):
+            if isinstance(result, Exception):
+                self.stats['failed'] += 1
+                logging.error(f"Child URL {url} failed: {result!r}")
+            pages[url] = result
+        return pages
+
+    def run(self, urls: Iterable[str], scope: str = '',
+            on_page: Optional[Callable[[str, str], None]] = None) -> Dict[str, Union[str, Exception, None]]:
+        return asyncio.run(self.crawl(urls, scope, on_page))
+
+    def log_stats(self):
+        elapsed = self.stats['elapsed']
+        rate = self.stats['requests'] / elapsed if elapsed else 0.0
+        logging.info(f"Child crawler: {self.stats['requests']} requests ({rate:.1f}/s, limit {self.rate}/s), "
+                     f"{self.stats['retries']} retries, {self.stats['cached']} from cache, "
+                     f"{self.stats['failed']} failed in {elapsed:.2f}s.")
+
+
+class ChildFrontier:
+    """Run-wide registry of child page URLs shared by all timeframe workers.
+
+    The first worker to ``claim`` a URL fetches it and ``resolve``s it with the
+    extracted raw products, or None when the fetch failed; every other parent,
+    in any timeframe, waits on the same future instead of fetching the page again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages: Dict[str, concurrent.futures.Future] = {}
+        self.stats = {"parent_links": 0, "unique_urls": 0, "shared_across_timeframes": 0}
+
+    def claim(self, parent_counts: Dict[str, int]) -> List[str]:
+        claimed = []
+        with self._lock:
+            for url, parent_count in parent_counts.items():
+                self.stats['parent_links'] += parent_count
+                if url in self._pages:
+                    self.stats['shared_across_timeframes'] += 1
+                    continue
+                self._pages[url] = concurrent.futures.Future()
+                self.stats['unique_urls'] += 1
+                claimed.append(url)
+        return claimed
+
+    def resolve(self, url: str, raw_products: Optional[List[RawProduct]]):
+        self._pages[url].set_result(raw_products)
+
+    def result(self, url: str) -> Optional[List[RawProduct]]:
+        return self._pages[url].result()
+
+    def log_stats(self):
+        skipped = self.stats['parent_links'] - self.stats['unique_urls']
+        logging.info(f"Child frontier: {self.stats['parent_links']} parent links, {self.stats['unique_urls']} unique child pages "
+                     f"fetched, {skipped} duplicate fetches avoided ({self.stats['shared_across_timeframes']} shared across timeframes).")
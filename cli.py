@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import sys
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+# Command line with one subcommand per pipeline stage:
+#
+#   python cli.py discover                  print the shard plan
+#   python cli.py scrape [--raw-only]       the full run, same as `python scraper.py`
+#   python cli.py normalize-from-raw [DIR]  normalize raw products saved by `scrape --raw-dir`
+#   python cli.py child-crawl               add the child page products to the offers files
+#   python cli.py export [--format sqlite]  rewrite the pretty JSON, or load the offers into offers_db
+#   python cli.py query --brand X           look offers up in offers_db
+#   python cli.py replay [RUN_ID]           rebuild the output of a --capture run offline
+#   python cli.py daemon                    stay resident and scrape when the promotion ranges change
+#
+# Nothing heavy is imported at module level. Each command imports what it
+# needs when it runs: `export` and `normalize-from-raw` load neither httpx nor
+# selenium, and the http engine never loads selenium. bench/run_benchmarks.py
+# --only startup measures this per command.
+
+
+def parse_value(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def configure(args: argparse.Namespace) -> Dict:
+    """Applies the options whose dest is a CONFIG key, then the --set overrides."""
+    from scraper import CONFIG
+    for key, value in vars(args).items():
+        if key in CONFIG and value is not None:
+            CONFIG[key] = value
+    for assignment in args.set or []:
+        key, _, value = assignment.partition('=')
+        if key not in CONFIG:
+            raise SystemExit(f"Unknown CONFIG key: {key}")
+        CONFIG[key] = parse_value(value)
+    return CONFIG
+
+
+def command_discover(args: argparse.Namespace) -> int:
+    from scraper import CONFIG, discover_shards
+    shards = discover_shards(CONFIG['initial_url'])
+    if args.json:
+        json.dump([{
+            "key": shard.key, "url": shard.url, "timeframe": shard.timeframe.key,
+            "start_date": shard.timeframe.start_date, "end_date": shard.timeframe.end_date,
+            "category": shard.category.name if shard.category else None, "estimate": shard.estimate,
+        } for shard in shards], sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for shard in shards:
+            timeframe = shard.timeframe
+            print(f"{shard.key:<40} {timeframe.start_date} - {timeframe.end_date} {shard.estimate:>6}  {shard.url}")
+    return 0 if shards else 1
+
+
+def command_scrape(args: argparse.Namespace) -> int:
+    from scraper import CONFIG, main
+    if args.raw_only and not CONFIG['raw_dir']:
+        CONFIG['raw_dir'] = os.path.join(CONFIG['output_dir'], 'raw')
+    return main(normalize=not args.raw_only)
+
+
+def command_normalize(args: argparse.Namespace) -> int:
+    from scraper import CONFIG, normalize_from_raw
+    return normalize_from_raw(args.raw_dir or CONFIG['raw_dir'] or os.path.join(CONFIG['output_dir'], 'raw'), args.timeframe)
+
+
+def command_child_crawl(args: argparse.Namespace) -> int:
+    from scraper import crawl_children
+    return 1 if crawl_children(args.timeframe) else 0
+
+
+def command_export(args: argparse.Namespace) -> int:
+    from scraper import export
+    return export(args.timeframe, args.format)
+
+
+def command_query(args: argparse.Namespace) -> int:
+    from scraper import CONFIG
+    from offers_store import OfferStore
+    if not os.path.exists(CONFIG['offers_db']):
+        print(f"No offers database at {CONFIG['offers_db']}; run `cli.py export --format sqlite` first.", file=sys.stderr)
+        return 1
+    store = OfferStore(CONFIG['offers_db'])
+    timeframe = args.timeframe[0] if args.timeframe else None
+    try:
+        if args.changes:
+            result = store.changes(*args.changes)
+            json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+            return 0
+        if args.id:
+            offers = store.get(args.id, timeframe, args.children)
+        elif args.brand:
+            offers = store.by_brand(args.brand, timeframe, args.children)
+        elif args.min_discount is not None:
+            offers = store.with_discount(args.min_discount, timeframe, args.children, args.limit)
+        elif args.active_on:
+            offers = store.active_on(args.active_on, args.children)
+        else:
+            json.dump(store.timeframes(), sys.stdout, indent=2)
+            print()
+            return 0
+    finally:
+        store.close()
+    for offer in offers:
+        print(json.dumps(offer, ensure_ascii=False))
+    return 0
+
+
+def command_replay(args: argparse.Namespace) -> int:
+    from scraper import CONFIG
+    from capture import CaptureStore
+    from replay import list_runs, replay_run
+    if args.list:
+        return list_runs()
+    runs = CaptureStore(CONFIG['capture_dir']).runs()
+    run_id = args.run_id or (runs[-1] if runs else None)
+    if run_id not in runs:
+        print(f"No capture run {run_id or ''} in {CONFIG['capture_dir']}; scrape with --capture first.", file=sys.stderr)
+        return 1
+    if args.output_dir is None:
+        # Kept apart from the live output, so replays of the same capture can be diffed.
+        CONFIG['output_dir'] = os.path.join(CONFIG['capture_dir'], 'replay', run_id)
+    return replay_run(run_id, args.timeframe, compare=args.compare, workers=args.workers)
+
+
+def command_daemon(args: argparse.Namespace) -> int:
+    from daemon import run_daemon
+    return run_daemon()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--output-dir', dest='output_dir', help="directory the offers files are read from and written to")
+    common.add_argument('--set', action='append', metavar='KEY=VALUE',
+                        help="override a CONFIG entry; VALUE is parsed as JSON when it can be (repeatable)")
+    common.add_argument('--profile', nargs='?', metavar='DIR', const='',
+                        help="profile the command; writes pstats, collapsed stacks and allocations to DIR "
+                             "(default: <output_dir>/profile/<timestamp>)")
+    common.add_argument('--profile-interval', type=float, help="stack sampling interval in seconds")
+
+    discovery = argparse.ArgumentParser(add_help=False)
+    discovery.add_argument('--initial-url', dest='initial_url', help="offers page the promotion ranges are read from")
+    discovery.add_argument('--discovery', choices=['http', 'browser'])
+    discovery.add_argument('--no-discovery-cache', dest='discovery_cache', action='store_const', const='',
+                           help="ignore and do not write the discovery cache")
+    discovery.add_argument('--sharding', choices=['category', 'timeframe'])
+
+    capturing = argparse.ArgumentParser(add_help=False)
+    capturing.add_argument('--capture', action='store_true',
+                           help="keep the fetched pages in the capture store (capture_dir) for cli.py replay")
+
+    timeframes = argparse.ArgumentParser(add_help=False)
+    timeframes.add_argument('--timeframe', action='append', metavar='KEY',
+                            help="only this timeframe, e.g. current or coming (repeatable; default: all)")
+
+    parser = argparse.ArgumentParser(description="Scrape the Hoogvliet offers, or run a single stage of the pipeline.")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='COMMAND')
+
+    command = commands.add_parser('discover', parents=[common, discovery], help="print the shards a scrape would run")
+    command.add_argument('--json', action='store_true', help="print the plan as JSON")
+    command.set_defaults(handler=command_discover)
+
+    command = commands.add_parser('scrape', parents=[common, discovery, capturing], help="discover, scrape and write the offers")
+    command.add_argument('--engine', choices=['http', 'browser'])
+    command.add_argument('--concurrency', type=int, help="shards scraped at the same time")
+    command.add_argument('--raw-dir', dest='raw_dir', help="also save the raw products of each timeframe here")
+    command.add_argument('--raw-only', action='store_true',
+                         help="only save the raw products (default directory: <output_dir>/raw), for normalize-from-raw")
+    command.add_argument('--no-incremental', dest='incremental', action='store_const', const=False,
+                         help="do not read or update the product state database")
+    command.set_defaults(handler=command_scrape)
+
+    command = commands.add_parser('normalize-from-raw', parents=[common, timeframes],
+                                  help="normalize and write raw products saved by scrape --raw-dir")
+    command.add_argument('raw_dir', nargs='?', help="directory written by scrape --raw-dir (default: <output_dir>/raw)")
+    command.add_argument('--no-incremental', dest='incremental', action='store_const', const=False,
+                         help="do not read or update the product state database")
+    command.set_defaults(handler=command_normalize)
+
+    command = commands.add_parser('child-crawl', parents=[common, timeframes, capturing],
+                                  help="fetch the child pages of the offers files and add their products "
+                                       "(--capture adds them to the latest capture run)")
+    command.add_argument('--child-rate', dest='child_rate', type=float, help="child page requests per second")
+    command.add_argument('--child-concurrency', dest='child_concurrency', type=int, help="child page requests in flight")
+    command.add_argument('--no-incremental', dest='incremental', action='store_const', const=False,
+                         help="fetch every child page and do not update the product state database")
+    command.set_defaults(handler=command_child_crawl)
+
+    command = commands.add_parser('export', parents=[common, timeframes], help="write the pretty JSON for the offers files")
+    command.add_argument('--format', choices=['json', 'sqlite'], default='json',
+                         help="json (default) rewrites the .json files; sqlite loads the offers into offers_db for cli.py query")
+    command.add_argument('--offers-db', dest='offers_db', help="database written by --format sqlite")
+    command.set_defaults(handler=command_export)
+
+    command = commands.add_parser('query', parents=[common, timeframes],
+                                  help="look offers up in the database written by export --format sqlite; "
+                                       "without a filter, list the loaded timeframes")
+    command.add_argument('--offers-db', dest='offers_db', help="database to query")
+    lookups = command.add_mutually_exclusive_group()
+    lookups.add_argument('--id', help="offers with this product id")
+    lookups.add_argument('--brand', help="offers of this brand (case-insensitive)")
+    lookups.add_argument('--min-discount', type=float, metavar='PERCENT', help="offers at least PERCENT below their former price")
+    lookups.add_argument('--active-on', metavar='YYYY-MM-DD', help="offers whose promotion week includes this day")
+    lookups.add_argument('--changes', nargs=2, metavar=('BEFORE', 'AFTER'),
+                         help="offers added, removed and repriced between two timeframes, e.g. current coming")
+    command.add_argument('--children', action='store_true', help="include child products")
+    command.add_argument('--limit', type=int, help="at most this many offers (with --min-discount)")
+    command.set_defaults(handler=command_query)
+
+    command = commands.add_parser('replay', parents=[common, timeframes],
+                                  help="rerun extraction, normalization and child merging on a captured run, offline")
+    command.add_argument('run_id', nargs='?', help="capture run to replay (default: the latest)")
+    command.add_argument('--compare', action='store_true',
+                         help="compare the replayed raw products with the captured ones; exit 1 if they differ")
+    command.add_argument('--workers', type=int, help="extraction processes (default: one per CPU)")
+    command.add_argument('--html-backend', dest='html_backend', choices=['auto', 'selectolax', 'lxml', 'html.parser'])
+    command.add_argument('--list', action='store_true', help="list the capture runs")
+    command.set_defaults(handler=command_replay)
+
+    command = commands.add_parser('daemon', parents=[common, discovery],
+                                  help="keep the engines warm and scrape whenever the promotion ranges change, "
+                                       "with a status endpoint")
+    command.add_argument('--engine', choices=['http', 'browser'])
+    command.add_argument('--concurrency', type=int, help="shards scraped at the same time")
+    command.add_argument('--host', dest='daemon_host', metavar='HOST', help="address of the status endpoint (default: 127.0.0.1)")
+    command.add_argument('--port', dest='daemon_port', type=int, metavar='PORT', help="port of the status endpoint (default: 8787)")
+    command.add_argument('--poll-interval', dest='daemon_poll_interval', type=float, metavar='SECONDS',
+                         help="seconds between polls outside the week rollover")
+    command.add_argument('--no-incremental', dest='incremental', action='store_const', const=False,
+                         help="do not read or update the product state database")
+    command.set_defaults(handler=command_daemon)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    config = configure(args)
+    handler: Callable[[argparse.Namespace], int] = args.handler
+    with ExitStack() as stack:
+        if args.profile is not None:
+            import profiling
+            profile_dir = args.profile or os.path.join(config['output_dir'], 'profile', datetime.now().strftime('%Y%m%d-%H%M%S'))
+            stack.enter_context(profiling.session(profile_dir, interval=args.profile_interval or profiling.DEFAULT_INTERVAL))
+        if getattr(args, 'capture', False):
+            import capture
+            settings = {key: config[key] for key in ('engine', 'base_url', 'initial_url', 'html_backend', 'sharding')}
+            stack.enter_context(capture.session(config['capture_dir'], append=args.command == 'child-crawl', settings=settings))
+        return handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
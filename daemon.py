@@ -0,0 +1,261 @@
+import json
+import logging
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import METRICS
+from scraper import CONFIG, build_http_client, discover_shards, scrape_run
+from sharding import Shard
+from state_store import ProductStateStore
+
+# Resident scraper (``cli.py daemon``). The driver pool, the HTTP client and
+# the state store stay open between runs. Every poll reads the promotion
+# ranges from the offers page again (a request per range over a warm
+# connection) and scrapes when they changed, when the last scrape is older than
+# daemon_refresh_interval, or on POST /refresh. Polls are every
+# daemon_poll_interval seconds, and every daemon_rollover_interval seconds in
+# the window around a week rollover: the start_date of a range, or the day
+# after its end_date.
+#
+#   GET /health    200 while the last scrape succeeded within daemon_stale_after, else 503
+#   GET /status    what the daemon is doing, its last run and its next poll
+#   GET /metrics   the metrics registry in Prometheus text format
+#   POST /refresh  scrape at once
+
+
+def rollover_times(timeframes: List[Dict[str, Any]]) -> List[datetime]:
+    """The moments the promotion ranges change: a range starts at its start_date and ends the day after its end_date."""
+    times = set()
+    for info in timeframes:
+        if info.get('start_date'):
+            times.add(datetime.fromisoformat(info['start_date']))
+        if info.get('end_date'):
+            times.add(datetime.fromisoformat(info['end_date']) + timedelta(days=1))
+    return sorted(times)
+
+
+def next_poll(now: datetime, timeframes: List[Dict[str, Any]]) -> Tuple[datetime, str]:
+    """When to look at the offers page again, and why."""
+    before = timedelta(seconds=CONFIG['daemon_rollover_before'])
+    after = timedelta(seconds=CONFIG['daemon_rollover_after'])
+    wake = now + timedelta(seconds=CONFIG['daemon_poll_interval'])
+    for boundary in rollover_times(timeframes):
+        if boundary - before <= now < boundary + after:
+            return now + timedelta(seconds=CONFIG['daemon_rollover_interval']), f"rollover {boundary:%Y-%m-%d}"
+        if now < boundary - before < wake:
+            return boundary - before, f"rollover {boundary:%Y-%m-%d}"
+    return wake, "poll"
+
+
+def range_signature(shards: List[Shard]) -> Tuple:
+    return tuple(sorted({(shard.timeframe.key, shard.timeframe.start_date, shard.timeframe.end_date, shard.timeframe.url)
+                         for shard in shards}))
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    server: 'StatusServer'
+
+    def do_GET(self):
+        daemon = self.server.daemon
+        if self.path == '/health':
+            healthy, body = daemon.health()
+            self._send(200 if healthy else 503, body)
+        elif self.path == '/status':
+            self._send(200, daemon.status())
+        elif self.path == '/metrics':
+            self._send(200, METRICS.prometheus_text(), 'text/plain; version=0.0.4')
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path == '/refresh':
+            self.server.daemon.request_refresh()
+            self._send(202, {"refresh": "queued"})
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def _send(self, code: int, body: Any, content_type: str = 'application/json'):
+        data = (body if isinstance(body, str) else json.dumps(body, indent=2)).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(f"status endpoint: {format % args}")
+
+
+class StatusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], daemon: 'Daemon'):
+        super().__init__(address, StatusHandler)
+        self.daemon = daemon
+
+
+class Daemon:
+    def __init__(self):
+        self.pool = None
+        self.client = None
+        self.store: Optional[ProductStateStore] = None
+        self.server: Optional[StatusServer] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._refresh_requested = False
+        self._signature: Optional[Tuple] = None
+        self.started = time.time()
+        self.state = 'starting'
+        self.polls = 0
+        self.runs = 0
+        self.last_poll: Optional[str] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.last_success: Optional[float] = None
+        self.timeframes: List[Dict[str, Any]] = []
+        self.next_poll: Optional[datetime] = None
+        self.next_reason: Optional[str] = None
+
+    def open(self):
+        if CONFIG['engine'] == 'browser':
+            from browser import DriverPool
+            self.pool = DriverPool(size=CONFIG['concurrency'], headless=CONFIG['headless'])
+        # Discovery goes over HTTP with either engine, so there is always a client.
+        http_connections = CONFIG['concurrency'] * CONFIG['http_max_workers'] if CONFIG['engine'] == 'http' else 1
+        self.client = build_http_client(http_connections)
+        self.store = ProductStateStore(CONFIG['state_db']) if CONFIG['incremental'] else None
+        self.server = StatusServer((CONFIG['daemon_host'], CONFIG['daemon_port']), self)
+        threading.Thread(target=self.server.serve_forever, name='status', daemon=True).start()
+        host, port = self.server.server_address[:2]
+        logging.info(f"Status endpoint on http://{host}:{port}/status")
+
+    def close(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.pool:
+            self.pool.close()
+        if self.client:
+            self.client.close()
+        if self.store:
+            self.store.close()
+
+    def stop(self, *_):
+        logging.info("Stopping the daemon once the current poll is done.")
+        self._stop.set()
+        self._wake.set()
+
+    def request_refresh(self):
+        with self._lock:
+            self._refresh_requested = True
+        self._wake.set()
+
+    def _set(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def scrape_reason(self, shards: List[Shard], now: float) -> Optional[str]:
+        with self._lock:
+            requested, self._refresh_requested = self._refresh_requested, False
+        if requested:
+            return "requested"
+        if self.last_success is None:
+            return "first run" if self.runs == 0 else "retry"
+        if range_signature(shards) != self._signature:
+            return "promotion ranges changed"
+        if now - self.last_success >= CONFIG['daemon_refresh_interval']:
+            return "refresh interval"
+        return None
+
+    def poll(self):
+        self._set(state='discovering', polls=self.polls + 1, last_poll=datetime.now().isoformat(timespec='seconds'))
+        # Past the cache, or a range going live would only be seen once the cached week ends.
+        shards = discover_shards(CONFIG['initial_url'], pool=self.pool, client=self.client, use_cache=False)
+        if not shards:
+            self._set(last_run={"reason": "discovery", "errors": 1, "finished": datetime.now().isoformat(timespec='seconds')})
+            return
+        reason = self.scrape_reason(shards, time.time())
+        if reason is None:
+            logging.info("Promotion ranges unchanged, nothing to scrape.")
+            return
+        logging.info(f"--- Scraping ({reason}) ---")
+        self._set(state='scraping')
+        # The run report covers one run, so the registry starts empty each time.
+        METRICS.reset()
+        run = scrape_run(self.pool, self.client, self.store, shards=shards)
+        finished = time.time()
+        run.update(reason=reason, finished=datetime.fromtimestamp(finished).isoformat(timespec='seconds'))
+        self._set(runs=self.runs + 1, last_run=run, timeframes=run['timeframes'])
+        if not run['errors']:
+            self._set(last_success=finished)
+            self._signature = range_signature(shards)
+        elif self.pool:
+            # A failed browser run may have left Chrome in a bad state; the next run starts fresh drivers.
+            self.pool.close()
+            from browser import DriverPool
+            self.pool = DriverPool(size=CONFIG['concurrency'], headless=CONFIG['headless'])
+
+    def schedule(self) -> Tuple[datetime, str]:
+        now = datetime.now()
+        wake, reason = next_poll(now, self.timeframes)
+        last_run = self.last_run or {}
+        if last_run.get('errors'):
+            retry = now + timedelta(seconds=CONFIG['daemon_retry_interval'])
+            if retry < wake:
+                wake, reason = retry, "retry"
+        return wake, reason
+
+    def run(self) -> int:
+        handlers = {sig: signal.signal(sig, self.stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            self.open()
+            while not self._stop.is_set():
+                try:
+                    self.poll()
+                except Exception as exc:
+                    logging.error(f"Daemon poll failed: {exc}", exc_info=True)
+                    self._set(last_run={"reason": "poll", "errors": 1, "error": str(exc),
+                                        "finished": datetime.now().isoformat(timespec='seconds')})
+                wake, reason = self.schedule()
+                self._set(state='idle', next_poll=wake, next_reason=reason)
+                METRICS.set('daemon_next_poll_timestamp_seconds', wake.timestamp())
+                logging.info(f"Next poll at {wake:%Y-%m-%d %H:%M:%S} ({reason})")
+                self._wake.wait(max(0.0, (wake - datetime.now()).total_seconds()))
+                self._wake.clear()
+        finally:
+            self._set(state='stopping')
+            self.close()
+            for sig, handler in handlers.items():
+                signal.signal(sig, handler)
+        return 0
+
+    def health(self) -> Tuple[bool, Dict[str, Any]]:
+        with self._lock:
+            if self.last_success is None:
+                status = 'starting' if self.runs == 0 and not self.last_run else 'failing'
+                return False, {"status": status, "state": self.state}
+            age = time.time() - self.last_success
+        if age > CONFIG['daemon_stale_after']:
+            return False, {"status": "stale", "state": self.state, "last_success_age_seconds": round(age)}
+        return True, {"status": "ok", "state": self.state, "last_success_age_seconds": round(age)}
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state, "engine": CONFIG['engine'],
+                "started": datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                "uptime_seconds": round(time.time() - self.started), "polls": self.polls, "runs": self.runs,
+                "last_poll": self.last_poll, "last_run": self.last_run,
+                "last_success": datetime.fromtimestamp(self.last_success).isoformat(timespec='seconds') if self.last_success else None,
+                "next_poll": self.next_poll.isoformat(timespec='seconds') if self.next_poll else None,
+                "next_reason": self.next_reason, "timeframes": self.timeframes,
+            }
+
+
+def run_daemon() -> int:
+    return Daemon().run()
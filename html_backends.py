@@ -0,0 +1,307 @@
+import json
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+from models import RawProduct
+
+# Product extraction on top of interchangeable HTML parsers. The field logic
+# lives in extract_product_info and only talks to a backend through select /
+# select_one / attr / text / outer_html, so every backend yields the same
+# RawProduct records. "html.parser" is the reference (BeautifulSoup with
+# Python's parser); "lxml" and "selectolax" are C parsers whose text and
+# outer_html mimic what BeautifulSoup returns, since the raw price fragments
+# are hashed and parsed downstream. One known difference: libxml2 expands
+# valueless boolean attributes (disabled, checked, ...) to disabled="disabled"
+# under lxml.
+
+PRODUCT_SELECTOR = '.product-list-item'
+BACKENDS = ('selectolax', 'lxml', 'html.parser')
+
+# Elements BeautifulSoup serializes as <br/>, and elements whose strings it
+# leaves out of .text.
+VOID_ELEMENTS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer',
+})
+RAW_TEXT_ELEMENTS = frozenset({'script', 'style', 'template'})
+# Attributes BeautifulSoup splits on whitespace and joins with single spaces.
+MULTI_VALUED_ATTRIBUTES = {
+    '*': {'class', 'accesskey', 'dropzone'},
+    'a': {'rel', 'rev'}, 'link': {'rel', 'rev'}, 'area': {'rel'},
+    'td': {'headers'}, 'th': {'headers'}, 'form': {'accept-charset'}, 'object': {'archive'},
+    'icon': {'sizes'}, 'iframe': {'sandbox'}, 'output': {'for'},
+}
+NON_WHITESPACE_RE = re.compile(r'\S+')
+
+
+def _escape_text(text: str) -> str:
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _format_attribute(tag: str, name: str, value: Optional[str]) -> str:
+    value = value or ''
+    if name in MULTI_VALUED_ATTRIBUTES['*'] or name in MULTI_VALUED_ATTRIBUTES.get(tag, ()):
+        value = ' '.join(NON_WHITESPACE_RE.findall(value))
+    value = _escape_text(value)
+    if '"' not in value:
+        return f' {name}="{value}"'
+    if "'" not in value:
+        return f" {name}='{value}'"
+    return ' {}="{}"'.format(name, value.replace('"', '&quot;'))
+
+
+def _start_tag(tag: str, attributes) -> str:
+    # BeautifulSoup's default formatter writes attributes in sorted order.
+    attrs = ''.join(_format_attribute(tag, name, value) for name, value in sorted(attributes))
+    return f"<{tag}{attrs}/>" if tag in VOID_ELEMENTS else f"<{tag}{attrs}>"
+
+
+class SoupBackend:
+    name = 'html.parser'
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+
+    def parse(self, html: str):
+        return self._soup(html, 'html.parser')
+
+    def select(self, node, selector: str) -> List:
+        return node.select(selector)
+
+    def select_one(self, node, selector: str):
+        return node.select_one(selector)
+
+    def attr(self, node, name: str) -> Optional[str]:
+        return node.get(name)
+
+    def text(self, node) -> str:
+        return node.text
+
+    def outer_html(self, node) -> str:
+        return str(node)
+
+
+def _class_predicate(class_name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+def _compound_predicate(compound: str) -> str:
+    tag, *classes = compound.split('.')
+    tests = [f"name()='{tag}'"] if tag else []
+    tests.extend(_class_predicate(class_name) for class_name in classes)
+    return ' and '.join(tests) or 'true()'
+
+
+@lru_cache(maxsize=None)
+def css_to_xpath(selector: str) -> str:
+    """Translates the descendant/class selectors used for product pages to XPath.
+
+    Like soupsieve, only the last compound must be below the context node; the
+    ones before it may match any ancestor.
+    """
+    paths = []
+    for group in selector.split(','):
+        *ancestors, target = group.split()
+        predicates = [_compound_predicate(target)]
+        # Each compound must appear above the one that follows it.
+        chain = ''
+        for compound in ancestors:
+            chain = f"ancestor::*[{_compound_predicate(compound)}{' and ' + chain if chain else ''}]"
+        if chain:
+            predicates.append(chain)
+        paths.append(f"descendant::*[{' and '.join(predicates)}]")
+    return ' | '.join(paths)
+
+
+class LxmlBackend:
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.html
+        from lxml import etree
+        self._lxml_html = lxml.html
+        self._comment = etree.Comment
+
+    def parse(self, html: str):
+        return self._lxml_html.document_fromstring(html)
+
+    def select(self, node, selector: str) -> List:
+        return node.xpath(css_to_xpath(selector))
+
+    def select_one(self, node, selector: str):
+        matches = node.xpath(css_to_xpath(selector))
+        return matches[0] if matches else None
+
+    def attr(self, node, name: str) -> Optional[str]:
+        return node.get(name)
+
+    def text(self, node) -> str:
+        parts = []
+        self._collect_text(node, parts)
+        return ''.join(parts)
+
+    def _collect_text(self, node, parts: List[str]):
+        if node.text and node.tag not in RAW_TEXT_ELEMENTS:
+            parts.append(node.text)
+        for child in node:
+            if isinstance(child.tag, str):
+                self._collect_text(child, parts)
+            if child.tail:
+                parts.append(child.tail)
+
+    def outer_html(self, node) -> str:
+        parts = []
+        self._serialize(node, parts)
+        return ''.join(parts)
+
+    def _serialize(self, node, parts: List[str]):
+        if not isinstance(node.tag, str):
+            # Comments and processing instructions.
+            parts.append(f"<!--{node.text or ''}-->" if node.tag is self._comment else '')
+            return
+        parts.append(_start_tag(node.tag, node.items()))
+        if node.tag in VOID_ELEMENTS:
+            return
+        if node.text:
+            parts.append(node.text if node.tag in RAW_TEXT_ELEMENTS else _escape_text(node.text))
+        for child in node:
+            self._serialize(child, parts)
+            if child.tail:
+                parts.append(_escape_text(child.tail))
+        parts.append(f"</{node.tag}>")
+
+
+class SelectolaxBackend:
+    name = 'selectolax'
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+
+    def parse(self, html: str):
+        # Without a doctype Lexbor parses in quirks mode, where class selectors match case-insensitively;
+        # soupsieve and lxml always compare classes case-sensitively.
+        if not html.lstrip()[:9].lower().startswith('<!doctype'):
+            html = '<!DOCTYPE html>' + html
+        return self._parser(html)
+
+    def select(self, node, selector: str) -> List:
+        # Lexbor includes the context node itself when it matches; soupsieve does not.
+        matches = node.css(selector)
+        if matches and getattr(node, 'mem_id', None) is not None:
+            matches = [match for match in matches if match.mem_id != node.mem_id]
+        return matches
+
+    def select_one(self, node, selector: str):
+        matches = self.select(node, selector)
+        return matches[0] if matches else None
+
+    def attr(self, node, name: str) -> Optional[str]:
+        attributes = node.attributes
+        if name not in attributes:
+            return None
+        return attributes[name] or ''
+
+    def text(self, node) -> str:
+        parts = []
+        self._collect_text(node, parts)
+        return ''.join(parts)
+
+    def _collect_text(self, node, parts: List[str]):
+        for child in node.iter(include_text=True):
+            if child.tag == '-text':
+                parts.append(child.text_content)
+            elif not child.tag.startswith('-') and child.tag not in RAW_TEXT_ELEMENTS:
+                self._collect_text(child, parts)
+
+    def outer_html(self, node) -> str:
+        parts = []
+        self._serialize(node, parts)
+        return ''.join(parts)
+
+    def _serialize(self, node, parts: List[str], raw_text: bool = False):
+        tag = node.tag
+        if tag == '-text':
+            parts.append(node.text_content if raw_text else _escape_text(node.text_content))
+            return
+        if tag == '-comment':
+            # comment_content is stripped; the node's own HTML keeps the comment as written.
+            parts.append(node.html)
+            return
+        if tag.startswith('-'):
+            return
+        parts.append(_start_tag(tag, node.attributes.items()))
+        if tag in VOID_ELEMENTS:
+            return
+        for child in node.iter(include_text=True):
+            self._serialize(child, parts, raw_text=tag in RAW_TEXT_ELEMENTS)
+        parts.append(f"</{tag}>")
+
+
+BACKEND_CLASSES = {
+    'html.parser': SoupBackend,
+    'lxml': LxmlBackend,
+    'selectolax': SelectolaxBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: str = 'auto'):
+    """Returns the named backend; "auto" picks the fastest one that is installed."""
+    if name != 'auto':
+        if name not in BACKEND_CLASSES:
+            raise ValueError(f"Unknown HTML backend: {name!r} (expected one of {', '.join(BACKEND_CLASSES)} or 'auto')")
+        return BACKEND_CLASSES[name]()
+    for candidate in BACKENDS:
+        try:
+            return BACKEND_CLASSES[candidate]()
+        except ImportError:
+            continue
+    raise ImportError("No HTML parser backend is available")
+
+
+def extract_product_info(product_element, backend) -> RawProduct:
+    product_data = {}
+    try:
+        track_click_attr = backend.attr(product_element, 'data-track-click')
+        if track_click_attr:
+            track_data = json.loads(track_click_attr)
+            product_info = track_data.get('products', [{}])[0]
+            product_data['id'] = product_info.get('id')
+            product_data['brand'] = product_info.get('brand')
+    except (json.JSONDecodeError, IndexError, KeyError):
+        product_data['id'], product_data['brand'] = None, None
+    name_elem = backend.select_one(product_element, '.product-title h3')
+    product_data['name'] = backend.text(name_elem).strip() if name_elem is not None else 'N/A'
+    price_now_elem = backend.select_one(product_element, '.non-strikethrough')
+    price_was_elem = backend.select_one(product_element, '.strikethrough')
+    if price_was_elem is not None:
+        product_data['price_now_raw'] = backend.outer_html(price_now_elem) if price_now_elem is not None else None
+        product_data['price_was_raw'] = backend.outer_html(price_was_elem)
+    else:
+        standard_price_container = backend.select_one(product_element, '.kor-product-sale-price')
+        product_data['price_now_raw'] = backend.outer_html(standard_price_container) if standard_price_container is not None else None
+        product_data['price_was_raw'] = None
+    promo_elem = backend.select_one(product_element, '.promotion-short-title')
+    product_data['promotion'] = backend.text(promo_elem).strip() if promo_elem is not None else None
+    img_elem = backend.select_one(product_element, 'img.product-image')
+    product_data['image_url'] = backend.attr(img_elem, 'src') if img_elem is not None else 'N/A'
+    link_elem = backend.select_one(product_element, 'a.product-title, .product-image-container a')
+    product_data['source_url'] = backend.attr(link_elem, 'href') if link_elem is not None else 'N/A'
+    desc_elem = backend.select_one(product_element, '.Short-Description')
+    product_data['description'] = backend.text(desc_elem).strip() if desc_elem is not None else None
+    parent_link_elem = backend.select_one(product_element, '.promotion-btn a.btn')
+    product_data['child_page_url'] = backend.attr(parent_link_elem, 'href') if parent_link_elem is not None else None
+    return RawProduct(**product_data)
+
+
+def extract_products(html: str, backend: str = 'auto') -> List[RawProduct]:
+    """Parses a page (or page fragment) and returns the raw record of every product on it."""
+    parser = get_backend(backend)
+    if not html.strip():
+        return []
+    root = parser.parse(html)
+    return [extract_product_info(elem, parser) for elem in parser.select(root, PRODUCT_SELECTOR)]
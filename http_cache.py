@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+# Child pages barely change within a promotion week, so responses are kept on
+# disk per URL and promotion range. Fresh entries are served without touching
+# the network, stale ones are revalidated with ETag/Last-Modified, and the
+# store is trimmed least-recently-used first once it grows past max_bytes.
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class CachedResponse:
+    def __init__(self, body: str, etag: Optional[str], last_modified: Optional[str], fetched_at: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    MODES = ('normal', 'replay', 'off')
+
+    def __init__(self, path: str, ttl: float = 6 * 3600, max_bytes: int = 200 * 1024 * 1024, mode: str = 'normal'):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " body BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+    @staticmethod
+    def cache_key(url: str, scope: str = '') -> str:
+        return hashlib.sha1(f"{scope}\n{url}".encode('utf-8')).hexdigest()
+
+    def get(self, url: str, scope: str = '') -> Optional[CachedResponse]:
+        if self.mode == 'off':
+            return None
+        key = self.cache_key(url, scope)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return CachedResponse(zlib.decompress(row[0]).decode('utf-8'), row[1], row[2], row[3])
+
+    def put(self, url: str, scope: str, body: str, headers) -> None:
+        if self.mode != 'normal':
+            return
+        compressed = zlib.compress(body.encode('utf-8'), 6)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, url, body, size, etag, last_modified, fetched_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.cache_key(url, scope), url, compressed, len(compressed),
+                 headers.get('ETag'), headers.get('Last-Modified'), now, now))
+            self._conn.commit()
+            self._evict()
+
+    def touch(self, url: str, scope: str, headers) -> None:
+        # A 304 means the stored body is still current; restart its TTL.
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET fetched_at = ?, etag = COALESCE(?, etag),"
+                " last_modified = COALESCE(?, last_modified) WHERE key = ?",
+                (time.time(), headers.get('ETag'), headers.get('Last-Modified'), self.cache_key(url, scope)))
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self._conn.commit()
+        self.stats['evicted'] += len(evicted)
+
+    def lookup(self, url: str, scope: str = '') -> Tuple[Optional[CachedResponse], bool]:
+        """The stored response and whether it can be served without the network.
+
+        Counts the hit, and raises CacheMiss (counted as a miss) in replay mode
+        when the page was never cached. Every fetch path goes through here,
+        ``revalidated`` and ``store`` so the stats cover them all.
+        """
+        cached = self.get(url, scope)
+        if cached and (self.mode == 'replay' or cached.is_fresh(self.ttl)):
+            self._count('hits')
+            return cached, True
+        if self.mode == 'replay':
+            self._count('misses')
+            raise CacheMiss(url)
+        return cached, False
+
+    def revalidated(self, url: str, scope: str, headers) -> None:
+        self._count('revalidated')
+        self.touch(url, scope, headers)
+
+    def store(self, url: str, scope: str, body: str, headers) -> None:
+        self._count('misses')
+        self.put(url, scope, body, headers)
+
+    def fetch(self, session, url: str, scope: str = '', timeout: Optional[float] = None, before_request=None) -> str:
+        """Returns the body of ``url`` from the cache or the network.
+
+        ``session`` is anything with a requests-style ``get``; ``before_request``
+        runs only when the network is actually used (e.g. a politeness delay).
+        Raises CacheMiss in replay mode when the page was never cached.
+        """
+        cached, servable = self.lookup(url, scope)
+        if servable:
+            return cached.body
+
+        if before_request:
+            before_request()
+        headers = cached.conditional_headers() if cached else {}
+        response = session.get(url, headers=headers, timeout=timeout)
+        if cached and response.status_code == 304:
+            self.revalidated(url, scope, response.headers)
+            return cached.body
+        response.raise_for_status()
+        self.store(url, scope, response.text, response.headers)
+        return response.text
+
+    def log_stats(self) -> None:
+        logging.info(f"HTTP cache: {self.stats['hits']} hits, {self.stats['revalidated']} revalidated, "
+                     f"{self.stats['misses']} fetched, {self.stats['evicted']} evicted.")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,63 @@
+import logging
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import brotli  # noqa: F401  (urllib3 only decodes br when it is installed)
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+def build_session(cookies: List[Dict], pool_size: int, user_agent: Optional[str] = None,
+                  retries: int = 3, backoff_factor: float = 0.5) -> requests.Session:
+    """One keep-alive session for all child page workers.
+
+    The connection pool is sized to the worker count so every worker keeps its
+    own warm connection, and transient 429/5xx answers are retried with backoff
+    inside the pool instead of failing the page.
+    """
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff_factor,
+                  status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset({'GET', 'HEAD'}),
+                  respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=max(pool_size, 1), pool_maxsize=max(pool_size, 1),
+                          max_retries=retry, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({"Accept-Encoding": ACCEPT_ENCODING, "Connection": "keep-alive"})
+    if user_agent:
+        session.headers["User-Agent"] = user_agent
+    for cookie in cookies:
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+    return session
+
+
+def connection_stats(session: requests.Session) -> Dict[str, int]:
+    stats = {"requests": 0, "connections": 0}
+    seen = set()
+    for adapter in session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        # keys() and item access are the container's public, locked API (iterating it directly raises).
+        for key in pools.keys():
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue  # evicted since keys() was taken
+            stats['requests'] += pool.num_requests
+            stats['connections'] += pool.num_connections
+    stats['reused'] = max(stats['requests'] - stats['connections'], 0)
+    return stats
+
+
+def log_connection_stats(session: requests.Session) -> None:
+    stats = connection_stats(session)
+    if stats['requests']:
+        logging.info(f"HTTP session: {stats['requests']} requests over {stats['connections']} connections "
+                     f"({stats['reused'] / stats['requests']:.0%} reused).")
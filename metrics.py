@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+# Run-wide instrumentation. Stages record their durations into histograms
+# keyed by name and labels, next to plain counters and gauges. At the end of a
+# run the registry is written as a JSON run report and as a Prometheus textfile
+# for node_exporter's textfile collector.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.items = 0
+
+    def observe(self, value: float, items: int = 0):
+        self.count += 1
+        self.sum += value
+        self.items += items
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[index] += 1
+                break
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {
+            "count": self.count, "seconds": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "min": self.min, "max": self.max, "p50": self.quantile(0.5), "p95": self.quantile(0.95),
+        }
+        if self.items:
+            summary['items'] = self.items
+            summary['seconds_per_item'] = round(self.sum / self.items, 9)
+        return summary
+
+
+class Timing:
+    """Handed out by Metrics.timer; set ``items`` to get a per-item figure."""
+
+    def __init__(self):
+        self.items = 0
+        self.seconds = 0.0
+
+
+class TimedIterator:
+    """Wraps an iterator and records the time spent producing its items as one observation."""
+
+    def __init__(self, metrics: 'Metrics', iterable: Iterable, name: str, labels: Dict[str, Any]):
+        self.metrics = metrics
+        self.iterator = iter(iterable)
+        self.name = name
+        self.labels = labels
+        self.elapsed = 0.0
+        self.items = 0
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self.iterator)
+        except StopIteration:
+            self.elapsed += time.perf_counter() - start
+            self.metrics.observe(self.name, self.elapsed, items=self.items, **self.labels)
+            raise
+        self.elapsed += time.perf_counter() - start
+        self.items += 1
+        return item
+
+
+class Metrics:
+    def __init__(self, namespace: str = 'hoogvliet'):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+            self.counters: Dict[str, Dict[LabelKey, float]] = {}
+            self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+            self.started = time.time()
+
+    def observe(self, name: str, seconds: float, items: int = 0, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(seconds, items)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        timing = Timing()
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing.seconds = time.perf_counter() - start
+            self.observe(name, timing.seconds, items=timing.items, **labels)
+
+    def timed_iter(self, iterable: Iterable, name: str, **labels) -> TimedIterator:
+        return TimedIterator(self, iterable, name, labels)
+
+    def report(self, run: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        run = dict(run or {})
+        duration = run.get('duration_seconds') or time.time() - self.started
+        with self._lock:
+            stages = {}
+            for name, series in sorted(self.histograms.items()):
+                entries = []
+                for key, histogram in series.items():
+                    entry = dict(labels=dict(key), **histogram.summary())
+                    # Stages run in parallel threads, so shares can add up to more than 1.
+                    entry['share_of_run'] = round(histogram.sum / duration, 4) if duration else None
+                    entries.append(entry)
+                stages[name] = sorted(entries, key=lambda entry: -entry['seconds'])
+            counters = {name: [dict(labels=dict(key), value=value) for key, value in series.items()]
+                        for name, series in sorted(self.counters.items())}
+            gauges = {name: [dict(labels=dict(key), value=value) for key, value in series.items()]
+                      for name, series in sorted(self.gauges.items())}
+        return {"run": run, "stages": stages, "counters": counters, "gauges": gauges}
+
+    def prometheus_text(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.histograms.items()):
+                metric = f"{self.namespace}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{_format_labels(key, ('le', repr(bound)))} {cumulative}")
+                    lines.append(f"{metric}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{metric}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{metric}_count{_format_labels(key)} {histogram.count}")
+                if any(histogram.items for histogram in series.values()):
+                    items_metric = f"{self.namespace}_{name}_items_total"
+                    lines.append(f"# TYPE {items_metric} counter")
+                    lines.extend(f"{items_metric}{_format_labels(key)} {histogram.items}" for key, histogram in series.items())
+            for name, series in sorted(self.counters.items()):
+                metric = f"{self.namespace}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f"{metric}{_format_labels(key)} {value:g}" for key, value in series.items())
+            for name, series in sorted(self.gauges.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.extend(f"{metric}{_format_labels(key)} {value:g}" for key, value in series.items())
+        return '\n'.join(lines) + '\n'
+
+    def finish_run(self, run: Dict[str, Any], report_path: Optional[str] = None, textfile_path: Optional[str] = None):
+        """Records the run totals as gauges and writes whichever outputs are configured."""
+        self.set('run_duration_seconds', run['duration_seconds'])
+        self.set('run_products', run.get('products', 0))
+        self.set('run_errors', run.get('errors', 0))
+        self.set('last_run_timestamp_seconds', time.time())
+        try:
+            if report_path:
+                self.write_json(report_path, run)
+                logging.info(f"Run report written to {report_path}")
+            if textfile_path:
+                self.write_prometheus(textfile_path)
+        except OSError as e:
+            logging.error(f"Could not write run metrics: {e}")
+
+    def write_json(self, path: str, run: Optional[Dict[str, Any]] = None):
+        _write_atomic(path, json.dumps(self.report(run), indent=2))
+
+    def write_prometheus(self, path: str):
+        # The textfile collector may read at any time, so never expose a half-written file.
+        _write_atomic(path, self.prometheus_text())
+
+
+def _write_atomic(path: str, text: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    partial_path = path + '.part'
+    with open(partial_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(partial_path, path)
+
+
+METRICS = Metrics()
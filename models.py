@@ -0,0 +1,147 @@
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+# Compact product records. A dict per product costs several hundred bytes
+# before its values; since Python 3.11 a plain instance keeps its attributes
+# in a fixed inline array instead. Values that repeat across a catalog
+# (brands, promotion texts, price fragments, dates, child page URLs) are
+# interned, so every record shares one copy of each.
+#
+# The classes are dataclasses so orjson encodes them, children included,
+# without calling back into Python per record. They deliberately have no
+# __slots__: orjson reads slotted dataclasses field by field, which is no
+# faster than the to_json hook (see bench/bench_models.py).
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+@dataclass(init=False, repr=False)
+class RawProduct:
+    """Product fields as extracted from the page, before normalization."""
+
+    FIELDS = ('id', 'brand', 'name', 'price_now_raw', 'price_was_raw', 'promotion',
+              'image_url', 'source_url', 'description', 'child_page_url')
+    id: Optional[str]
+    brand: Optional[str]
+    name: Optional[str]
+    price_now_raw: Optional[str]
+    price_was_raw: Optional[str]
+    promotion: Optional[str]
+    image_url: Optional[str]
+    source_url: Optional[str]
+    description: Optional[str]
+    child_page_url: Optional[str]
+
+    def __init__(self, id: Optional[str] = None, brand: Optional[str] = None, name: Optional[str] = None,
+                 price_now_raw: Optional[str] = None, price_was_raw: Optional[str] = None,
+                 promotion: Optional[str] = None, image_url: Optional[str] = None, source_url: Optional[str] = None,
+                 description: Optional[str] = None, child_page_url: Optional[str] = None):
+        self.id = id
+        self.brand = _intern(brand)
+        self.name = name
+        self.price_now_raw = _intern(price_now_raw)
+        self.price_was_raw = _intern(price_was_raw)
+        self.promotion = _intern(promotion)
+        self.image_url = image_url
+        self.source_url = source_url
+        self.description = description
+        self.child_page_url = _intern(child_page_url)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'RawProduct':
+        return cls(**{field: data.get(field) for field in cls.FIELDS})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self) -> str:
+        return f"RawProduct(id={self.id!r}, name={self.name!r})"
+
+    def __reduce__(self):
+        # Rebuild through __init__ so records coming back from worker processes are interned again.
+        return RawProduct, tuple(getattr(self, field) for field in self.FIELDS)
+
+
+@dataclass(init=False, repr=False)
+class Product:
+    """A normalized product; ``to_dict`` gives the records written to the output files."""
+
+    FIELDS = ('id', 'brand', 'title', 'description', 'promotion', 'price_now', 'price_was', 'image_url',
+              'source_url', 'child_page_url', 'start_date', 'end_date', 'child_products')
+    id: Optional[str]
+    brand: Optional[str]
+    title: Optional[str]
+    description: Optional[str]
+    promotion: Optional[str]
+    price_now: Optional[str]
+    price_was: Optional[str]
+    image_url: Optional[str]
+    source_url: Optional[str]
+    child_page_url: Optional[str]
+    start_date: Optional[str]
+    end_date: Optional[str]
+    child_products: List['Product']
+
+    def __init__(self, id: Optional[str] = None, brand: Optional[str] = None, title: Optional[str] = None,
+                 description: Optional[str] = None, promotion: Optional[str] = None, price_now: Optional[str] = None,
+                 price_was: Optional[str] = None, image_url: Optional[str] = None, source_url: Optional[str] = None,
+                 child_page_url: Optional[str] = None, start_date: Optional[str] = None,
+                 end_date: Optional[str] = None, child_products: Optional[List['Product']] = None):
+        self.id = id
+        self.brand = _intern(brand)
+        self.title = title
+        self.description = description
+        self.promotion = _intern(promotion)
+        self.price_now = _intern(price_now)
+        self.price_was = _intern(price_was)
+        self.image_url = image_url
+        self.source_url = source_url
+        self.child_page_url = _intern(child_page_url)
+        self.start_date = _intern(start_date)
+        self.end_date = _intern(end_date)
+        self.child_products = child_products if child_products is not None else []
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Product':
+        fields = {field: data.get(field) for field in cls.FIELDS}
+        fields['child_products'] = [cls.from_dict(child) for child in data.get('child_products') or []]
+        return cls(**fields)
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = self.shallow_dict()
+        record['child_products'] = [child.to_dict() for child in self.child_products]
+        return record
+
+    def shallow_dict(self) -> Dict[str, Any]:
+        """The output record with ``child_products`` still holding Product objects."""
+        return {
+            "id": self.id,
+            "brand": self.brand,
+            "title": self.title,
+            "description": self.description,
+            "promotion": self.promotion,
+            "price_now": self.price_now,
+            "price_was": self.price_was,
+            "image_url": self.image_url,
+            "source_url": self.source_url,
+            "child_page_url": self.child_page_url,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "child_products": self.child_products,
+        }
+
+    def __repr__(self) -> str:
+        return f"Product(id={self.id!r}, title={self.title!r})"
+
+
+def to_json(obj: Any) -> Dict[str, Any]:
+    """``default`` hook for the json module, so records can be encoded without converting them first."""
+    if type(obj) is Product:
+        # The encoder calls back here for each child, so no nested dicts are built up front.
+        return obj.shallow_dict()
+    if type(obj) is RawProduct:
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+# Indexed copy of the offers files (``cli.py export --format sqlite``), so
+# questions like "all offers of brand X" or "discount over 30%" are index
+# lookups instead of a scan of the full JSON. Every listed offer and every
+# child product is a row; child rows carry the id of their parent in
+# parent_id. ``record`` holds the output record as written to the offers file.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS timeframes (
+    key TEXT PRIMARY KEY,
+    start_date TEXT,
+    end_date TEXT,
+    offers INTEGER NOT NULL,
+    loaded_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS offers (
+    timeframe TEXT NOT NULL,
+    id TEXT,
+    parent_id TEXT,
+    brand TEXT,
+    title TEXT,
+    price_now REAL,
+    price_was REAL,
+    discount REAL,
+    start_date TEXT,
+    end_date TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS offers_id ON offers (id, timeframe);
+CREATE INDEX IF NOT EXISTS offers_timeframe ON offers (timeframe, parent_id);
+CREATE INDEX IF NOT EXISTS offers_brand ON offers (brand COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS offers_dates ON offers (start_date, end_date);
+CREATE INDEX IF NOT EXISTS offers_discount ON offers (discount);
+"""
+
+COLUMNS = "timeframe, id, parent_id, brand, title, price_now, price_was, discount, start_date, end_date, record"
+
+
+def to_price(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def discount_percent(price_now: Optional[float], price_was: Optional[float]) -> Optional[float]:
+    """How much below ``price_was`` the offer is, in percent; None without a higher former price."""
+    if price_now is None or not price_was or price_now >= price_was:
+        return None
+    return round((price_was - price_now) / price_was * 100, 1)
+
+
+class OfferStore:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _row(self, timeframe: str, record: Dict[str, Any], parent_id: Optional[str], text: str) -> tuple:
+        price_now, price_was = to_price(record.get('price_now')), to_price(record.get('price_was'))
+        return (timeframe, record.get('id'), parent_id, record.get('brand'), record.get('title'), price_now, price_was,
+                discount_percent(price_now, price_was), record.get('start_date'), record.get('end_date'), text)
+
+    def load(self, timeframe: str, records: Iterable[Dict[str, Any]]) -> int:
+        """Replaces the offers of ``timeframe`` with ``records`` (output records, children included) in one transaction."""
+        rows = []
+        offers = 0
+        start_date = end_date = None
+        for record in records:
+            offers += 1
+            start_date, end_date = record.get('start_date'), record.get('end_date')
+            rows.append(self._row(timeframe, record, None, json.dumps(record, ensure_ascii=False)))
+            for child in record.get('child_products') or []:
+                rows.append(self._row(timeframe, child, record.get('id'), json.dumps(child, ensure_ascii=False)))
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM offers WHERE timeframe = ?", (timeframe,))
+                self._conn.executemany(f"INSERT INTO offers ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._conn.execute("INSERT OR REPLACE INTO timeframes (key, start_date, end_date, offers, loaded_at) "
+                                   "VALUES (?, ?, ?, ?, ?)", (timeframe, start_date, end_date, offers, time.time()))
+        return offers
+
+    def _select(self, where: str, params: tuple, timeframe: Optional[str], children: bool,
+                order: str = "", limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        if timeframe is not None:
+            where += " AND timeframe = ?"
+            params += (timeframe,)
+        if not children:
+            where += " AND parent_id IS NULL"
+        sql = f"SELECT timeframe, parent_id, discount, record FROM offers WHERE {where}{order}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        results = []
+        for timeframe_key, parent_id, discount, record in rows:
+            result = json.loads(record)
+            result.update(timeframe=timeframe_key, parent_id=parent_id, discount=discount)
+            results.append(result)
+        return results
+
+    def get(self, product_id: str, timeframe: Optional[str] = None, children: bool = False) -> List[Dict[str, Any]]:
+        """The offers with this id, one per timeframe (and per parent, with ``children``)."""
+        return self._select("id = ?", (product_id,), timeframe, children)
+
+    def by_brand(self, brand: str, timeframe: Optional[str] = None, children: bool = False) -> List[Dict[str, Any]]:
+        return self._select("brand = ? COLLATE NOCASE", (brand,), timeframe, children)
+
+    def with_discount(self, min_percent: float, timeframe: Optional[str] = None, children: bool = False,
+                      limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Offers at least ``min_percent`` below their former price, largest discount first."""
+        return self._select("discount >= ?", (min_percent,), timeframe, children, " ORDER BY discount DESC", limit)
+
+    def active_on(self, day: str, children: bool = False) -> List[Dict[str, Any]]:
+        """Offers whose promotion week includes ``day`` (YYYY-MM-DD)."""
+        return self._select("start_date <= ? AND end_date >= ?", (day, day), None, children)
+
+    def changes(self, before: str = 'current', after: str = 'coming') -> Dict[str, List[Dict[str, Any]]]:
+        """What changes from one timeframe to the next: offers added, offers removed and price changes, by id."""
+        with self._lock:
+            added = self._conn.execute(
+                "SELECT b.record FROM offers b WHERE b.timeframe = ? AND b.parent_id IS NULL AND NOT EXISTS "
+                "(SELECT 1 FROM offers a WHERE a.id = b.id AND a.timeframe = ? AND a.parent_id IS NULL)",
+                (after, before)).fetchall()
+            removed = self._conn.execute(
+                "SELECT a.record FROM offers a WHERE a.timeframe = ? AND a.parent_id IS NULL AND NOT EXISTS "
+                "(SELECT 1 FROM offers b WHERE b.id = a.id AND b.timeframe = ? AND b.parent_id IS NULL)",
+                (before, after)).fetchall()
+            changed = self._conn.execute(
+                "SELECT a.id, a.price_now, a.price_was, b.price_now, b.price_was FROM offers a "
+                "JOIN offers b ON b.id = a.id AND b.timeframe = ? AND b.parent_id IS NULL "
+                "WHERE a.timeframe = ? AND a.parent_id IS NULL "
+                "AND (a.price_now IS NOT b.price_now OR a.price_was IS NOT b.price_was)",
+                (after, before)).fetchall()
+        return {
+            "added": [json.loads(row[0]) for row in added],
+            "removed": [json.loads(row[0]) for row in removed],
+            "price_changed": [{"id": row[0], "before": {"price_now": row[1], "price_was": row[2]},
+                               "after": {"price_now": row[3], "price_was": row[4]}} for row in changed],
+        }
+
+    def timeframes(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, start_date, end_date, offers, loaded_at FROM timeframes ORDER BY start_date")
+            return [{"key": row[0], "start_date": row[1], "end_date": row[2], "offers": row[3], "loaded_at": row[4]}
+                    for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,114 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from html_backends import extract_products
+from metrics import METRICS
+from models import RawProduct
+import profiling
+
+# Fetching is I/O bound and parsing is CPU bound. Running both on the same
+# GIL-bound threads lets HTML parsing stall the fetchers, so the pipeline
+# hands fetched pages through a bounded queue to a process pool:
+#
+#   fetch threads / event loop --(queue, maxsize)--> dispatcher --(slots)--> parser processes
+#
+# When the parsers fall behind, the dispatcher stops taking pages, the queue
+# fills up and emit() blocks the fetchers until there is room again.
+
+_DONE = object()
+
+
+def parse_child_html(url: str, html: str, backend: str = 'auto') -> List[RawProduct]:
+    return extract_products(html, backend)
+
+
+def _timed_call(parse_fn: Callable[[str, str], Any], url: str, html: str) -> Tuple[Any, float]:
+    start = time.process_time()
+    result = parse_fn(url, html)
+    return result, time.process_time() - start
+
+
+class ParsePipeline:
+    def __init__(self, parse_fn: Callable[[str, str], Any] = parse_child_html, workers: int = 2, queue_size: int = 32):
+        self.parse_fn = parse_fn
+        self.workers = max(workers, 1)
+        self.queue_size = queue_size
+        self.stats = {
+            "fetch": {"items": 0, "seconds": 0.0, "blocked_seconds": 0.0},
+            "parse": {"items": 0, "seconds": 0.0, "cpu_seconds": 0.0, "failed": 0},
+        }
+        self._stats_lock = threading.Lock()
+
+    def run(self, produce: Callable[[Callable[[str, str], None]], None]) -> Dict[str, Any]:
+        """Runs ``produce(emit)`` as the fetch stage and returns url -> parsed result.
+
+        ``produce`` must call ``emit(url, html)`` for every fetched page; it may
+        do so from any number of threads.
+        """
+        fetched = queue.Queue(maxsize=self.queue_size)
+        fetch_stats = self.stats['fetch']
+
+        def emit(url: str, html: str):
+            start = time.perf_counter()
+            fetched.put((url, html))
+            with self._stats_lock:
+                fetch_stats['items'] += 1
+                fetch_stats['blocked_seconds'] += time.perf_counter() - start
+
+        def producer():
+            start = time.perf_counter()
+            try:
+                with profiling.stage('child_fetch'):
+                    produce(emit)
+            except Exception as exc:
+                logging.error(f"Fetch stage failed: {exc}", exc_info=True)
+            finally:
+                fetch_stats['seconds'] = time.perf_counter() - start
+                fetched.put(_DONE)
+
+        producer_thread = threading.Thread(target=producer, name="fetch-stage", daemon=True)
+        producer_thread.start()
+
+        start = time.perf_counter()
+        parse_fn = profiling.for_process(self.parse_fn, 'child_parse')
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        futures = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                item = fetched.get()
+                if item is _DONE:
+                    break
+                url, html = item
+                slots.acquire()
+                future = executor.submit(_timed_call, parse_fn, url, html)
+                future.add_done_callback(lambda _: slots.release())
+                futures[url] = future
+
+            results = {}
+            parse_stats = self.stats['parse']
+            for url, future in futures.items():
+                try:
+                    results[url], cpu_seconds = future.result()
+                    parse_stats['items'] += 1
+                    parse_stats['cpu_seconds'] += cpu_seconds
+                    METRICS.observe('child_parse', cpu_seconds,
+                                    items=len(results[url]) if isinstance(results[url], list) else 0)
+                except Exception as exc:
+                    parse_stats['failed'] += 1
+                    logging.error(f"Parsing {url} failed: {exc!r}")
+        parse_stats['seconds'] = time.perf_counter() - start
+        producer_thread.join()
+        return results
+
+    def log_stats(self):
+        fetch, parse = self.stats['fetch'], self.stats['parse']
+        fetch_rate = fetch['items'] / fetch['seconds'] if fetch['seconds'] else 0.0
+        parse_rate = parse['items'] / parse['seconds'] if parse['seconds'] else 0.0
+        logging.info(f"Pipeline fetch stage: {fetch['items']} pages, {fetch_rate:.1f}/s, "
+                     f"{fetch['blocked_seconds']:.2f}s blocked on a full queue.")
+        logging.info(f"Pipeline parse stage: {parse['items']} pages, {parse_rate:.1f}/s on {self.workers} processes, "
+                     f"{parse['cpu_seconds']:.2f}s CPU, {parse['failed']} failed.")
@@ -0,0 +1,102 @@
+import re
+from html import unescape
+from typing import Optional
+
+# Price fragments come in three known shapes: split euros/cents markup, a
+# .kor-product-sale-price-value element, or plain text. The compiled patterns
+# below read those shapes directly; anything they cannot read with certainty is
+# handed to parse_price_soup, which is the original BeautifulSoup implementation.
+
+WHITESPACE_RE = re.compile(r'\s+')
+PRICE_RE = re.compile(r'(\d+\.\d{2})')
+TAG_RE = re.compile(r'<(?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+STRAY_LT_RE = re.compile(r'<(?![A-Za-z/])')
+
+
+def _class_re(class_name: str) -> re.Pattern:
+    # The lookbehind keeps attributes like data-class="..." from counting as the class.
+    return re.compile(r'(?<![\w-])class="(?:[^"]*\s)?' + re.escape(class_name) + r'(?:\s[^"]*)?"')
+
+
+EUROS_CLASS_RE = _class_re('price-euros')
+CENTS_CLASS_RE = _class_re('price-cents')
+SALE_VALUE_CLASS_RE = _class_re('kor-product-sale-price-value')
+# Matched at the position of the first element carrying the class, so the
+# result is the same element soup.select_one would pick.
+EUROS_RE = re.compile(r'[^>]*>\s*<span(?:\s[^>]*)?>([^<]*)</span>')
+CENTS_RE = re.compile(r'[^>]*>\s*<sup(?:\s[^>]*)?>([^<]*)</sup>')
+SALE_VALUE_RE = re.compile(r'[^>]*>([^<]*)</')
+
+# Markup the plain-text path cannot strip the way html.parser would.
+UNSAFE_MARKUP = ('<!', '<?', '<script', '<style', '<textarea', '<title')
+
+
+class _NeedsSoup(Exception):
+    pass
+
+
+def _normalize_text(text: Optional[str]) -> Optional[str]:
+    if not text or not text.strip(): return None
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+
+def _first_element_text(raw_price: str, class_re: re.Pattern, content_re: re.Pattern) -> str:
+    class_match = class_re.search(raw_price)
+    if not class_match:
+        raise _NeedsSoup()
+    content_match = content_re.match(raw_price, class_match.end())
+    if not content_match:
+        raise _NeedsSoup()
+    return unescape(content_match.group(1))
+
+
+def _search_price(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        raise _NeedsSoup()
+    match = PRICE_RE.search(text.replace(',', '.'))
+    return match.group(1) if match else None
+
+
+def _parse_price_fast(raw_price: str) -> Optional[str]:
+    if 'price-euros' in raw_price or 'price-cents' in raw_price:
+        euros = _normalize_text(_first_element_text(raw_price, EUROS_CLASS_RE, EUROS_RE))
+        cents = _normalize_text(_first_element_text(raw_price, CENTS_CLASS_RE, CENTS_RE))
+        return f"{euros}.{cents}"
+
+    if 'kor-product-sale-price-value' in raw_price:
+        return _search_price(_normalize_text(_first_element_text(raw_price, SALE_VALUE_CLASS_RE, SALE_VALUE_RE)))
+
+    lowered = raw_price.lower()
+    if any(marker in lowered for marker in UNSAFE_MARKUP) or STRAY_LT_RE.search(raw_price):
+        raise _NeedsSoup()
+    return _search_price(_normalize_text(unescape(TAG_RE.sub('', raw_price))))
+
+
+def parse_price_soup(raw_price: Optional[str]) -> Optional[str]:
+    if not raw_price: return None
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(raw_price, 'html.parser')
+
+    euros_elem = soup.select_one('.price-euros span')
+    cents_elem = soup.select_one('.price-cents sup')
+    if euros_elem and cents_elem:
+        euros = _normalize_text(euros_elem.text)
+        cents = _normalize_text(cents_elem.text)
+        return f"{euros}.{cents}"
+
+    price_value_elem = soup.select_one('.kor-product-sale-price-value')
+    if price_value_elem:
+        cleaned_text = _normalize_text(price_value_elem.text).replace(',', '.')
+        match = PRICE_RE.search(cleaned_text)
+        return match.group(1) if match else None
+    cleaned_text = _normalize_text(soup.text).replace(',', '.')
+    match = PRICE_RE.search(cleaned_text)
+    return match.group(1) if match else None
+
+
+def parse_price(raw_price: Optional[str]) -> Optional[str]:
+    if not raw_price: return None
+    try:
+        return _parse_price_fast(raw_price)
+    except _NeedsSoup:
+        return parse_price_soup(raw_price)
@@ -0,0 +1,289 @@
+import cProfile
+import glob
+import io
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from multiprocessing.util import Finalize
+from typing import Any, Callable, Dict, List, Optional
+
+# Opt-in profiling for whole runs (``--profile``). Code paths mark their stage
+# with ``stage('timeframe')`` or ``@profiled('timeframe')``; while a session is
+# active every thread entering a stage gets its own cProfile profiler (cProfile
+# only sees the thread that enabled it) and a sampler thread records the full
+# stack of every staged thread for flamegraphs. A stage entered inside another
+# one pauses the outer stage's profiler until it returns, so every function
+# call is counted in the innermost stage around it. Worker processes profile
+# themselves through ProfiledCall and leave their files next to the threads'
+# when they exit.
+#
+# From Python 3.12 cProfile runs on sys.monitoring, which allows one profiler
+# per process and sees every thread, so per-stage profiles cannot be told
+# apart. There only the samples are recorded; summary.json names the profiler
+# that was used.
+#
+# Output, per stage:  <stage>.pstats, <stage>.txt (top functions) and
+# <stage>.collapsed (flamegraph.pl / speedscope input), plus allocations.txt
+# and summary.json for the run. Per-thread and per-process files stay in raw/.
+
+DEFAULT_INTERVAL = 0.005
+# cProfile keeps one profiler per thread only before Python 3.12.
+CPROFILE_PER_THREAD = sys.version_info < (3, 12)
+SAFE_NAME_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+_session: Optional['ProfileSession'] = None
+
+
+def _empty_stats() -> Dict[str, float]:
+    return {"calls": 0, "wall_seconds": 0.0, "memory_delta_bytes": 0}
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+class ProfileSession:
+    def __init__(self, output_dir: str, interval: float = DEFAULT_INTERVAL, allocations: bool = True,
+                 worker: bool = False):
+        self.output_dir = output_dir
+        self.raw_dir = os.path.join(output_dir, 'raw')
+        self.interval = interval
+        self.allocations = allocations
+        self.worker = worker
+        self.profiler = 'cprofile' if CPROFILE_PER_THREAD else 'sampling'
+        self.pid = os.getpid()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._profiles: Dict[tuple, cProfile.Profile] = {}
+        self._active: Dict[int, str] = {}
+        self._samples: Dict[str, Counter] = {}
+        self._stage_stats: Dict[str, Dict[str, float]] = {}
+        self._stop = threading.Event()
+        self._sampler = None
+        self.started = None
+
+    def start(self):
+        os.makedirs(self.raw_dir, exist_ok=True)
+        self.started = time.perf_counter()
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                active = list(self._active.items())
+            for thread_id, stage_name in active:
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                key = ';'.join([stage_name] + stack[::-1])
+                with self._lock:
+                    self._samples.setdefault(stage_name, Counter())[key] += 1
+
+    @contextmanager
+    def stage(self, name: str):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        thread_id = threading.get_ident()
+        # One profiler per thread and stage.
+        profile = None
+        if self.profiler == 'cprofile':
+            key = (name, threading.current_thread().name, thread_id)
+            with self._lock:
+                profile = self._profiles.setdefault(key, cProfile.Profile())
+        outer = stack[-1][1] if stack else None
+        stack.append((name, profile))
+        with self._lock:
+            self._active[thread_id] = name
+        memory_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        start = time.perf_counter()
+        if outer:
+            outer.disable()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            if outer:
+                outer.enable()
+            elapsed = time.perf_counter() - start
+            memory_after = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+            stack.pop()
+            with self._lock:
+                stats = self._stage_stats.setdefault(name, _empty_stats())
+                stats['calls'] += 1
+                stats['wall_seconds'] += elapsed
+                stats['memory_delta_bytes'] += memory_after - memory_before
+                if stack:
+                    self._active[thread_id] = stack[-1][0]
+                else:
+                    self._active.pop(thread_id, None)
+
+    def dump_raw(self):
+        """Writes this process's profiles and samples to raw/ (overwriting earlier dumps)."""
+        pid = os.getpid()
+        with self._lock:
+            profiles = list(self._profiles.items())
+            samples = {name: Counter(counter) for name, counter in self._samples.items()}
+            stage_stats = {name: dict(stats) for name, stats in self._stage_stats.items()}
+        for (stage_name, thread_name, thread_id), profile in profiles:
+            filename = SAFE_NAME_RE.sub('_', f"{stage_name}-{thread_name}-{pid}-{thread_id}")
+            profile.dump_stats(os.path.join(self.raw_dir, f"{filename}.pstats"))
+        for stage_name, counter in samples.items():
+            with open(os.path.join(self.raw_dir, f"{stage_name}-{pid}.collapsed"), 'w', encoding='utf-8') as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in counter.items())
+        with open(os.path.join(self.raw_dir, f"stages-{pid}.json"), 'w', encoding='utf-8') as f:
+            json.dump(stage_stats, f)
+
+    def finish(self):
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        self.dump_raw()
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        peak = tracemalloc.get_traced_memory()[1] if snapshot else None
+        if snapshot and self.allocations:
+            tracemalloc.stop()
+
+        summary = {"wall_seconds": round(time.perf_counter() - self.started, 3), "profiler": self.profiler, "stages": {}}
+        if self.profiler == 'sampling':
+            summary['profiler_note'] = (f"Python {sys.version_info[0]}.{sys.version_info[1]} allows one cProfile per process, "
+                                        f"so stages only have sampled stacks (.collapsed), no .pstats.")
+        for path in glob.glob(os.path.join(self.raw_dir, 'stages-*.json')):
+            with open(path, encoding='utf-8') as f:
+                for stage_name, stats in json.load(f).items():
+                    merged = summary['stages'].setdefault(stage_name, _empty_stats())
+                    for field, value in stats.items():
+                        merged[field] += value
+        for stage_name, stats in summary['stages'].items():
+            stats['wall_seconds'] = round(stats['wall_seconds'], 3)
+            stats['files'] = self._merge_stage(stage_name)
+        if snapshot:
+            summary['traced_memory_peak_bytes'] = peak
+            self._write_allocations(snapshot)
+        with open(os.path.join(self.output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        logging.info(f"Profile written to {self.output_dir} ({', '.join(sorted(summary['stages']))})")
+        return summary
+
+    def _merge_stage(self, stage_name: str) -> List[str]:
+        import pstats
+        written = []
+        pstats_files = glob.glob(os.path.join(self.raw_dir, f"{SAFE_NAME_RE.sub('_', stage_name)}-*.pstats"))
+        if pstats_files:
+            stats = pstats.Stats(*pstats_files)
+            path = os.path.join(self.output_dir, f"{stage_name}.pstats")
+            stats.dump_stats(path)
+            text = io.StringIO()
+            pstats.Stats(path, stream=text).sort_stats('cumulative').print_stats(40)
+            with open(os.path.join(self.output_dir, f"{stage_name}.txt"), 'w', encoding='utf-8') as f:
+                f.write(text.getvalue())
+            written += [f"{stage_name}.pstats", f"{stage_name}.txt"]
+        collapsed = Counter()
+        for path in glob.glob(os.path.join(self.raw_dir, f"{stage_name}-*.collapsed")):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    collapsed[stack] += int(count)
+        if collapsed:
+            with open(os.path.join(self.output_dir, f"{stage_name}.collapsed"), 'w', encoding='utf-8') as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in collapsed.most_common())
+            written.append(f"{stage_name}.collapsed")
+        return written
+
+    def _write_allocations(self, snapshot: tracemalloc.Snapshot, limit: int = 30):
+        import pstats
+        # Leave out the profiler's own bookkeeping.
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, path) for path in (
+            tracemalloc.__file__, cProfile.__file__, pstats.__file__, __file__, '<frozen importlib._bootstrap*>')])
+        with open(os.path.join(self.output_dir, 'allocations.txt'), 'w', encoding='utf-8') as f:
+            f.write(f"Top {limit} allocation sites still alive at the end of the run (main process):\n")
+            for stat in snapshot.statistics('lineno')[:limit]:
+                f.write(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {stat.traceback[0]}\n")
+            f.write(f"\nTop 10 allocation tracebacks:\n")
+            for stat in snapshot.statistics('traceback')[:10]:
+                f.write(f"\n{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                f.write('\n'.join(f"    {line}" for line in stat.traceback.format(limit=8)) + '\n')
+
+
+def active() -> bool:
+    return _session is not None
+
+
+def stage(name: str):
+    return _session.stage(name) if _session else nullcontext()
+
+
+def profiled(stage_name: str) -> Callable:
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ProfiledCall:
+    """Picklable wrapper that profiles ``fn`` inside a worker process."""
+
+    def __init__(self, fn: Callable, stage_name: str, output_dir: str, interval: float):
+        self.fn = fn
+        self.stage_name = stage_name
+        self.output_dir = output_dir
+        self.interval = interval
+
+    def __call__(self, *args, **kwargs) -> Any:
+        global _session
+        # A forked worker inherits the parent's session, but none of its threads.
+        if _session is None or _session.pid != os.getpid() or _session.output_dir != self.output_dir:
+            # Allocations are only traced in the main process.
+            _session = ProfileSession(self.output_dir, self.interval, allocations=False, worker=True)
+            _session.start()
+            # Pool workers leave through multiprocessing's own exit path, which skips atexit but
+            # runs its finalizers, so the profile is written once when the worker shuts down.
+            # A worker that is killed instead leaves no profile.
+            Finalize(None, _session.dump_raw, exitpriority=10)
+        with _session.stage(self.stage_name):
+            return self.fn(*args, **kwargs)
+
+
+def for_process(fn: Callable, stage_name: str) -> Callable:
+    """Returns ``fn`` wrapped for profiling in a worker process when a session is active."""
+    if _session is None or _session.worker:
+        return fn
+    return ProfiledCall(fn, stage_name, _session.output_dir, _session.interval)
+
+
+@contextmanager
+def session(output_dir: str, interval: float = DEFAULT_INTERVAL, allocations: bool = True):
+    global _session
+    _session = ProfileSession(output_dir, interval, allocations)
+    _session.start()
+    logging.info(f"Profiling enabled, writing to {output_dir}")
+    if _session.profiler == 'sampling':
+        logging.warning("cProfile allows one profiler per process on this Python; recording stack samples only.")
+    try:
+        yield _session
+    finally:
+        current, _session = _session, None
+        current.finish()
@@ -0,0 +1,125 @@
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional
+
+from capture import CaptureStore, extract_object
+from metrics import METRICS
+from models import RawProduct
+from scraper import CONFIG, crawl_child_pages, process_timeframe, write_pretty_json
+from sharding import merge_shard_products
+
+# Offline replay of a capture run (``cli.py replay``). Extraction,
+# DataNormalizer.process and child merging run again on the stored pages,
+# with no network, no rate limits and page extraction spread over a process
+# pool. The products of a listing are assembled the way the scrapers do it:
+# pages in order, deduplicated by id, shards merged per timeframe.
+
+
+def extract_pages(store: CaptureStore, digests: List[str], workers: int, backend: str) -> Dict[str, List[RawProduct]]:
+    unique = list(dict.fromkeys(digests))
+    extract = partial(extract_object, store.root, backend=backend)
+    if workers <= 1 or len(unique) <= 1:
+        return {digest: extract(digest) for digest in unique}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(unique) // (workers * 4))
+        return dict(zip(unique, executor.map(extract, unique, chunksize=chunksize)))
+
+
+def listing_products(pages: Dict[str, str], extracted: Dict[str, List[RawProduct]]) -> List[RawProduct]:
+    """The products of one listing in page order, without repeats, like HoogvlietHttpScraper.scrape_page."""
+    seen = set()
+    products = []
+    for page_number in sorted(pages, key=int):
+        for product in extracted[pages[page_number]]:
+            if product.id and product.id not in seen:
+                seen.add(product.id)
+                products.append(product)
+    return products
+
+
+def compare_raw(key: str, captured: List[RawProduct], replayed: List[RawProduct]) -> int:
+    """Logs how the replayed raw products differ from the captured ones; returns the number of differences."""
+    before = {product.id: product for product in captured}
+    after = {product.id: product for product in replayed}
+    missing = [product_id for product_id in before if product_id not in after]
+    added = [product_id for product_id in after if product_id not in before]
+    fields = Counter()
+    changed = 0
+    for product_id, product in after.items():
+        old = before.get(product_id)
+        if old is None or old == product:
+            continue
+        changed += 1
+        fields.update(field for field in RawProduct.FIELDS if getattr(old, field) != getattr(product, field))
+    reordered = not (missing or added or changed) and list(before) != list(after)
+    if not (missing or added or changed or reordered):
+        logging.info(f"{key}: replayed raw products match the capture ({len(after)} products).")
+        return 0
+    details = ", ".join(f"{field} {count}" for field, count in fields.most_common())
+    logging.warning(f"{key}: {len(missing)} captured products missing, {len(added)} new, {changed} changed"
+                    f"{f' ({details})' if details else ''}{', same products in a different order' if reordered else ''}. "
+                    f"Missing: {missing[:5]}, new: {added[:5]}")
+    return len(missing) + len(added) + changed + reordered
+
+
+def replay_run(run_id: Optional[str] = None, keys: Optional[List[str]] = None, compare: bool = False,
+               workers: Optional[int] = None) -> int:
+    store = CaptureStore(CONFIG['capture_dir'])
+    manifest = store.load_manifest(run_id)
+    # Normalization resolves relative links against the site the run was captured from.
+    CONFIG['base_url'] = manifest['settings'].get('base_url', CONFIG['base_url'])
+    timeframes = {key: entry for key, entry in manifest['timeframes'].items() if not keys or key in keys}
+    if not timeframes:
+        logging.error(f"Capture run {manifest['run_id']} has no timeframe {', '.join(keys or [])}")
+        return 1
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(CONFIG['output_dir'], exist_ok=True)
+    start = time.perf_counter()
+
+    page_digests = [digest for entry in timeframes.values() for url in entry['listings']
+                    for digest in manifest['pages'].get(url, {}).values()]
+    with METRICS.timer('extract', engine='replay', backend=CONFIG['html_backend']) as timing:
+        extracted = extract_pages(store, page_digests + list(manifest['children'].values()), workers, CONFIG['html_backend'])
+        timing.items = sum(len(products) for products in extracted.values())
+    child_pages = {url: extracted[digest] for url, digest in manifest['children'].items()}
+
+    errors = 0
+    differences = 0
+    product_count = 0
+    for key, entry in timeframes.items():
+        missing = [url for url in entry['listings'] if url not in manifest['pages']]
+        if missing:
+            logging.error(f"{key}: {len(missing)} of its listings were not captured, skipping it.")
+            errors += 1
+            continue
+        raw_data = merge_shard_products(listing_products(manifest['pages'][url], extracted) for url in entry['listings'])
+        if compare:
+            differences += compare_raw(key, store.get_products(entry['raw']), raw_data)
+        count, ndjson_path = process_timeframe(key, entry['info'], raw_data)
+        if not count:
+            continue
+        product_count += count
+        if child_pages:
+            crawl_child_pages(key, ndjson_path, child_pages)
+        if CONFIG['output_pretty_json']:
+            write_pretty_json(key, ndjson_path)
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Replayed capture run {manifest['run_id']} into {CONFIG['output_dir']}: {product_count} products from "
+                 f"{len(set(page_digests))} pages and {len(child_pages)} child pages in {elapsed:.2f}s "
+                 f"({workers} extraction processes).")
+    return 1 if errors or differences else 0
+
+
+def list_runs() -> int:
+    store = CaptureStore(CONFIG['capture_dir'])
+    for run_id in store.runs():
+        manifest = store.load_manifest(run_id)
+        counts = ", ".join(f"{key} {entry['count']}" for key, entry in manifest['timeframes'].items())
+        print(f"{run_id}  {manifest['settings'].get('engine', '?'):<8} {sum(map(len, manifest['pages'].values())):>5} pages "
+              f"{len(manifest['children']):>5} child pages  {counts}")
+    return 0
@@ -2,303 +2,754 @@ import time
 import json
 import re
 import os
+import sys
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Tuple
-from urllib.parse import urljoin
+from typing import TYPE_CHECKING, Dict, Any, Optional, List, Tuple, Iterable, Iterator, Callable
+from urllib.parse import urljoin, urlsplit, parse_qs, urlencode
 import logging
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from bs4 import BeautifulSoup
 import concurrent.futures
+from price_parser import parse_price
+from html_backends import extract_product_info, extract_products, get_backend
+from writers import COMPRESSION_SUFFIXES, NdjsonWriter, finalize_pretty_json, read_ndjson
+from models import Product, RawProduct
+from sharding import (DiscoveryCache, Filter, Shard, ShardScheduler, Timeframe, plan_from_filters, plan_timeframes,
+                      read_filters)
+from state_store import ProductStateStore, IncrementalRun, children_hash, state_key_for
+from metrics import METRICS
+import profiling
+import capture
+from functools import lru_cache, partial
+
+# selenium, httpx and bs4 are imported where they are used, so a run only
+# loads the engines it needs; see cli.py for the stage-only commands.
+if TYPE_CHECKING:
+    import httpx
+    from child_crawler import ChildFrontier
+    from bs4 import Tag
+    from browser import DriverPool
 
 # --- Configuration ---
 CONFIG = {
     "base_url": "https://www.hoogvliet.com/",
     "initial_url": "https://www.hoogvliet.com/INTERSHOP/web/WFS/org-webshop-Site/nl_NL/-/EUR/ViewStandardCatalog-Browse?CategoryName=aanbiedingen&CatalogID=schappen",
+    "promotion_page_url": "https://www.hoogvliet.com/INTERSHOP/web/WFS/org-webshop-Site/nl_NL/-/EUR/ViewStandardCatalog-GetCategoriesForPromotionPage",
     "headless": True,
     "timeout": 15,
+    "concurrency": 2,
+    "sharding": "category",
+    "discovery": "http",
+    "discovery_cache": "output/discovery_cache.json",
+    "discovery_cache_ttl": 24 * 3600,
+    "normalizer_cache_size": 4096,
+    "output_dir": "output",
+    "output_compression": None,
+    "json_backend": "auto",
+    "output_pretty_json": True,
+    "incremental": True,
+    "state_db": "output/state.sqlite3",
+    "raw_dir": None,
+    "capture_dir": "output/capture",
+    "offers_db": "output/offers.sqlite3",
+    "engine": "browser",
+    "extraction": "script",
+    "browser_profile": "lean",
+    "lean_blocked_patterns": [
+        "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.ico",
+        # Media has no content setting (media_stream is the camera/microphone permission), so it is blocked by URL.
+        "*.mp4", "*.webm", "*.mov", "*.ogv", "*.m3u8", "*.mpd", "*.mp3", "*.m4a", "*.ogg", "*.wav", "*.aac",
+        "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+        "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+        "*facebook.net*", "*facebook.com/tr*", "*hotjar.com*", "*bing.com*",
+        "*cookiebot.com*", "*clarity.ms*", "*tiktok.com*", "*pinterest.com*",
+    ],
+    "lean_allowed_patterns": [],
+    "scroll_max_wait": 10,
+    "scroll_min_wait": 0.5,
+    "scroll_quiet_ms": 300,
+    "http_page_size": 48,
+    "http_max_workers": 8,
+    "http_max_pages": 200,
+    "html_backend": "auto",
+    "child_rate": 2.0,
+    "child_burst": 4,
+    "child_concurrency": 100,
+    "child_parse_workers": os.cpu_count() or 2,
+    "child_parse_queue_size": 64,
+    "http_cache_path": "output/http_cache.sqlite3",
+    "http_cache_ttl": 6 * 3600,
+    "http_cache_max_bytes": 200 * 1024 * 1024,
+    "http_cache_mode": "normal",
+    "metrics_report": "output/run_report.json",
+    "metrics_textfile": "output/hoogvliet_scraper.prom",
+    "daemon_host": "127.0.0.1",
+    "daemon_port": 8787,
+    "daemon_poll_interval": 3600,
+    "daemon_rollover_interval": 300,
+    "daemon_rollover_before": 2 * 3600,
+    "daemon_rollover_after": 6 * 3600,
+    "daemon_refresh_interval": 6 * 3600,
+    "daemon_retry_interval": 600,
+    "daemon_stale_after": 13 * 3600,
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
 }
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
-class HoogvlietScraper:
-    def __init__(self, headless=True):
-        self.options = webdriver.ChromeOptions()
-        if headless:
-            self.options.add_argument('--headless')
-        self.options.add_argument('--no-sandbox')
-        self.options.add_argument('--disable-dev-shm-usage')
-        self.options.add_argument('--disable-blink-features=AutomationControlled')
-        self.options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        self.options.add_experimental_option('useAutomationExtension', False)
-        self.driver = None
-
-    def start_driver(self):
-        self.driver = webdriver.Chrome(options=self.options)
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        return self.driver
-
-    def scroll_to_load_products(self, max_scrolls=50, wait_time=2):
-        last_height = self.driver.execute_script("return document.body.scrollHeight")
-        scrolls = 0
-        no_change_count = 0
-        while scrolls < max_scrolls:
-            last_height = self.driver.execute_script("return document.body.scrollHeight")
-            if no_change_count == 0:
-                try:
-                    product_list_element = self.driver.find_element(By.CSS_SELECTOR, 'div.product-list.row')
-                    self.driver.execute_script("arguments[0].scrollIntoView(false);", product_list_element)
-                except NoSuchElementException:
-                    logging.warning("Could not find product list element to scroll to. Breaking.")
-                    break
-            elif no_change_count == 1:
-                logging.info("Page height hasn't changed. Scrolling down 200 pixels.")
-                self.driver.execute_script("window.scrollBy(0, 200);")
-            elif no_change_count == 2:
-                logging.info("Page height hasn't changed. Scrolling up 400 pixels.")
-                self.driver.execute_script("window.scrollBy(0, -400);")
-                
-            time.sleep(wait_time)
-
-            new_height = self.driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
-                no_change_count += 1
-                if no_change_count >= 3:
-                    logging.info("Page height hasn't changed after nudging. Assuming all products are loaded.")
-                    break
-            else:
-                no_change_count = 0  
-            scrolls += 1
-            
-        logging.info(f"Finished scrolling after {scrolls} attempts.")
-
-    def extract_product_info(self, product_element):
-        product_data = {}
-        try:
-            track_click_attr = product_element.get_attribute('data-track-click')
-            if track_click_attr:
-                track_data = json.loads(track_click_attr)
-                product_data['id'] = track_data.get('products', [{}])[0].get('id')
-                product_data['brand'] = track_data.get('products', [{}])[0].get('brand')
-            else:
-                product_data['id'], product_data['brand'] = None, None
-        except Exception:
-            product_data['id'], product_data['brand'] = None, None
+def build_http_client(max_connections: int) -> 'httpx.Client':
+    import httpx
+    return httpx.Client(
+        headers={"User-Agent": CONFIG['user_agent']},
+        timeout=CONFIG['timeout'],
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+    )
 
-        try:
-            name_elem = product_element.find_element(By.CSS_SELECTOR, '.product-title h3')
-            product_data['name'] = name_elem.text.strip()
-        except: product_data['name'] = 'N/A'
-        
-        try:
-            price_now_elem = product_element.find_element(By.CSS_SELECTOR, '.non-strikethrough')
-            product_data['price_now_raw'] = price_now_elem.get_attribute('innerHTML')
-        except: product_data['price_now_raw'] = None
-        
-        try:
-            price_was_elem = product_element.find_element(By.CSS_SELECTOR, '.strikethrough')
-            product_data['price_was_raw'] = price_was_elem.get_attribute('innerHTML')
-        except: product_data['price_was_raw'] = None
 
-        try:
-            promo_elem = product_element.find_element(By.CSS_SELECTOR, '.promotion-short-title')
-            product_data['promotion'] = promo_elem.text.strip()
-        except: product_data['promotion'] = None
-        try:
-            img_elem = product_element.find_element(By.CSS_SELECTOR, 'img.product-image')
-            product_data['image_url'] = img_elem.get_attribute('src')
-        except: product_data['image_url'] = 'N/A'
-        try:
-            link_elem = product_element.find_element(By.CSS_SELECTOR, 'a.product-title, .product-image-container a')
-            product_data['source_url'] = link_elem.get_attribute('href')
-        except: product_data['source_url'] = 'N/A'
-        try:
-            desc_elem = product_element.find_element(By.CSS_SELECTOR, '.Short-Description')
-            product_data['description'] = desc_elem.text.strip()
-        except: product_data['description'] = None
-        
-        product_data['child_page_url'] = None
-        try:
-            parent_link_elem = product_element.find_element(By.CSS_SELECTOR, '.promotion-btn a.btn')
-            product_data['child_page_url'] = parent_link_elem.get_attribute('href')
-        except NoSuchElementException:
-            pass
-            
-        return product_data
-
-    def scrape_page(self, url: str, max_scrolls: int = 50) -> List[Dict[str, Any]]:
-        self.driver = self.start_driver()
+def extract_product_info_from_soup(product_element: 'Tag') -> RawProduct:
+    return extract_product_info(product_element, get_backend('html.parser'))
+
+
+class HoogvlietHttpScraper:
+    """Scrapes a timeframe through the paginated promotion endpoint instead of a browser.
+
+    The endpoint is the one the offers page calls while lazy loading, so the
+    pages can be fetched directly and in parallel.
+    """
+
+    def __init__(self, endpoint_url: Optional[str] = None, page_size: Optional[int] = None,
+                 max_workers: Optional[int] = None, client: Optional['httpx.Client'] = None):
+        self.endpoint_url = endpoint_url or CONFIG['promotion_page_url']
+        self.page_size = page_size or CONFIG['http_page_size']
+        self.max_workers = max_workers or CONFIG['http_max_workers']
+        self.owns_client = client is None
+        self.client = client or build_http_client(self.max_workers)
+
+    def build_page_url(self, timeframe_url: str, page_number: int) -> str:
+        query = parse_qs(urlsplit(timeframe_url).query, keep_blank_values=True)
+        search_parameter = query.get('SearchParameter', [''])[0]
+        # PromotionRange is passed both inside SearchParameter and on its own; the
+        # standalone copy keeps the inner url-encoding, exactly like the site does.
+        match = re.search(r'[&?]PromotionRange=([^&]*)', search_parameter)
+        promotion_range = match.group(1) if match else ''
+        params = {
+            "PageNumber": page_number,
+            "PageSize": self.page_size,
+            "LoadMoreProducts": "",
+            "ListType": "",
+            "PromotionRange": promotion_range,
+            "TypeCode": query.get('TypeCode', ['514'])[0],
+            "SearchParameter": search_parameter,
+        }
+        return self.endpoint_url + "?" + urlencode(params)
+
+    @profiling.profiled('page_fetch')
+    def fetch_page(self, timeframe_url: str, page_number: int) -> List[RawProduct]:
+        page_url = self.build_page_url(timeframe_url, page_number)
+        with METRICS.timer('page_load', engine='http'):
+            response = self.client.get(page_url)
+            response.raise_for_status()
+        METRICS.inc('bytes_downloaded', response.num_bytes_downloaded, engine='http')
+        METRICS.inc('requests', engine='http')
+        with METRICS.timer('extract', engine='http', backend=CONFIG['html_backend']) as timing:
+            products = extract_products(response.text, CONFIG['html_backend'])
+            timing.items = len(products)
+        capture.record_page(timeframe_url, page_number, response.text)
+        return products
+
+    def scrape_page(self, url: str, max_pages: Optional[int] = None, raise_errors: bool = False) -> List[RawProduct]:
+        max_pages = max_pages or CONFIG['http_max_pages']
         products_on_page = []
-        try:
-            logging.info(f"Loading page: {url}")
-            self.driver.get(url)
-            WebDriverWait(self.driver, CONFIG['timeout']).until(EC.presence_of_element_located((By.CSS_SELECTOR, '.product-list-item')))
-            self.scroll_to_load_products(max_scrolls=max_scrolls)
-            
-            logging.info("Extracting product information...")
-            product_elements = self.driver.find_elements(By.CSS_SELECTOR, '.product-list-item')
-            
-            for element in product_elements:
-                product_info = self.extract_product_info(element)
-                
-                if product_info and product_info.get('id'):
+        seen_ids = set()
+
+        def add(page: List[RawProduct]) -> int:
+            added = 0
+            for product_info in page:
+                product_id = product_info.id
+                if product_id and product_id not in seen_ids:
+                    seen_ids.add(product_id)
                     products_on_page.append(product_info)
+                    added += 1
+            return added
+
+        try:
+            logging.info(f"Loading pages via HTTP: {url}")
+            # Page numbering is not documented, so start at 0; an overlapping
+            # first page is harmless because products are deduplicated by id.
+            first_page = self.fetch_page(url, 0)
+            add(first_page)
+            # The server may cap PageSize below what was asked for, so the first page sets the size.
+            # A short first page is either the whole listing or such a cap; page 1 tells them apart.
+            page_size = len(first_page)
+            page_number = 1 if page_size else max_pages
+            if 0 < page_size < self.page_size and max_pages > 1:
+                page_number = 2 if add(self.fetch_page(url, 1)) else max_pages
+                if page_number == 2:
+                    logging.info(f"Server returns {page_size} products per page instead of {self.page_size}.")
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while page_number < max_pages:
+                    batch = range(page_number, min(page_number + self.max_workers, max_pages))
+                    pages = list(executor.map(lambda n: self.fetch_page(url, n), batch))
+                    new_products = 0
+                    last_page_reached = False
+                    for page in pages:
+                        new_products += add(page)
+                        if len(page) < page_size:
+                            last_page_reached = True
+                    if last_page_reached or new_products == 0:
+                        break
+                    page_number += self.max_workers
 
             logging.info(f"Successfully scraped {len(products_on_page)} raw products from {url}")
             return products_on_page
         except Exception as e:
-            logging.error(f"Error during scraping {url}: {e}", exc_info=True)
+            logging.error(f"Error during HTTP scraping {url}: {e}", exc_info=True)
+            if raise_errors:
+                raise
             return []
-        finally:
-            if self.driver:
-                self.driver.quit()
+
+    def listing_holds(self, url: str, count: int) -> bool:
+        """Whether the listing at ``url`` has exactly ``count`` products, from at most two of its pages.
+
+        The first page gives the page size the server uses; the page where product ``count`` would end
+        then has to hold exactly the remainder, and the page after a full last page has to be empty.
+        """
+        first_page = self.fetch_page(url, 0)
+        page_size = len(first_page)
+        if not page_size or count < page_size:
+            return count == page_size
+        page_number, remainder = divmod(count, page_size)
+        return len(self.fetch_page(url, page_number)) == remainder
+
+    def close(self):
+        if self.owns_client:
+            self.client.close()
+
+
+WHITESPACE_RE = re.compile(r'\s+')
+MONTH_MAP = {'januari': 1, 'februari': 2, 'maart': 3, 'april': 4, 'mei': 5, 'juni': 6, 'juli': 7, 'augustus': 8, 'september': 9, 'oktober': 10, 'november': 11, 'december': 12}
 
 
 class DataNormalizer:
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, cache_size: Optional[int] = None):
         self.base_url = base_url
+        cache_size = cache_size or CONFIG['normalizer_cache_size']
+        # Promotion texts, price fragments, child page URLs and timeframe labels
+        # repeat across a catalog, so they are memoized in bounded LRU caches.
+        self._caches = {
+            "text": lru_cache(maxsize=cache_size)(self._clean_text),
+            "price": lru_cache(maxsize=cache_size)(parse_price),
+            "url": lru_cache(maxsize=cache_size)(partial(urljoin, base_url)),
+            "date_range": lru_cache(maxsize=64)(self._parse_date_range_for_year),
+        }
 
-    def _normalize_text(self, text: Optional[str]) -> Optional[str]:
+    def _clean_text(self, text: Optional[str]) -> Optional[str]:
         if not text or not text.strip(): return None
-        return re.sub(r'\s+', ' ', text).strip()
+        return WHITESPACE_RE.sub(' ', text).strip()
+
+    def _normalize_text(self, text: Optional[str]) -> Optional[str]:
+        return self._caches['text'](text)
 
     def _normalize_price(self, raw_price: Optional[str]) -> Optional[str]:
-        if not raw_price: return None
-        soup = BeautifulSoup(raw_price, 'html.parser')
-        
-        euros_elem = soup.select_one('.price-euros span')
-        cents_elem = soup.select_one('.price-cents sup')
-        if euros_elem and cents_elem:
-            euros = self._normalize_text(euros_elem.text)
-            cents = self._normalize_text(cents_elem.text)
-            return f"{euros}.{cents}"
-
-        price_value_elem = soup.select_one('.kor-product-sale-price-value')
-        if price_value_elem:
-             cleaned_text = self._normalize_text(price_value_elem.text).replace(',', '.')
-             match = re.search(r'(\d+\.\d{2})', cleaned_text)
-             return match.group(1) if match else None
-        cleaned_text = self._normalize_text(soup.text).replace(',', '.')
-        match = re.search(r'(\d+\.\d{2})', cleaned_text)
-        return match.group(1) if match else None
+        return self._caches['price'](raw_price)
+
+    def _normalize_url(self, url: Optional[str]) -> Optional[str]:
+        return self._caches['url'](url) if url else None
 
     def _parse_date_range(self, date_str: str) -> Tuple[Optional[str], Optional[str]]:
-        month_map = {'januari': 1, 'februari': 2, 'maart': 3, 'april': 4, 'mei': 5, 'juni': 6, 'juli': 7, 'augustus': 8, 'september': 9, 'oktober': 10, 'november': 11, 'december': 12}
+        return self._caches['date_range'](date_str, datetime.now().year)
+
+    def _parse_date_range_for_year(self, date_str: str, current_year: int) -> Tuple[Optional[str], Optional[str]]:
         try:
             date_part = date_str.split('|')[1].strip()
             start_str, end_str = date_part.split(' - ')
-            current_year = datetime.now().year
             start_day, start_month_name = start_str.split()
-            start_month = month_map[start_month_name.lower()]
+            start_month = MONTH_MAP[start_month_name.lower()]
             start_date = datetime(current_year, start_month, int(start_day)).date()
             end_day, end_month_name = end_str.split()
-            end_month = month_map[end_month_name.lower()]
+            end_month = MONTH_MAP[end_month_name.lower()]
             end_date = datetime(current_year, end_month, int(end_day)).date()
             return start_date.isoformat(), end_date.isoformat()
         except Exception:
             return None, None
 
-    def process(self, raw_products: List[Dict], timeframe_info: Dict) -> List[Dict]:
-        normalized_list = []
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {}
+        for name, cache in self._caches.items():
+            info = cache.cache_info()
+            stats[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+        return stats
+
+    def normalize(self, raw: RawProduct, timeframe_info: Dict) -> Product:
+        return Product(
+            id=raw.id,
+            brand=self._normalize_text(raw.brand),
+            title=self._clean_text(raw.name),
+            description=self._clean_text(raw.description),
+            promotion=self._normalize_text(raw.promotion),
+            price_now=self._normalize_price(raw.price_now_raw),
+            price_was=self._normalize_price(raw.price_was_raw),
+            image_url=self._normalize_url(raw.image_url),
+            source_url=self._normalize_url(raw.source_url),
+            child_page_url=self._normalize_url(raw.child_page_url),
+            start_date=timeframe_info.get('start_date'),
+            end_date=timeframe_info.get('end_date'),
+        )
+
+    def process_iter(self, raw_products: Iterable[RawProduct], timeframe_info: Dict) -> Iterator[Product]:
         for raw in raw_products:
-            record = {
-                "id": raw.get('id'),
-                "title": self._normalize_text(raw.get('name')),
-                "description": self._normalize_text(raw.get('description')),
-                "promotion": self._normalize_text(raw.get('promotion')),
-                "price_now": self._normalize_price(raw.get('price_now_raw')),
-                "price_was": self._normalize_price(raw.get('price_was_raw')),
-                "image_url": urljoin(self.base_url, raw.get('image_url')) if raw.get('image_url') else None,
-                "source_url": urljoin(self.base_url, raw.get('source_url')) if raw.get('source_url') else None,
-                "child_page_url": urljoin(self.base_url, raw.get('child_page_url')) if raw.get('child_page_url') else None,
-                "start_date": timeframe_info.get('start_date'),
-                "end_date": timeframe_info.get('end_date'),
-                "child_products": []
-            }
-            normalized_list.append(record)
-        return normalized_list
-
-def get_timeframe_urls(initial_url: str) -> Dict[str, Dict]:
-    logging.info("--- Getting all timeframe URLs ---")
-    scraper = HoogvlietScraper(headless=True)
-    driver = scraper.start_driver()
-    base_url = "https://www.hoogvliet.com/INTERSHOP/web/WFS/org-webshop-Site/nl_NL/-/EUR/ViewStandardCatalog-Browse"
-    urls = {}
+            yield self.normalize(raw, timeframe_info)
+
+    def process(self, raw_products: List[RawProduct], timeframe_info: Dict) -> List[Product]:
+        return list(self.process_iter(raw_products, timeframe_info))
+
+def read_filters_http(initial_url: str, client: Optional['httpx.Client'] = None) -> List[Filter]:
+    own_client = client is None
+    client = client or build_http_client(1)
     try:
-        driver.get(initial_url)
-        wait = WebDriverWait(driver, CONFIG['timeout'])
-        wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, 'input.filter-checkbox[data-document-location]')))
-        
-        normalizer = DataNormalizer(CONFIG['base_url'])
-        
-        current_input = driver.find_element(By.CSS_SELECTOR, 'input.filter-checkbox:checked')
-        current_url = current_input.get_attribute('data-document-location')
-        current_label = driver.find_element(By.CSS_SELECTOR, f"label[for='{current_input.get_attribute('id')}']").text
-        start_date, end_date = normalizer._parse_date_range(current_label)
-        urls['current'] = { "url": base_url + "?" + current_url.split('?')[-1], "start_date": start_date, "end_date": end_date }
-
-        coming_input = driver.find_element(By.CSS_SELECTOR, 'input.filter-checkbox:not(:checked)')
-        coming_url = coming_input.get_attribute('data-document-location')
-        coming_label = driver.find_element(By.CSS_SELECTOR, f"label[for='{coming_input.get_attribute('id')}']").text
-        start_date, end_date = normalizer._parse_date_range(coming_label)
-        urls['coming'] = { "url": base_url + "?" + coming_url.split('?')[-1], "start_date": start_date, "end_date": end_date }
-
-        logging.info(f"Found timeframe URLs to scrape.")
-        return urls
+        response = client.get(initial_url)
+        response.raise_for_status()
+        METRICS.inc('bytes_downloaded', response.num_bytes_downloaded, engine='http')
+        return read_filters(response.text, CONFIG['html_backend'])
+    finally:
+        if own_client:
+            client.close()
+
+def read_filters_browser(initial_url: str, pool: Optional['DriverPool'] = None) -> List[Filter]:
+    import browser
+    return browser.read_filters_browser(initial_url, pool)
+
+def read_range_filters(filters: List[Filter], initial_url: str, read: Callable[[str], List[Filter]],
+                       normalizer: DataNormalizer) -> Dict[str, List[Filter]]:
+    """The filters of every range after the current week, read from that range's own listing page."""
+    range_filters = {}
+    for timeframe in plan_timeframes(filters, initial_url, normalizer._parse_date_range)[1:]:
+        try:
+            range_filters[timeframe.url] = read(timeframe.url)
+        except Exception as e:
+            # plan_from_filters scrapes a range without filters unsplit, so nothing is lost.
+            logging.warning(f"Could not read the categories of {timeframe.key}, scraping it unsharded: {e}")
+    return range_filters
+
+@profiling.profiled('discover')
+def discover_shards(initial_url: str, pool: Optional['DriverPool'] = None, client: Optional['httpx.Client'] = None,
+                    use_cache: bool = True) -> List[Shard]:
+    logging.info("--- Discovering promotion ranges and categories ---")
+    discover_start = time.perf_counter()
+    normalizer = DataNormalizer(CONFIG['base_url'])
+    by_category = CONFIG['sharding'] == 'category'
+    cache = DiscoveryCache(CONFIG['discovery_cache'], CONFIG['discovery_cache_ttl']) if CONFIG['discovery_cache'] else None
+
+    cached = cache.load(initial_url) if cache and use_cache else None
+    if cached:
+        logging.info(f"Using the promotion ranges cached in {CONFIG['discovery_cache']}")
+        shards = plan_from_filters(cached[0], initial_url, normalizer._parse_date_range, by_category, cached[1])
+        if shards:
+            METRICS.observe('discover', time.perf_counter() - discover_start, items=len(shards), source='cache')
+            return shards
+
+    # The offers page is rendered server-side, so the filters can be read without a browser; Chrome is
+    # only started when that fails or the page comes back without week filters.
+    sources = [('browser', partial(read_filters_browser, pool=pool))]
+    if CONFIG['discovery'] == 'http':
+        sources.insert(0, ('http', partial(read_filters_http, client=client)))
+    for source, read in sources:
+        try:
+            filters = read(initial_url)
+        except Exception as e:
+            logging.error(f"Error discovering promotion ranges via {source}: {e}")
+            continue
+        range_filters = read_range_filters(filters, initial_url, read, normalizer) if by_category else {}
+        shards = plan_from_filters(filters, initial_url, normalizer._parse_date_range, by_category, range_filters)
+        if not shards:
+            logging.warning(f"No promotion ranges found via {source}.")
+            continue
+        if cache:
+            try:
+                cache.save(initial_url, filters, shards[0].timeframe, range_filters)
+            except OSError as e:
+                logging.warning(f"Could not write the discovery cache: {e}")
+        METRICS.observe('discover', time.perf_counter() - discover_start, items=len(shards), source=source)
+        return shards
+    return []
+
+def normalize_incremental(normalizer: DataNormalizer, raw_products: List[RawProduct], info: Dict, run: IncrementalRun) -> Iterator[Product]:
+    for raw in raw_products:
+        record = run.reuse(raw)
+        if record is None:
+            record = normalizer.normalize(raw, info)
+            run.record(record)
+        yield record
+
+def scrape_url(url: str, pool: Optional['DriverPool'] = None, raise_errors: bool = False,
+               client: Optional['httpx.Client'] = None) -> List[RawProduct]:
+    if CONFIG['engine'] == 'http':
+        scraper = HoogvlietHttpScraper(client=client)
+        try:
+            return scraper.scrape_page(url, raise_errors=raise_errors)
+        finally:
+            scraper.close()
+    from browser import HoogvlietScraper
+    scraper = HoogvlietScraper(headless=CONFIG['headless'], pool=pool)
+    return scraper.scrape_page(url, max_scrolls=200, raise_errors=raise_errors)
+
+def shards_cover_range(timeframe: Timeframe, count: int, client: Optional['httpx.Client'] = None) -> bool:
+    """Checks the merged category shards of a range against its unsharded listing over HTTP (with either engine).
+
+    Products in no category, or in a category missing from the filters, are only on the unsharded listing.
+    """
+    scraper = HoogvlietHttpScraper(client=client)
+    try:
+        return scraper.listing_holds(timeframe.url, count)
     except Exception as e:
-        logging.error(f"Error getting timeframe URLs: {e}")
+        logging.warning(f"Could not check the shards of {timeframe.key} against its listing: {e}")
+        return False
+    finally:
+        scraper.close()
+
+@profiling.profiled('shard')
+def scrape_shard(shard: Shard, pool: Optional['DriverPool'] = None, client: Optional['httpx.Client'] = None) -> List[RawProduct]:
+    with METRICS.timer('shard', timeframe=shard.timeframe.key) as timing:
+        raw_data = scrape_url(shard.url, pool, raise_errors=True, client=client)
+        timing.items = len(raw_data)
+    logging.info(f"Shard {shard.key}: {len(raw_data)} products")
+    return raw_data
+
+def offers_path(key: str) -> str:
+    """The NDJSON offers file of a timeframe, before NdjsonWriter adds the compression suffix."""
+    return os.path.join(CONFIG['output_dir'], f"{key}_offers.ndjson")
+
+@profiling.profiled('timeframe')
+def process_timeframe(key: str, info: Dict, raw_data: List[RawProduct], store: Optional[ProductStateStore] = None) -> Tuple[int, Optional[str]]:
+    if not raw_data:
+        return 0, None
+    normalizer = DataNormalizer(CONFIG['base_url'])
+    output_path = offers_path(key)
+    run = store.start_run(state_key_for(info)) if store else None
+    records = normalize_incremental(normalizer, raw_data, info, run) if run else normalizer.process_iter(raw_data, info)
+    # Normalization runs lazily inside write_many, so its time is taken out of the write figure.
+    records = METRICS.timed_iter(records, 'normalize', timeframe=key)
+    write_start = time.perf_counter()
+    with NdjsonWriter(output_path, compression=CONFIG['output_compression'], backend=CONFIG['json_backend']) as writer:
+        writer.write_many(records)
+    METRICS.observe('write', time.perf_counter() - write_start - records.elapsed, items=writer.count,
+                    timeframe=key, format='ndjson')
+    cache_summary = ", ".join(f"{name} {stats['hits']}/{stats['hits'] + stats['misses']}" for name, stats in normalizer.cache_stats().items())
+    logging.info(f"Normalizer cache hits: {cache_summary}")
+
+    if run:
+        delta = run.finish()
+        delta_path = os.path.join(CONFIG['output_dir'], f"{key}_delta.json")
+        with open(delta_path, 'w', encoding='utf-8') as f:
+            json.dump(delta, f, ensure_ascii=False, indent=2)
+        logging.info(f"{key}: {run.unchanged} unchanged, {len(delta['added'])} added, {len(delta['removed'])} removed, "
+                     f"{len(delta['price_changed'])} price changes. Delta saved to {delta_path}")
+    return writer.count, writer.path
+
+@profiling.profiled('timeframe')
+def scrape_and_process_worker(key: str, info: Dict, pool: Optional['DriverPool'] = None, store: Optional[ProductStateStore] = None) -> Tuple[int, Optional[str]]:
+    return process_timeframe(key, info, scrape_url(info['url'], pool), store)
+
+def write_pretty_json(key: str, ndjson_path: str) -> str:
+    filename = os.path.join(CONFIG['output_dir'], f"{key}_offers.json")
+    with METRICS.timer('write', timeframe=key, format='pretty_json') as timing, profiling.stage('write'):
+        timing.items = finalize_pretty_json(ndjson_path, filename, compression=CONFIG['output_compression'])
+    logging.info(f"Wrote pretty JSON to {filename}")
+    return filename
+
+def offers_files(keys: Optional[List[str]] = None) -> Dict[str, str]:
+    """Timeframe key -> NDJSON offers file in the output directory, for all keys or just ``keys``."""
+    suffix = "_offers.ndjson" + COMPRESSION_SUFFIXES[CONFIG['output_compression']]
+    files = {}
+    for name in sorted(os.listdir(CONFIG['output_dir'])) if os.path.isdir(CONFIG['output_dir']) else []:
+        if name.endswith(suffix):
+            files[name[:-len(suffix)]] = os.path.join(CONFIG['output_dir'], name)
+    if keys:
+        missing = [key for key in keys if key not in files]
+        if missing:
+            raise FileNotFoundError(f"No offers file for {', '.join(missing)} in {CONFIG['output_dir']}")
+        files = {key: files[key] for key in keys}
+    return files
+
+def save_raw(raw_dir: str, key: str, info: Dict, raw_data: List[RawProduct]) -> str:
+    """Writes a timeframe's raw products for ``normalize-from-raw``; timeframes.json keeps their dates and URL."""
+    os.makedirs(raw_dir, exist_ok=True)
+    with NdjsonWriter(os.path.join(raw_dir, f"{key}_raw.ndjson"), compression=CONFIG['output_compression'],
+                      backend=CONFIG['json_backend']) as writer:
+        writer.write_many(raw_data)
+    index = load_raw_index(raw_dir)
+    index[key] = {"info": info, "file": os.path.basename(writer.path), "compression": CONFIG['output_compression'],
+                  "count": writer.count}
+    index_path = os.path.join(raw_dir, 'timeframes.json')
+    with open(index_path + '.part', 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(index_path + '.part', index_path)
+    logging.info(f"Saved {writer.count} raw products to {writer.path}")
+    return writer.path
+
+def load_raw_index(raw_dir: str) -> Dict[str, Dict]:
+    try:
+        with open(os.path.join(raw_dir, 'timeframes.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
         return {}
+
+def normalize_from_raw(raw_dir: str, keys: Optional[List[str]] = None) -> int:
+    """Normalizes and writes the timeframes saved by ``save_raw``, as the second half of a full run would."""
+    index = load_raw_index(raw_dir)
+    missing = [key for key in keys or [] if key not in index]
+    if missing or not index:
+        logging.error(f"No raw products for {', '.join(missing) or 'any timeframe'} in {raw_dir}")
+        return 1
+    store = ProductStateStore(CONFIG['state_db']) if CONFIG['incremental'] else None
+    try:
+        for key in keys or list(index):
+            entry = index[key]
+            records = read_ndjson(os.path.join(raw_dir, entry['file']), entry['compression'])
+            raw_data = [RawProduct.from_dict(record) for record in records]
+            product_count, ndjson_path = process_timeframe(key, entry['info'], raw_data, store)
+            logging.info(f"Saved {product_count} products to {ndjson_path}")
+            if product_count and CONFIG['output_pretty_json']:
+                write_pretty_json(key, ndjson_path)
+    finally:
+        if store:
+            store.close()
+    return 0
+
+def fetch_child_pages(parent_counts: Dict[str, int], scope: str, frontier: 'ChildFrontier'):
+    """Fetches the child pages not yet claimed this run and resolves them on ``frontier``: raw products, or None when
+    the page could not be fetched or parsed."""
+    from child_crawler import AsyncChildCrawler
+    from http_cache import ResponseCache
+    from pipeline import ParsePipeline, parse_child_html
+
+    claimed = frontier.claim(parent_counts)
+    if not claimed:
+        return
+    cache = ResponseCache(CONFIG['http_cache_path'], ttl=CONFIG['http_cache_ttl'], max_bytes=CONFIG['http_cache_max_bytes'],
+                          mode=CONFIG['http_cache_mode']) if CONFIG['http_cache_path'] else None
+    crawler = AsyncChildCrawler(rate=CONFIG['child_rate'], burst=CONFIG['child_burst'], concurrency=CONFIG['child_concurrency'],
+                                user_agent=CONFIG['user_agent'], timeout=CONFIG['timeout'], cache=cache)
+    pipeline = ParsePipeline(partial(parse_child_html, backend=CONFIG['html_backend']), workers=CONFIG['child_parse_workers'],
+                             queue_size=CONFIG['child_parse_queue_size'])
+
+    def produce(emit):
+        def on_page(url: str, html: str):
+            capture.record_child(url, html)
+            emit(url, html)
+        crawler.run(claimed, scope, on_page=on_page)
+
+    pages = {}
+    try:
+        pages = pipeline.run(produce)
     finally:
-        if driver:
-            driver.quit()
+        # Always resolve what was claimed, later timeframes wait on it.
+        for url in claimed:
+            frontier.resolve(url, pages.get(url))
+        crawler.log_stats()
+        pipeline.log_stats()
+        if cache:
+            cache.log_stats()
+            cache.close()
+
+@profiling.profiled('child_crawl')
+def crawl_child_pages(key: str, ndjson_path: str, child_pages: Optional[Dict[str, List[RawProduct]]] = None,
+                      frontier: Optional['ChildFrontier'] = None, store: Optional[ProductStateStore] = None) -> int:
+    """Adds the products on each parent's child page to an offers file and returns the number of child pages used.
+
+    The child pages are fetched unless ``child_pages`` (url -> raw products, as replay has them) is given. Pages
+    already fetched for another timeframe sharing ``frontier`` are not fetched again. With ``store``, the parents are
+    stored with their children, and a page whose parents were all reused with their stored children is not fetched.
+    """
+    products = [Product.from_dict(record) for record in read_ndjson(ndjson_path, CONFIG['output_compression'])]
+    parents_by_url: Dict[str, List[Product]] = {}
+    for product in products:
+        if product.child_page_url:
+            parents_by_url.setdefault(product.child_page_url, []).append(product)
+    if not parents_by_url:
+        logging.info(f"{key}: no child pages to crawl.")
+        return 0
+
+    # All parents in an offers file share one promotion week, which is also the cache scope.
+    info = {"start_date": products[0].start_date, "end_date": products[0].end_date}
+    state_key = state_key_for(info) if store and info['start_date'] and info['end_date'] else None
+    stored = store.child_hashes(state_key) if state_key else {}
+    kept = 0
+    if child_pages is None:
+        from child_crawler import ChildFrontier
+        frontier = frontier or ChildFrontier()
+        # Parents the last scrape reused unchanged came back from the store with their children.
+        pending = {url: len(parents) for url, parents in parents_by_url.items()
+                   if not all(parent.id in stored for parent in parents)}
+        kept = len(parents_by_url) - len(pending)
+        fetch_child_pages(pending, f"{info['start_date']}/{info['end_date']}", frontier)
+        child_pages = {url: frontier.result(url) for url in pending}
 
-def scrape_and_process_worker(url: str, info: Dict):
-    scraper = HoogvlietScraper(headless=CONFIG['headless'])
-    raw_data = scraper.scrape_page(url, max_scrolls=200)
     normalizer = DataNormalizer(CONFIG['base_url'])
-    return normalizer.process(raw_data, info)
+    merged_parents = []
+    changed = 0
+    for url, parents in parents_by_url.items():
+        if child_pages.get(url) is None:
+            continue
+        children = normalizer.process(child_pages[url], info)
+        digest = children_hash(child_pages[url])
+        # Replaced rather than extended, so crawling the same file twice does not duplicate children.
+        for parent in parents:
+            parent.child_products = children
+            changed += parent.id in stored and stored[parent.id] != digest
+        merged_parents.extend((parent, digest) for parent in parents)
+    merged = len({parent.child_page_url for parent, _ in merged_parents})
+
+    with NdjsonWriter(offers_path(key), compression=CONFIG['output_compression'], backend=CONFIG['json_backend']) as writer:
+        writer.write_many(products)
+    if state_key:
+        # Otherwise the next scrape reuses the stored parents without children and overwrites these.
+        store.save_children(state_key, merged_parents)
+    logging.info(f"{key}: added the products of {merged} of {len(parents_by_url)} child pages to {writer.path}"
+                 f"{f', kept the stored children of {kept}' if kept else ''}"
+                 f"{f', {changed} parents got different children' if changed else ''}")
+    return merged
+
+def crawl_children(keys: Optional[List[str]] = None) -> int:
+    from child_crawler import ChildFrontier
+
+    # One frontier for all timeframes: a child page listed in both weeks is fetched and parsed once.
+    frontier = ChildFrontier()
+    store = ProductStateStore(CONFIG['state_db']) if CONFIG['incremental'] else None
+    errors = 0
+    try:
+        for key, ndjson_path in offers_files(keys).items():
+            try:
+                crawl_child_pages(key, ndjson_path, frontier=frontier, store=store)
+                if CONFIG['output_pretty_json']:
+                    write_pretty_json(key, ndjson_path)
+            except Exception as exc:
+                logging.error(f"Crawling the child pages of {key} failed: {exc}", exc_info=True)
+                errors += 1
+    finally:
+        if store:
+            store.close()
+    frontier.log_stats()
+    return errors
+
+def export(keys: Optional[List[str]] = None, format: str = 'json') -> int:
+    """Writes the pretty JSON of the offers files, or with ``format='sqlite'`` loads them into ``offers_db``."""
+    files = offers_files(keys)
+    if not files:
+        logging.error(f"No offers files in {CONFIG['output_dir']}")
+        return 1
+    if format == 'sqlite':
+        from offers_store import OfferStore
+        store = OfferStore(CONFIG['offers_db'])
+        try:
+            for key, ndjson_path in files.items():
+                count = store.load(key, read_ndjson(ndjson_path, CONFIG['output_compression']))
+                logging.info(f"{key}: loaded {count} offers into {CONFIG['offers_db']}")
+        finally:
+            store.close()
+        return 0
+    for key, ndjson_path in files.items():
+        write_pretty_json(key, ndjson_path)
+    return 0
+
+def scrape_run(pool: Optional['DriverPool'] = None, client: Optional['httpx.Client'] = None,
+               store: Optional[ProductStateStore] = None, shards: Optional[List[Shard]] = None,
+               normalize: bool = True) -> Dict[str, Any]:
+    """Scrapes every shard and writes each timeframe as soon as its shards are done.
 
-def main():
+    The driver pool, HTTP client and state store belong to the caller, so daemon.py can keep them warm
+    between runs; ``shards`` skips discovery when the caller has just done it. Returns the run summary
+    of the metrics report, plus the info of every promotion range under ``timeframes``.
+    """
     start_time = time.time()
-    initial_url = CONFIG['initial_url']
-    
-    output_dir = 'output'
+    output_dir = CONFIG['output_dir']
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
         logging.info(f"Created directory: {output_dir}")
 
-    urls_to_scrape = get_timeframe_urls(initial_url)
-    if not urls_to_scrape:
+    shards = shards if shards is not None else discover_shards(CONFIG['initial_url'], pool=pool, client=client)
+    if not shards:
         print("No urls to scrape")
-        return
+        return {"started": datetime.fromtimestamp(start_time).isoformat(timespec='seconds'),
+                "duration_seconds": round(time.time() - start_time, 3), "products": 0, "errors": 1, "timeframes": []}
     total_products_scraped = 0
     error_count = 0
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        future_to_key = {executor.submit(scrape_and_process_worker, info['url'], info): key for key, info in urls_to_scrape.items()}
-        
-        for future in concurrent.futures.as_completed(future_to_key):
-            key = future_to_key[future]
+    scheduler = ShardScheduler(workers=CONFIG['concurrency'])
+    for timeframe, raw_data, failed_shards in scheduler.run(shards, partial(scrape_shard, pool=pool, client=client)):
+        key = timeframe.key
+        if failed_shards:
+            logging.error(f"{key} offers skipped: {len(failed_shards)} of its shards failed.")
+            error_count += len(failed_shards)
+            continue
+        listing_urls = [shard.url for shard in shards if shard.timeframe.key == key]
+        if len(listing_urls) > 1 and not shards_cover_range(timeframe, len(raw_data), client):
+            # Scraping the whole range again costs time, but a missing product would be stored as removed.
+            logging.warning(f"{key}: the category shards do not add up to the unsharded listing "
+                            f"({len(raw_data)} products), scraping {key} unsharded.")
+            METRICS.inc('shard_fallbacks', timeframe=key)
             try:
-                products = future.result()
-                if products:
-                    total_products_scraped += len(products)
-                    filename = os.path.join(output_dir, f"{key}_offers.json")
-                    with open(filename, 'w', encoding='utf-8') as f:
-                        json.dump(products, f, ensure_ascii=False, indent=2)
-                    logging.info(f"Saved {len(products)} products to {filename}")
+                raw_data = scrape_shard(Shard(timeframe), pool=pool, client=client)
+                listing_urls = [timeframe.url]
             except Exception as exc:
-                logging.error(f'{key} offers generated an exception: {exc}')
+                logging.error(f"{key} offers skipped: the unsharded scrape failed: {exc}")
                 error_count += 1
+                continue
+        try:
+            capture.record_timeframe(key, timeframe.info, listing_urls, raw_data)
+            if CONFIG['raw_dir'] and raw_data:
+                save_raw(CONFIG['raw_dir'], key, timeframe.info, raw_data)
+            if not normalize:
+                total_products_scraped += len(raw_data)
+                continue
+            product_count, ndjson_path = process_timeframe(key, timeframe.info, raw_data, store)
+            if product_count:
+                total_products_scraped += product_count
+                logging.info(f"Saved {product_count} products to {ndjson_path}")
+                if CONFIG['output_pretty_json']:
+                    write_pretty_json(key, ndjson_path)
+        except Exception as exc:
+            logging.error(f'{key} offers generated an exception: {exc}')
+            error_count += 1
     duration = time.time() - start_time
     logging.info(f"\n--- SCRAPING SUMMARY ---")
     logging.info(f"Total products scraped: {total_products_scraped}")
     logging.info(f"Total errors encountered: {error_count}")
     logging.info(f"Total duration: {duration:.2f} seconds")
+    run = {
+        "started": datetime.fromtimestamp(start_time).isoformat(timespec='seconds'),
+        "duration_seconds": round(duration, 3), "products": total_products_scraped, "errors": error_count,
+        "engine": CONFIG['engine'], "concurrency": CONFIG['concurrency'],
+    }
+    METRICS.finish_run(run, CONFIG['metrics_report'], CONFIG['metrics_textfile'])
+    timeframes = {shard.timeframe.key: shard.timeframe for shard in shards}
+    return dict(run, timeframes=[dict(timeframe.info, key=key) for key, timeframe in timeframes.items()])
+
+def main(normalize: bool = True) -> int:
+    """The full run: discover, scrape every shard and write each timeframe as soon as its shards are done.
+
+    With ``normalize=False`` only the raw products are kept (in ``raw_dir``), for ``normalize_from_raw``.
+    """
+    pool = None
+    if CONFIG['engine'] == 'browser':
+        from browser import DriverPool
+        pool = DriverPool(size=CONFIG['concurrency'], headless=CONFIG['headless'])
+    # One connection pool for all shards, sized so every shard can fetch its pages in parallel.
+    client = build_http_client(CONFIG['concurrency'] * CONFIG['http_max_workers']) if CONFIG['engine'] == 'http' else None
+    store = ProductStateStore(CONFIG['state_db']) if CONFIG['incremental'] and normalize else None
+    try:
+        run = scrape_run(pool, client, store, normalize=normalize)
+    finally:
+        if pool:
+            pool.close()
+        if client:
+            client.close()
+        if store:
+            store.close()
+    return 1 if run['errors'] or not run['timeframes'] else 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Same as `python cli.py scrape`. cli.py imports this file again as `scraper`, and the run uses that copy's CONFIG.
+    import cli
+    sys.exit(cli.main(['scrape'] + sys.argv[1:]))
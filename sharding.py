@@ -0,0 +1,274 @@
+import concurrent.futures
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from datetime import date
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit
+
+from html_backends import get_backend
+from metrics import METRICS
+from models import RawProduct
+
+# Splits a run into independent shards: one per promotion range and product
+# category. The offers page lists both as filter checkboxes whose
+# data-document-location holds the listing URL with that filter applied; the
+# week filters are told apart by their "Deze week | 12 oktober - 18 oktober"
+# style labels, everything else with a ContextCategoryUUID is a category.
+# The category filters (and their counts) only describe the range the page
+# shows, so the other ranges are split by the filters of their own listing
+# page, or scraped whole when those are not known. Shards of the same range
+# are merged again before normalization, so the output and the incremental
+# state stay per timeframe.
+
+Filter = Tuple[str, str, bool]
+
+CATEGORY_RE = re.compile(r'([&?]ContextCategoryUUID=)([^&]*)')
+COUNT_RE = re.compile(r'\((\d+)\)\s*$')
+SLUG_RE = re.compile(r'[^a-z0-9]+')
+
+
+class Timeframe:
+    def __init__(self, key: str, url: str, start_date: Optional[str], end_date: Optional[str], label: str = ''):
+        self.key = key
+        self.url = url
+        self.start_date = start_date
+        self.end_date = end_date
+        self.label = label
+
+    @property
+    def info(self) -> Dict[str, Optional[str]]:
+        return {"url": self.url, "start_date": self.start_date, "end_date": self.end_date}
+
+
+class Category:
+    def __init__(self, uuid: str, name: str, estimate: Optional[int] = None):
+        self.uuid = uuid
+        self.name = name
+        self.estimate = estimate
+
+    @property
+    def slug(self) -> str:
+        return SLUG_RE.sub('-', self.name.lower()).strip('-') or self.uuid
+
+
+class Shard:
+    def __init__(self, timeframe: Timeframe, category: Optional[Category] = None):
+        self.timeframe = timeframe
+        self.category = category
+        self.key = f"{timeframe.key}/{category.slug}" if category else timeframe.key
+        self.url = with_category(timeframe.url, category.uuid) if category else timeframe.url
+
+    @property
+    def estimate(self) -> int:
+        return (self.category.estimate or 0) if self.category else 0
+
+    def __repr__(self) -> str:
+        return f"Shard({self.key!r})"
+
+
+def search_parameter(url: str) -> str:
+    return dict(parse_qsl(urlsplit(url).query, keep_blank_values=True)).get('SearchParameter', '')
+
+
+def category_uuid(url: str) -> Optional[str]:
+    match = CATEGORY_RE.search(search_parameter(url))
+    return match.group(2) if match else None
+
+
+def with_category(url: str, uuid: str) -> str:
+    """Returns ``url`` with the ContextCategoryUUID inside its SearchParameter replaced by ``uuid``."""
+    parts = urlsplit(url)
+    query = []
+    for name, value in parse_qsl(parts.query, keep_blank_values=True):
+        if name == 'SearchParameter':
+            if CATEGORY_RE.search(value):
+                value = CATEGORY_RE.sub(lambda match: match.group(1) + uuid, value)
+            else:
+                value += f"&ContextCategoryUUID={uuid}"
+        query.append((name, value))
+    return parts._replace(query=urlencode(query, quote_via=quote, safe='*')).geturl()
+
+
+def read_filters(html: str, backend: str = 'auto') -> List[Filter]:
+    """(document location, label, checked) for every filter checkbox on the page."""
+    parser = get_backend(backend)
+    root = parser.parse(html)
+    labels = {}
+    for label in parser.select(root, 'label'):
+        target = parser.attr(label, 'for')
+        if target:
+            labels[target] = parser.text(label).strip()
+    filters = []
+    for checkbox in parser.select(root, 'input.filter-checkbox'):
+        location = parser.attr(checkbox, 'data-document-location')
+        if location:
+            filters.append((location, labels.get(parser.attr(checkbox, 'id'), ''), parser.attr(checkbox, 'checked') is not None))
+    return filters
+
+
+def plan_shards(html: str, page_url: str, parse_date_range: Callable[[str], Tuple[Optional[str], Optional[str]]],
+                by_category: bool = True, range_pages: Optional[Dict[str, str]] = None) -> List[Shard]:
+    range_filters = {url: read_filters(page) for url, page in (range_pages or {}).items()}
+    return plan_from_filters(read_filters(html), page_url, parse_date_range, by_category, range_filters)
+
+
+def plan_timeframes(filters: List[Filter], page_url: str,
+                    parse_date_range: Callable[[str], Tuple[Optional[str], Optional[str]]]) -> List[Timeframe]:
+    """The promotion ranges on the page: the checked one is the current week, the others follow in page order."""
+    browse_url = page_url.split('?')[0]
+    ranges = []
+    for location, label, checked in filters:
+        start_date, end_date = parse_date_range(label)
+        if start_date:
+            ranges.append((checked, browse_url + "?" + location.split('?')[-1], start_date, end_date, label))
+    ranges.sort(key=lambda entry: not entry[0])
+    timeframes = []
+    for number, (_, url, start_date, end_date, label) in enumerate(ranges):
+        key = 'current' if number == 0 else 'coming' if number == 1 else f"coming_{number}"
+        timeframes.append(Timeframe(key, url, start_date, end_date, label))
+    return timeframes
+
+
+def read_categories(filters: List[Filter], page_url: str,
+                    parse_date_range: Callable[[str], Tuple[Optional[str], Optional[str]]]) -> Dict[str, Category]:
+    browse_url = page_url.split('?')[0]
+    categories = {}
+    for location, label, _ in filters:
+        if parse_date_range(label)[0]:
+            continue
+        uuid = category_uuid(browse_url + "?" + location.split('?')[-1])
+        if uuid and uuid not in categories:
+            count = COUNT_RE.search(label)
+            name = COUNT_RE.sub('', label).strip() or uuid
+            categories[uuid] = Category(uuid, name, int(count.group(1)) if count else None)
+    return categories
+
+
+def plan_from_filters(filters: List[Filter], page_url: str,
+                      parse_date_range: Callable[[str], Tuple[Optional[str], Optional[str]]],
+                      by_category: bool = True, range_filters: Optional[Dict[str, List[Filter]]] = None) -> List[Shard]:
+    """Builds the shard plan from the offers page filters; without category filters there is one shard per range.
+
+    ``filters`` come from the page showing the current week; ``range_filters``
+    maps the URL of every other range to the filters of its own page. A range
+    missing from it is not split, since the current week's categories and
+    counts say nothing about which categories it has.
+    """
+    timeframes = plan_timeframes(filters, page_url, parse_date_range)
+    shards = []
+    for number, timeframe in enumerate(timeframes):
+        range_page = filters if number == 0 else (range_filters or {}).get(timeframe.url)
+        categories = read_categories(range_page, page_url, parse_date_range) if by_category and range_page else {}
+        # The listing's own category is the root of the catalog, not a shard.
+        own_category = category_uuid(timeframe.url)
+        selected = [category for uuid, category in categories.items()
+                    if uuid != own_category and category.estimate != 0]
+        if selected:
+            shards.extend(Shard(timeframe, category) for category in selected)
+        else:
+            shards.append(Shard(timeframe))
+        logging.debug(f"Promotion range {timeframe.key}: {len(selected) or 1} shards from {len(categories)} categories.")
+    logging.info(f"Planned {len(shards)} shards over {len(timeframes)} promotion ranges.")
+    return shards
+
+
+class DiscoveryCache:
+    """The offers page filters and those of the other ranges' pages, kept on disk until the current
+    promotion week ends or ``ttl`` seconds pass."""
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        self.path = path
+        self.ttl = ttl
+
+    def load(self, page_url: str) -> Optional[Tuple[List[Filter], Dict[str, List[Filter]]]]:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('page_url') != page_url:
+            return None
+        if self.ttl is not None and time.time() - entry['fetched_at'] > self.ttl:
+            return None
+        # Keyed to the current week: once it has ended the ranges on the page have rolled over.
+        if not entry.get('end_date') or date.today().isoformat() > entry['end_date']:
+            return None
+        # Written before the other ranges' filters were kept.
+        if 'range_filters' not in entry:
+            return None
+        range_filters = {url: [tuple(item) for item in items] for url, items in entry['range_filters'].items()}
+        return [tuple(item) for item in entry['filters']], range_filters
+
+    def save(self, page_url: str, filters: List[Filter], current: Timeframe,
+             range_filters: Optional[Dict[str, List[Filter]]] = None):
+        entry = {
+            "page_url": page_url, "fetched_at": time.time(),
+            "start_date": current.start_date, "end_date": current.end_date, "filters": filters,
+            "range_filters": range_filters or {},
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.part', 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        os.replace(self.path + '.part', self.path)
+
+
+def merge_shard_products(parts: Iterable[List[RawProduct]]) -> List[RawProduct]:
+    """Concatenates shard results, keeping the first copy of products listed in several categories."""
+    seen = set()
+    merged = []
+    for products in parts:
+        for product in products:
+            if product.id not in seen:
+                seen.add(product.id)
+                merged.append(product)
+    return merged
+
+
+class ShardScheduler:
+    """Runs shards on a worker pool and hands back each timeframe once all of its shards are done.
+
+    ``run`` yields ``(timeframe, products, errors)`` in completion order while
+    the remaining shards keep running. A timeframe with failed shards comes
+    back with ``products`` set to None, so an incomplete scrape never reaches
+    the incremental state as removals.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+
+    def run(self, shards: List[Shard], scrape: Callable[[Shard], List[RawProduct]]
+            ) -> Iterator[Tuple[Timeframe, Optional[List[RawProduct]], List[Tuple[Shard, Exception]]]]:
+        by_timeframe: Dict[str, List[Shard]] = {}
+        for shard in shards:
+            by_timeframe.setdefault(shard.timeframe.key, []).append(shard)
+        pending = Counter({key: len(group) for key, group in by_timeframe.items()})
+        results: Dict[str, List[RawProduct]] = {}
+        errors: Dict[str, List[Tuple[Shard, Exception]]] = {}
+        METRICS.set('shards', len(shards))
+
+        # Largest categories first, so none of them starts last and holds up the run.
+        ordered = sorted(shards, key=lambda shard: -shard.estimate)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shard') as executor:
+            futures = {executor.submit(scrape, shard): shard for shard in ordered}
+            for future in concurrent.futures.as_completed(futures):
+                shard = futures[future]
+                key = shard.timeframe.key
+                try:
+                    results[shard.key] = future.result()
+                except Exception as e:
+                    logging.error(f"Shard {shard.key} failed: {e}")
+                    METRICS.inc('shard_errors', timeframe=key)
+                    errors.setdefault(key, []).append((shard, e))
+                pending[key] -= 1
+                if pending[key]:
+                    continue
+                group = by_timeframe[key]
+                parts = [results.pop(member.key, []) for member in group]
+                failed = errors.pop(key, [])
+                yield shard.timeframe, None if failed else merge_shard_products(parts), failed
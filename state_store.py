@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import Product, RawProduct
+
+# Bump when normalization changes, so stored records are rebuilt instead of reused.
+STATE_VERSION = 3
+
+# Session tokens Intershop appends to links change on every visit and would
+# otherwise make every product look changed.
+SESSION_TOKEN_RE = re.compile(r';(?:pgid|sid|jsessionid)=[^;?#"]*', re.IGNORECASE)
+# HTML backends repair broken markup differently (html.parser nests an
+# unclosed <p>, lxml and Lexbor close it), so the raw price fragments are
+# hashed without end tags, comments and whitespace runs. Switching
+# html_backend then does not make every product look changed.
+MARKUP_NOISE_RE = re.compile(r'<!--.*?-->|</[^>]*>', re.DOTALL)
+WHITESPACE_RE = re.compile(r'\s+')
+MARKUP_FIELDS = ('price_now_raw', 'price_was_raw')
+
+
+def canonical_markup(html: str) -> str:
+    return WHITESPACE_RE.sub(' ', MARKUP_NOISE_RE.sub('', html)).strip()
+
+
+def content_hash(raw: Dict[str, Any]) -> str:
+    raw = dict(raw)
+    for field in MARKUP_FIELDS:
+        if isinstance(raw.get(field), str):
+            raw[field] = canonical_markup(raw[field])
+    payload = json.dumps(raw, sort_keys=True, ensure_ascii=False, default=str)
+    payload = SESSION_TOKEN_RE.sub('', payload)
+    return hashlib.sha1(f"{STATE_VERSION}:{payload}".encode('utf-8')).hexdigest()
+
+
+def children_hash(raw_children: List[RawProduct]) -> str:
+    return hashlib.sha1(':'.join(content_hash(raw.to_dict()) for raw in raw_children).encode('ascii')).hexdigest()
+
+
+def state_key_for(info: Dict) -> str:
+    # Keyed on the promotion week rather than 'current'/'coming', so last
+    # week's 'coming' scrape is reused once it becomes 'current'.
+    if info.get('start_date') and info.get('end_date'):
+        return f"{info['start_date']}/{info['end_date']}"
+    return info['url']
+
+
+class ProductStateStore:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            " state_key TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " record TEXT NOT NULL,"
+            " child_hash TEXT,"
+            " PRIMARY KEY (state_key, id))"
+        )
+        # child_hash is NULL until child-crawl has stored the product's children with it.
+        if 'child_hash' not in {row[1] for row in self._conn.execute("PRAGMA table_info(products)")}:
+            self._conn.execute("ALTER TABLE products ADD COLUMN child_hash TEXT")
+        self._conn.commit()
+
+    def load(self, state_key: str) -> Dict[str, Tuple[str, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, content_hash, record FROM products WHERE state_key = ?", (state_key,))
+            return {row[0]: (row[1], row[2]) for row in rows}
+
+    def child_hashes(self, state_key: str) -> Dict[str, str]:
+        """The ids stored with their children, and the hash of the child page those came from."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, child_hash FROM products WHERE state_key = ? AND child_hash IS NOT NULL", (state_key,))
+            return dict(rows.fetchall())
+
+    def start_run(self, state_key: str) -> 'IncrementalRun':
+        return IncrementalRun(self, state_key, self.load(state_key))
+
+    def save(self, state_key: str, rows: List[Tuple[str, str, str]], removed_ids: List[str]):
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO products (state_key, id, content_hash, record) VALUES (?, ?, ?, ?)",
+                    [(state_key, product_id, digest, record) for product_id, digest, record in rows])
+                self._conn.executemany(
+                    "DELETE FROM products WHERE state_key = ? AND id = ?",
+                    [(state_key, product_id) for product_id in removed_ids])
+
+    def save_children(self, state_key: str, rows: List[Tuple[Product, str]]):
+        """Stores products with their children and the ``children_hash`` of their child page, keeping their content
+        hash, so the next run reuses them children included. A product saved again by ``save`` loses both."""
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE products SET record = ?, child_hash = ? WHERE state_key = ? AND id = ?",
+                    [(json.dumps(product.to_dict(), ensure_ascii=False), digest, state_key, product.id)
+                     for product, digest in rows])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IncrementalRun:
+    """Tracks one timeframe scrape against the stored state of the previous run.
+
+    ``reuse`` returns the stored normalized record when a raw product is
+    unchanged; everything else is passed to ``record`` once normalized.
+    ``finish`` persists the new state and returns the delta.
+    """
+
+    def __init__(self, store: ProductStateStore, state_key: str, previous: Dict[str, Tuple[str, str]]):
+        self.store = store
+        self.state_key = state_key
+        self.previous = previous
+        self._hashes = {}
+        self._seen = set()
+        self._rows = []
+        self.added = []
+        self.price_changed = []
+        self.unchanged = 0
+
+    def reuse(self, raw: RawProduct) -> Optional[Product]:
+        product_id = raw.id
+        digest = content_hash(raw.to_dict())
+        self._hashes[product_id] = digest
+        self._seen.add(product_id)
+        stored = self.previous.get(product_id)
+        if stored and stored[0] == digest:
+            self.unchanged += 1
+            return Product.from_dict(json.loads(stored[1]))
+        return None
+
+    def record(self, product: Product):
+        record = product.to_dict()
+        product_id = record['id']
+        self._seen.add(product_id)
+        self._rows.append((product_id, self._hashes[product_id], json.dumps(record, ensure_ascii=False)))
+        stored = self.previous.get(product_id)
+        if stored is None:
+            self.added.append(record)
+            return
+        old = json.loads(stored[1])
+        if (old.get('price_now'), old.get('price_was')) != (record.get('price_now'), record.get('price_was')):
+            self.price_changed.append({
+                **record,
+                "previous_price_now": old.get('price_now'),
+                "previous_price_was": old.get('price_was'),
+            })
+
+    def finish(self) -> Dict[str, Any]:
+        removed_ids = [product_id for product_id in self.previous if product_id not in self._seen]
+        removed = [json.loads(self.previous[product_id][1]) for product_id in removed_ids]
+        self.store.save(self.state_key, self._rows, removed_ids)
+        return {
+            "added": self.added,
+            "removed": removed,
+            "price_changed": self.price_changed,
+        }
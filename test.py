@@ -3,7 +3,7 @@ import json
 import re
 import os
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Optional, List, Set, Tuple
 from urllib.parse import urljoin
 import logging
 import requests 
@@ -12,8 +12,20 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from bs4 import BeautifulSoup, Tag
 import concurrent.futures
+from collections import defaultdict
+from functools import partial
+from price_parser import parse_price
+from state_store import ProductStateStore, state_key_for
+from http_cache import ResponseCache, CacheMiss
+from http_session import build_session, log_connection_stats
+from child_crawler import AsyncChildCrawler, ChildFrontier
+from pipeline import ParsePipeline, parse_child_html
+from html_backends import extract_products
+from metrics import METRICS
+from models import Product, RawProduct, to_json
+import profiling
+import argparse
 
 CONFIG = {
     "base_url": "https://www.hoogvliet.com/",
@@ -22,6 +34,21 @@ CONFIG = {
     "timeout": 20,
     "max_child_workers": 2,
     "child_request_delay": 1,
+    "child_engine": "asyncio",
+    "child_rate": 2.0,
+    "child_burst": 4,
+    "child_concurrency": 100,
+    "child_parse_workers": os.cpu_count() or 2,
+    "child_parse_queue_size": 64,
+    "html_backend": "auto",
+    # Not scraper.py's state: a record stored there has no children until child-crawl adds them, and would be reused here as it is.
+    "state_db": "output/state_children.sqlite3",
+    "http_cache_path": "output/http_cache.sqlite3",
+    "http_cache_ttl": 6 * 3600,
+    "http_cache_max_bytes": 200 * 1024 * 1024,
+    "http_cache_mode": "normal",
+    "metrics_report": "output/run_report.json",
+    "metrics_textfile": "output/hoogvliet_scraper.prom",
     "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
 
@@ -121,9 +148,9 @@ class HoogvlietScraper:
             product_data['child_page_url'] = parent_link_elem.get_attribute('href')
         except NoSuchElementException:
             pass
-        return product_data
+        return RawProduct(**product_data)
 
-    def scrape_page(self, url: str, max_scrolls: int = 50) -> Tuple[List[Dict[str, Any]], List[Dict]]:
+    def scrape_page(self, url: str, max_scrolls: int = 50) -> Tuple[List[RawProduct], List[Dict]]:
         self.driver = self.start_driver()
         products_on_page = []
         cookies = []
@@ -146,7 +173,7 @@ class HoogvlietScraper:
             for element in product_elements:
                 product_info = self.extract_product_info(element)
                 
-                if product_info and product_info.get('id'):
+                if product_info.id:
                     products_on_page.append(product_info)
 
             logging.info(f"Successfully scraped {len(products_on_page)} raw products from {url}")
@@ -168,22 +195,7 @@ class DataNormalizer:
         return re.sub(r'\s+', ' ', text).strip()
 
     def _normalize_price(self, raw_price: Optional[str]) -> Optional[str]:
-        if not raw_price: return None
-        soup = BeautifulSoup(raw_price, 'html.parser')
-        euros_elem = soup.select_one('.price-euros span')
-        cents_elem = soup.select_one('.price-cents sup')
-        if euros_elem and cents_elem:
-            euros = self._normalize_text(euros_elem.text)
-            cents = self._normalize_text(cents_elem.text)
-            return f"{euros}.{cents}"
-        price_value_elem = soup.select_one('.kor-product-sale-price-value')
-        if price_value_elem:
-             cleaned_text = self._normalize_text(price_value_elem.text).replace(',', '.')
-             match = re.search(r'(\d+\.\d{2})', cleaned_text)
-             return match.group(1) if match else None
-        cleaned_text = self._normalize_text(soup.text).replace(',', '.')
-        match = re.search(r'(\d+\.\d{2})', cleaned_text)
-        return match.group(1) if match else None
+        return parse_price(raw_price)
 
     def _parse_date_range(self, date_str: str) -> Tuple[Optional[str], Optional[str]]:
         month_map = {'januari': 1, 'februari': 2, 'maart': 3, 'april': 4, 'mei': 5, 'juni': 6, 'juli': 7, 'augustus': 8, 'september': 9, 'oktober': 10, 'november': 11, 'december': 12}
@@ -201,23 +213,23 @@ class DataNormalizer:
         except Exception:
             return None, None
 
-    def process(self, raw_products: List[Dict], timeframe_info: Dict) -> List[Dict]:
+    def process(self, raw_products: List[RawProduct], timeframe_info: Dict) -> List[Product]:
         normalized_list = []
         for raw in raw_products:
-            record = {
-                "id": raw.get('id'),
-                "title": self._normalize_text(raw.get('name')),
-                "description": self._normalize_text(raw.get('description')),
-                "promotion": self._normalize_text(raw.get('promotion')),
-                "price_now": self._normalize_price(raw.get('price_now_raw')),
-                "price_was": self._normalize_price(raw.get('price_was_raw')),
-                "image_url": urljoin(self.base_url, raw.get('image_url')) if raw.get('image_url') else None,
-                "source_url": urljoin(self.base_url, raw.get('source_url')) if raw.get('source_url') else None,
-                "child_page_url": urljoin(self.base_url, raw.get('child_page_url')) if raw.get('child_page_url') else None,
-                "start_date": timeframe_info.get('start_date'),
-                "end_date": timeframe_info.get('end_date'),
-                "child_products": []
-            }
+            record = Product(
+                id=raw.id,
+                brand=self._normalize_text(raw.brand),
+                title=self._normalize_text(raw.name),
+                description=self._normalize_text(raw.description),
+                promotion=self._normalize_text(raw.promotion),
+                price_now=self._normalize_price(raw.price_now_raw),
+                price_was=self._normalize_price(raw.price_was_raw),
+                image_url=urljoin(self.base_url, raw.image_url) if raw.image_url else None,
+                source_url=urljoin(self.base_url, raw.source_url) if raw.source_url else None,
+                child_page_url=urljoin(self.base_url, raw.child_page_url) if raw.child_page_url else None,
+                start_date=timeframe_info.get('start_date'),
+                end_date=timeframe_info.get('end_date'),
+            )
             normalized_list.append(record)
         return normalized_list
 
@@ -251,119 +263,190 @@ def get_timeframe_urls(initial_url: str) -> Dict[str, Dict]:
         if driver:
             driver.quit()
 
-def extract_product_info_from_soup(product_element: Tag) -> Dict:
-    product_data = {}
-    try:
-        track_click_attr = product_element.get('data-track-click')
-        if track_click_attr:
-            track_data = json.loads(track_click_attr)
-            product_info = track_data.get('products', [{}])[0]
-            product_data['id'] = product_info.get('id')
-            product_data['brand'] = product_info.get('brand')
-    except (json.JSONDecodeError, IndexError, KeyError):
-        product_data['id'], product_data['brand'] = None, None
-    name_elem = product_element.select_one('.product-title h3')
-    product_data['name'] = name_elem.text.strip() if name_elem else 'N/A'
-    price_now_elem = product_element.select_one('.non-strikethrough')
-    price_was_elem = product_element.select_one('.strikethrough')
-    if price_was_elem:
-        product_data['price_now_raw'] = str(price_now_elem) if price_now_elem else None
-        product_data['price_was_raw'] = str(price_was_elem)
-    else:
-        standard_price_container = product_element.select_one('.kor-product-sale-price')
-        product_data['price_now_raw'] = str(standard_price_container) if standard_price_container else None
-        product_data['price_was_raw'] = None
-    promo_elem = product_element.select_one('.promotion-short-title')
-    product_data['promotion'] = promo_elem.text.strip() if promo_elem else None
-    img_elem = product_element.select_one('img.product-image')
-    product_data['image_url'] = img_elem.get('src') if img_elem else 'N/A'
-    link_elem = product_element.select_one('a.product-title, .product-image-container a')
-    product_data['source_url'] = link_elem.get('href') if link_elem else 'N/A'
-    desc_elem = product_element.select_one('.Short-Description')
-    product_data['description'] = desc_elem.text.strip() if desc_elem else None
-    parent_link_elem = product_element.select_one('.promotion-btn a.btn')
-    product_data['child_page_url'] = parent_link_elem.get('href') if parent_link_elem else None
-    return product_data
-
-def scrape_child_page_worker(child_url: str, parent_info: Dict, cookies: List[Dict]) -> List[Dict]:
-    try:
-        time.sleep(CONFIG['child_request_delay'])
-        
-        session = requests.Session()
-        session.headers.update({"User-Agent": CONFIG['user_agent']})
-        for cookie in cookies:
-            session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'])
-
-        logging.info(f"Loading page via Requests: {child_url}")
+def parse_child_page(child_url: str, html: str) -> List[RawProduct]:
+    products = extract_products(html, CONFIG['html_backend'])
+    if not products:
+        logging.warning(f"No product items found on child page: {child_url}")
+    return products
+
+def fetch_child_html(child_url: str, scope: str, session: requests.Session, cache: Optional[ResponseCache] = None) -> str:
+    logging.info(f"Loading page via Requests: {child_url}")
+    if cache:
+        with METRICS.timer('child_fetch', engine='threads', cache='on'):
+            return cache.fetch(session, child_url, scope, timeout=CONFIG['timeout'],
+                               before_request=lambda: time.sleep(CONFIG['child_request_delay']))
+    time.sleep(CONFIG['child_request_delay'])
+    with METRICS.timer('child_fetch', engine='threads', cache='off'):
         response = session.get(child_url, timeout=CONFIG['timeout'])
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.text, 'html.parser')
-        product_elements = soup.select('.product-list-item')
-
-        if not product_elements:
-            logging.warning(f"No product items found on child page: {child_url}")
+    response.raise_for_status()
+    METRICS.inc('bytes_downloaded', len(response.content), engine='threads')
+    return response.text
+
+@profiling.profiled('child_fetch')
+def scrape_child_page_worker(child_url: str, scope: str, session: requests.Session, cache: Optional[ResponseCache] = None,
+                             emit=None) -> Optional[List[RawProduct]]:
+    """The products of a child page, or None when it could not be fetched."""
+    try:
+        html = fetch_child_html(child_url, scope, session, cache)
+        if emit:
+            emit(child_url, html)
             return []
-        
-        raw_products = [extract_product_info_from_soup(elem) for elem in product_elements]
-        
-        normalizer = DataNormalizer(CONFIG['base_url'])
-        timeframe_info = {
-            "start_date": parent_info.get('start_date'),
-            "end_date": parent_info.get('end_date')
-        }
-        normalized_children = normalizer.process(raw_products, timeframe_info)
-        return normalized_children
+        return parse_child_page(child_url, html)
+    except CacheMiss:
+        logging.warning(f"Child URL {child_url} is not in the HTTP cache. Skipping in replay mode.")
+        return None
     except requests.exceptions.RequestException as e:
         logging.error(f"Worker for child URL {child_url} failed with a network error: {e}")
-        return []
+        return None
     except Exception as e:
         logging.error(f"Worker for child URL {child_url} failed with an unexpected error: {e}", exc_info=True)
-        return []
-
-def scrape_child_urls(normalized_products: List[Dict], cookies: List[Dict]) -> List[Dict]:
-    products_with_children = {
-        prod['id']: prod for prod in normalized_products if prod.get('child_page_url')
-    }
+        return None
 
-    if not products_with_children:
-        logging.info("No child URLs found to scrape.")
-        return normalized_products
-
-    logging.info(f"Found {len(products_with_children)} parent products with child URLs. Starting concurrent scraping.")
+def fetch_child_pages(child_urls: List[str], scope: str, cookies: List[Dict], cache: Optional[ResponseCache] = None) -> Dict[str, List[RawProduct]]:
+    pages = {}
+    session = build_session(cookies, CONFIG['max_child_workers'], user_agent=CONFIG['user_agent'])
     with concurrent.futures.ThreadPoolExecutor(max_workers=CONFIG['max_child_workers']) as executor:
-        future_to_parent_id = {
-            executor.submit(scrape_child_page_worker, parent['child_page_url'], parent, cookies): parent_id
-            for parent_id, parent in products_with_children.items()
-        }
-
-        for future in concurrent.futures.as_completed(future_to_parent_id):
-            parent_id = future_to_parent_id[future]
+        future_to_url = {executor.submit(scrape_child_page_worker, url, scope, session, cache): url for url in child_urls}
+        for future in concurrent.futures.as_completed(future_to_url):
+            url = future_to_url[future]
             try:
-                child_products_data = future.result()
-                if child_products_data:
-                    for parent_product in normalized_products:
-                        if parent_product['id'] == parent_id:
-                            parent_product['child_products'].extend(child_products_data)
-                            logging.info(f"Added {len(child_products_data)} child products to parent ID {parent_id}.")
-                            break
+                products = future.result()
+                if products is not None:
+                    pages[url] = products
             except Exception as exc:
-                logging.error(f"Child page future for parent ID {parent_id} generated an exception: {exc}")
+                logging.error(f"Child page future for {url} generated an exception: {exc}")
+    log_connection_stats(session)
+    session.close()
+    return pages
+
+def fetch_child_pages_async(child_urls: List[str], scope: str, cookies: List[Dict], cache: Optional[ResponseCache] = None) -> Dict[str, List[RawProduct]]:
+    crawler = AsyncChildCrawler(rate=CONFIG['child_rate'], burst=CONFIG['child_burst'],
+                                concurrency=CONFIG['child_concurrency'], cookies=cookies,
+                                user_agent=CONFIG['user_agent'], timeout=CONFIG['timeout'], cache=cache)
+    with profiling.stage('child_fetch'):
+        html_pages = crawler.run(child_urls, scope)
+    crawler.log_stats()
+
+    pages = {}
+    for url, html in html_pages.items():
+        if not isinstance(html, str):
+            continue
+        try:
+            pages[url] = parse_child_page(url, html)
+        except Exception as exc:
+            logging.error(f"Parsing child page {url} failed: {exc}", exc_info=True)
+    return pages
+
+def fetch_child_pages_pipelined(child_urls: List[str], scope: str, cookies: List[Dict], cache: Optional[ResponseCache] = None) -> Dict[str, List[RawProduct]]:
+    pipeline = ParsePipeline(partial(parse_child_html, backend=CONFIG['html_backend']), workers=CONFIG['child_parse_workers'], queue_size=CONFIG['child_parse_queue_size'])
+
+    if CONFIG['child_engine'] == 'asyncio':
+        crawler = AsyncChildCrawler(rate=CONFIG['child_rate'], burst=CONFIG['child_burst'],
+                                    concurrency=CONFIG['child_concurrency'], cookies=cookies,
+                                    user_agent=CONFIG['user_agent'], timeout=CONFIG['timeout'], cache=cache)
+        pages = pipeline.run(lambda emit: crawler.run(child_urls, scope, on_page=emit))
+        crawler.log_stats()
+    else:
+        session = build_session(cookies, CONFIG['max_child_workers'], user_agent=CONFIG['user_agent'])
+
+        def produce(emit):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=CONFIG['max_child_workers']) as executor:
+                for url in child_urls:
+                    executor.submit(scrape_child_page_worker, url, scope, session, cache, emit)
+
+        pages = pipeline.run(produce)
+        log_connection_stats(session)
+        session.close()
+    pipeline.log_stats()
+    return pages
+
+def scrape_child_urls(normalized_products: List[Product], cookies: List[Dict], cache: Optional[ResponseCache] = None,
+                      frontier: Optional[ChildFrontier] = None) -> Tuple[List[Product], Set[str]]:
+    """Adds the child page products to their parents; also returns the child URLs that could not be fetched."""
+    parents_by_url = defaultdict(list)
+    for prod in normalized_products:
+        if prod.child_page_url:
+            parents_by_url[prod.child_page_url].append(prod)
+
+    if not parents_by_url:
+        logging.info("No child URLs found to scrape.")
+        return normalized_products, set()
+
+    frontier = frontier or ChildFrontier()
+    child_urls = frontier.claim({url: len(parents) for url, parents in parents_by_url.items()})
+    logging.info(f"Found {len(parents_by_url)} child URLs for {sum(len(p) for p in parents_by_url.values())} parent products, "
+                 f"{len(child_urls)} not yet fetched this run. Starting concurrent scraping.")
 
-    return normalized_products
+    first_parent = normalized_products[0]
+    scope = f"{first_parent.start_date}/{first_parent.end_date}"
+    pages = {}
+    try:
+        if child_urls and CONFIG['child_parse_workers'] > 0:
+            pages = fetch_child_pages_pipelined(child_urls, scope, cookies, cache)
+        elif child_urls and CONFIG['child_engine'] == 'asyncio':
+            pages = fetch_child_pages_async(child_urls, scope, cookies, cache)
+        elif child_urls:
+            pages = fetch_child_pages(child_urls, scope, cookies, cache)
+    finally:
+        # Always resolve what was claimed, other timeframes may be waiting on it.
+        for url in child_urls:
+            frontier.resolve(url, pages.get(url))
 
-def scrape_and_process_worker(url: str, info: Dict):
+    normalizer = DataNormalizer(CONFIG['base_url'])
+    failed_urls = set()
+    for url, parents in parents_by_url.items():
+        raw_children = frontier.result(url)
+        if raw_children is None:
+            failed_urls.add(url)
+            continue
+        if not raw_children:
+            continue
+        # Parents sharing a child page and timeframe share the normalized children too.
+        children_by_timeframe = {}
+        for parent in parents:
+            timeframe = (parent.start_date, parent.end_date)
+            if timeframe not in children_by_timeframe:
+                timeframe_info = {"start_date": parent.start_date, "end_date": parent.end_date}
+                children_by_timeframe[timeframe] = normalizer.process(raw_children, timeframe_info)
+            parent.child_products.extend(children_by_timeframe[timeframe])
+        logging.info(f"Added {len(raw_children)} child products to {len(parents)} parent(s) from {url}.")
+    if failed_urls:
+        logging.warning(f"{len(failed_urls)} child pages could not be fetched; their parents are written without children.")
+    return normalized_products, failed_urls
+
+@profiling.profiled('timeframe')
+def scrape_and_process_worker(url: str, info: Dict, store: Optional[ProductStateStore] = None, cache: Optional[ResponseCache] = None,
+                              frontier: Optional[ChildFrontier] = None):
     scraper = HoogvlietScraper(headless=CONFIG['headless'])
     raw_data, cookies = scraper.scrape_page(url, max_scrolls=200)
 
     if not raw_data:
         return []
-        
+
+    # Unchanged parents keep their stored record, children included, so they
+    # skip both normalization and the child page fetch.
+    run = store.start_run(state_key_for(info)) if store else None
+    reused_products = []
+    changed_raw = []
+    for raw in raw_data:
+        record = run.reuse(raw) if run else None
+        if record is None:
+            changed_raw.append(raw)
+        else:
+            reused_products.append(record)
+
     normalizer = DataNormalizer(CONFIG['base_url'])
-    normalized_products = normalizer.process(raw_data, info)
+    normalized_products = normalizer.process(changed_raw, info)
     
-    products_with_children = scrape_child_urls(normalized_products, cookies)
-    return products_with_children
+    products_with_children, failed_urls = scrape_child_urls(normalized_products, cookies, cache, frontier)
+    if run:
+        # A parent whose child page failed is not stored, so the next run fetches its children again.
+        for record in products_with_children:
+            if record.child_page_url not in failed_urls:
+                run.record(record)
+        run.finish()
+        logging.info(f"Reused {len(reused_products)} unchanged products, processed {len(products_with_children)} new or changed ones.")
+    return reused_products + products_with_children
 
 
 def main():
@@ -381,8 +464,12 @@ def main():
         return
     total_products_scraped = 0
     error_count = 0
+    store = ProductStateStore(CONFIG['state_db'])
+    cache = ResponseCache(CONFIG['http_cache_path'], ttl=CONFIG['http_cache_ttl'],
+                          max_bytes=CONFIG['http_cache_max_bytes'], mode=CONFIG['http_cache_mode'])
+    frontier = ChildFrontier()
     with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        future_to_key = {executor.submit(scrape_and_process_worker, info['url'], info): key for key, info in urls_to_scrape.items()}
+        future_to_key = {executor.submit(scrape_and_process_worker, info['url'], info, store, cache, frontier): key for key, info in urls_to_scrape.items()}
         
         for future in concurrent.futures.as_completed(future_to_key):
             key = future_to_key[future]
@@ -390,21 +477,42 @@ def main():
                 products = future.result()
                 if products:
                     parent_count = len(products)
-                    child_count = sum(len(p.get('child_products', [])) for p in products)
+                    child_count = sum(len(p.child_products) for p in products)
                     total_products_scraped += (parent_count + child_count)
                     
                     filename = os.path.join(output_dir, f"{key}_offers.json")
                     with open(filename, 'w', encoding='utf-8') as f:
-                        json.dump(products, f, ensure_ascii=False, indent=2)
+                        json.dump(products, f, ensure_ascii=False, indent=2, default=to_json)
                     logging.info(f"Saved {parent_count} parent products (with {child_count} children) to {filename}")
             except Exception as exc:
                 logging.error(f'{key} offers generated an exception: {exc}')
                 error_count += 1
+    store.close()
+    frontier.log_stats()
+    cache.log_stats()
+    cache.close()
     duration = time.time() - start_time
     logging.info(f"\n--- SCRAPING SUMMARY ---")
     logging.info(f"Total products scraped (including children): {total_products_scraped}")
     logging.info(f"Total errors encountered: {error_count}")
     logging.info(f"Total duration: {duration:.2f} seconds")
+    METRICS.finish_run({
+        "started": datetime.fromtimestamp(start_time).isoformat(timespec='seconds'),
+        "duration_seconds": round(duration, 3), "products": total_products_scraped, "errors": error_count,
+        "child_engine": CONFIG['child_engine'],
+    }, CONFIG['metrics_report'], CONFIG['metrics_textfile'])
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape the Hoogvliet offers including child pages.")
+    parser.add_argument('--profile', nargs='?', metavar='DIR', const='',
+                        help="profile the run; writes pstats, collapsed stacks and allocations to DIR "
+                             "(default: output/profile/<timestamp>)")
+    parser.add_argument('--profile-interval', type=float, default=profiling.DEFAULT_INTERVAL,
+                        help="stack sampling interval in seconds")
+    args = parser.parse_args()
+    if args.profile is None:
+        main()
+    else:
+        profile_dir = args.profile or os.path.join('output', 'profile', datetime.now().strftime('%Y%m%d-%H%M%S'))
+        with profiling.session(profile_dir, interval=args.profile_interval):
+            main()
\ No newline at end of file